@@ -3,11 +3,23 @@
 # ----------------------------------------------------------------------------#
 
 from sqlalchemy.types import ARRAY
+from sqlalchemy.exc import SQLAlchemyError
 
-import dateutil.parser
-import babel
-from flask import render_template, request, flash, redirect, url_for
+from flask import render_template, request, flash, redirect, url_for, abort, jsonify, Response, stream_with_context
 from models import app, db, Venue, Artist, Shows
+from queries import venue_areas, venue_details, artist_list, artist_details, shows_page
+from cache import page_cache, invalidate_venue, invalidate_artist, invalidate_show
+from database import pool_metrics
+from profiler import SQLProfiler
+import importer
+import exporter
+import stats
+import deletes
+import edits
+import availability
+import facets
+import search
+from formatting import format_datetime, format_show_times
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -22,8 +34,12 @@ import datetime
 # ----------------------------------------------------------------------------#
 
 moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
+# config.py is loaded by models.py, before the database extension is bound
+page_cache.init_app(app)
+profiler = SQLProfiler(app)
+importer.register_commands(app)
+exporter.register_commands(app)
+stats.register_commands(app)
 
 
 # ----------------------------------------------------------------------------#
@@ -34,16 +50,29 @@ db.init_app(app)
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+# format_datetime lives in formatting.py with the batch helpers the page
+# loaders below use
+app.jinja_env.filters['datetime'] = format_datetime
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def venue_page(venue_id):
+    # venue data with the show times formatted once, before it is cached
+    data = venue_details(venue_id)
+    if data is not None:
+        format_show_times(data['past_shows'] + data['upcoming_shows'])
+    return data
+
+
+def artist_page(artist_id):
+    data = artist_details(artist_id)
+    if data is not None:
+        format_show_times(data['past_shows'] + data['upcoming_shows'])
+    return data
+
+
+def shows_listing(cursor):
+    data, next_cursor = shows_page(cursor)
+    return format_show_times(data), next_cursor
 
 
 # ----------------------------------------------------------------------------#
@@ -60,49 +89,19 @@ def index():
 
 @app.route('/venues')
 def venues():
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-    data = []
-    # query locations by city and state combined
-    locations = db.session.query(Venue.city, Venue.state).distinct(Venue.city, Venue.state)
-
-    # get the venue IDs and names existing for each location filtered by city and status
-    # then add to the data set
-    for location in locations:
-        venue_list = db.session.query(Venue.id, Venue.name).filter(Venue.city == location[0]).filter(
-            Venue.state == location[1])
-        data.append({
-            'city': location[0],
-            'state': location[1],
-            'venues': venue_list
-        })
+    # venues grouped by city and state, num_upcoming_shows is aggregated in
+    # the same query so the page costs one round trip however many areas exist
+    data = page_cache.get_or_set('venues', '', venue_areas)
 
     return render_template('pages/venues.html', areas=data)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+    # case-insensitive partial search on the venue name, best matches first.
     # search for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    data = []
-    count = 0
-    search_term = request.form.get('search_term')
-    # ilike is used for case insensitive search results
-    found_venues = db.session.query(Venue.id, Venue.name).filter(Venue.name.ilike('%' + search_term + '%')).all()
-
-    if found_venues is not None:
-        for venue in found_venues:
-            data.append({
-                'id': venue[0],
-                'name': venue[1]
-            })
-        count = len(found_venues)
-
-    response = {
-        'count': count,
-        'data': data
-    }
+    response = search.search_venues(request.form.get('search_term', ''))
 
     return render_template('pages/search_venues.html', results=response,
                            search_term=request.form.get('search_term', ''))
@@ -111,48 +110,11 @@ def search_venues():
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    # TODO: replace with real venue data from the venues table, using venue_id
-
-    current_date = datetime.datetime.now()
-    # query details of the Venue filtered by passed venue_id
-    venue_details = db.session.query(Venue).get(venue_id)
-    # venue_shows = db.session.query(Shows).filter(Shows.venue_id == venue_id)
-    past_shows = db.session.query(Shows).join(Artist).filter(Shows.venue_id == venue_id,
-                                                             Shows.start_time < current_date).all()
-    upcoming_shows = db.session.query(Shows).join(Artist).filter(Shows.venue_id == venue_id,
-                                                                 Shows.start_time > current_date).all()
+    # the venue, its shows and their artists are loaded in a single query
+    data = page_cache.get_or_set('venue:{}'.format(venue_id), '', lambda: venue_page(venue_id))
 
     # handling empty results
-    if venue_details is not None:
-        data = {
-            'id': venue_details.id,
-            'name': venue_details.name,
-            'genres': venue_details.genres,
-            'city': venue_details.city,
-            'state': venue_details.state,
-            'address': venue_details.address,
-            'phone': venue_details.phone,
-            'website': venue_details.website,
-            'facebook_link': venue_details.facebook_link,
-            'image_link': venue_details.image_link,
-            'seeking_talent': venue_details.seeking_talent,
-            'seeking_description': venue_details.seeking_description,
-            'past_shows': [{
-                'artist_id': show.artist_id,
-                'artist_name': show.artist.name,
-                'artist_image_link': show.artist.image_link,
-                'start_time': str(show.start_time)
-            } for show in past_shows],
-            'upcoming_shows': [{
-                'artist_id': show.artist_id,
-                'artist_name': show.artist.name,
-                'artist_image_link': show.artist.image_link,
-                'start_time': str(show.start_time)
-            } for show in upcoming_shows],
-            'past_shows_count': len(past_shows),
-            'upcoming_shows_count': len(upcoming_shows)
-        }
-    else:
+    if data is None:
         flash('Error! Details on Venue with ID: ' + str(venue_id) + ' is not found.')
         return redirect('/venues')
 
@@ -192,6 +154,7 @@ def create_venue_submission():
         # on successful db insert, flash success
         db.session.add(venue)
         db.session.commit()
+        page_cache.invalidate('venues')
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
         # TODO: on unsuccessful db insert, flash an error instead.
@@ -204,9 +167,31 @@ def create_venue_submission():
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    # TODO: Complete this endpoint for taking a venue_id, and using
+    # deletes the venue and its shows with set-based statements,
+    # see deletes.py. the shows are removed in chunks
+    artist_ids = deletes.delete_venue(venue_id)
+    if artist_ids is None:
+        abort(404)
+    invalidate_venue(venue_id, artist_ids)
+    page_cache.invalidate('artists')
+
+    return jsonify({
+        'success': True,
+        'deleted': venue_id
+    })
+
+
+@app.route('/venues/<int:venue_id>/delete', methods=['POST'])
+def delete_venue_submission(venue_id):
+    # the delete button of the venue page posts a form
+    artist_ids = deletes.delete_venue(venue_id)
+    if artist_ids is None:
+        flash('Error! Venue with ID: ' + str(venue_id) + ' is not found.')
+        return redirect('/venues')
+    invalidate_venue(venue_id, artist_ids)
+    page_cache.invalidate('artists')
 
     flash('Venue has been successfully deleted.')
     return redirect('/')
@@ -216,103 +201,73 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-    # TODO: replace with real data returned from querying the database
-
-    data = []
     # collect IDs and names of all artist from DB
-    all_artists = db.session.query(Artist.id, Artist.name)
-    # add to the data set
-    for artist in all_artists:
-        data.append({
-            'id': artist[0],
-            'name': artist[1]
-        })
+    data = page_cache.get_or_set('artists', '', artist_list)
 
     return render_template('pages/artists.html', artists=data)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-    # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
+    # case-insensitive partial search on the artist name, best matches first.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
+    response = search.search_artists(request.form.get('search_term', ''))
 
-    data = []
-    count = 0
-    search_term = request.form.get('search_term')
-    # ilike is used for case insensitive search results
-    found_artists = db.session.query(Artist.id, Artist.name).filter(Artist.name.like('%' + search_term + '%')).all()
-
-    if found_artists is not None:
-        for artist in found_artists:
-            data.append({
-                'id': artist[0],
-                'name': artist[1]
-            })
-        count = len(found_artists)
-
-    response = {
-        'count': count,
-        'data': data
-    }
     return render_template('pages/search_artists.html', results=response,
                            search_term=request.form.get('search_term', ''))
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    # TODO: replace with real venue data from the venues table, using venue_id
-
-    current_date = datetime.datetime.now()
-    artist_details = db.session.query(Artist).get(artist_id)
-    past_shows = db.session.query(Shows).join(Venue).filter(Shows.artist_id == artist_id,
-                                                            Shows.start_time < current_date).all()
-    upcoming_shows = db.session.query(Shows).join(Venue).filter(Shows.artist_id == artist_id,
-                                                                Shows.start_time > current_date).all()
+    # shows the artist page with the given artist_id
+    # the artist, its shows and their venues are loaded in a single query
+    data = page_cache.get_or_set('artist:{}'.format(artist_id), '', lambda: artist_page(artist_id))
 
     # handle empty results
-    if artist_details is not None:
-        data = {
-            'id': artist_details.id,
-            'name': artist_details.name,
-            'genres': artist_details.genres,
-            'city': artist_details.city,
-            'state': artist_details.state,
-            'phone': artist_details.phone,
-            'website': artist_details.website,
-            'facebook_link': artist_details.facebook_link,
-            'image_link': artist_details.image_link,
-            'seeking_venue': artist_details.seeking_venue,
-            'seeking_description': artist_details.seeking_description,
-            'past_shows': [{
-                'venue_id': show.venue_id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': str(show.start_time)
-            } for show in past_shows],
-            'upcoming_shows': [{
-                'venue_id': show.venue_id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': str(show.start_time)
-            } for show in upcoming_shows],
-            'past_shows_count': len(past_shows),
-            'upcoming_shows_count': len(upcoming_shows)
-        }
-    else:
+    if data is None:
         flash('Error! Details on Artist with ID: ' + str(artist_id) + ' is not found.')
         return redirect('/artists')
 
     return render_template('pages/show_artist.html', artist=data)
 
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    # deletes the artist and its shows like delete_venue
+    venue_ids = deletes.delete_artist(artist_id)
+    if venue_ids is None:
+        abort(404)
+    invalidate_artist(artist_id, venue_ids)
+    page_cache.invalidate('venues')
+
+    return jsonify({
+        'success': True,
+        'deleted': artist_id
+    })
+
+
+@app.route('/artists/<int:artist_id>/delete', methods=['POST'])
+def delete_artist_submission(artist_id):
+    venue_ids = deletes.delete_artist(artist_id)
+    if venue_ids is None:
+        flash('Error! Artist with ID: ' + str(artist_id) + ' is not found.')
+        return redirect('/artists')
+    invalidate_artist(artist_id, venue_ids)
+    page_cache.invalidate('venues')
+
+    flash('Artist has been successfully deleted.')
+    return redirect('/')
+
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     # query existing artist details from DB
     artist_details = db.session.query(Artist).get(artist_id)
+    if artist_details is None:
+        abort(404)
     # pass the artist object to populate the Editing form with current values
     form = ArtistForm(obj=artist_details)
     data = {
@@ -325,27 +280,30 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    # TODO: take values from the form submitted, and update existing
-    # artist record with ID <artist_id> using the new attributes
-    artist_details = db.session.query(Artist).get(artist_id)
-
-    artist_details.name = request.form.get('name')
-    artist_details.city = request.form.get('city')
-    artist_details.state = request.form.get('state')
-    artist_details.phone = request.form.get('phone')
-    artist_details.genres = request.form.getlist('genres')
-    artist_details.website = request.form.get('website')
-    artist_details.facebook_link = request.form.get('facebook_link')
-    artist_details.image_link = request.form.get('image_link')
-    artist_details.seeking_venue = True if request.form.get('seeking') == 'Yes' else False
-    artist_details.seeking_description = request.form.get('seeking_description')
+    # saves only the columns that changed, in one UPDATE guarded by the
+    # version the form was loaded with, see edits.py
+    try:
+        version = int(request.form.get('version', ''))
+    except ValueError:
+        abort(400)
 
+    name = request.form.get('name', '')
     try:
-        db.session.commit()
-    except:
+        changes = edits.update_artist(artist_id, version, edits.form_values('artist', request.form))
+    except edits.EditConflict:
+        flash('Error! Artist ' + name + ' was changed by someone else while you were editing it. '
+              'Please review its current details and save again.')
+        return redirect(url_for('edit_artist', artist_id=artist_id))
+    except SQLAlchemyError:
         db.session.rollback()
-    finally:
-        db.session.close()
+        flash('Error! issue faced while trying to edit ' + name)
+        return redirect(url_for('edit_artist', artist_id=artist_id))
+
+    if changes is None:
+        abort(404)
+    if changes:
+        invalidate_artist(artist_id)
+        flash('Artist ' + name + ' was successfully updated!')
 
     return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -353,6 +311,8 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     venue_details = db.session.query(Venue).get(venue_id)
+    if venue_details is None:
+        abort(404)
     # pass the venue object to populate the Editing form with current values
     form = VenueForm(obj=venue_details)
     data = {
@@ -365,28 +325,30 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    # TODO: take values from the form submitted, and update existing
-    # venue record with ID <venue_id> using the new attributes
-    venue_details = db.session.query(Venue).get(venue_id)
-
-    venue_details.name = request.form.get('name')
-    venue_details.city = request.form.get('city')
-    venue_details.state = request.form.get('state')
-    venue_details.address = request.form.get('address')
-    venue_details.phone = request.form.get('phone')
-    venue_details.genres = request.form.getlist('genres')
-    venue_details.website = request.form.get('website')
-    venue_details.facebook_link = request.form.get('facebook_link')
-    venue_details.image_link = request.form.get('image_link')
-    venue_details.seeking_talent = True if request.form.get('seeking') == 'Yes' else False
-    venue_details.seeking_description = request.form.get('seeking_description')
+    # saves only the columns that changed, in one UPDATE guarded by the
+    # version the form was loaded with, see edits.py
+    try:
+        version = int(request.form.get('version', ''))
+    except ValueError:
+        abort(400)
 
+    name = request.form.get('name', '')
     try:
-        db.session.commit()
-    except:
+        changes = edits.update_venue(venue_id, version, edits.form_values('venue', request.form))
+    except edits.EditConflict:
+        flash('Error! Venue ' + name + ' was changed by someone else while you were editing it. '
+              'Please review its current details and save again.')
+        return redirect(url_for('edit_venue', venue_id=venue_id))
+    except SQLAlchemyError:
         db.session.rollback()
-    finally:
-        db.session.close()
+        flash('Error! issue faced while trying to edit ' + name)
+        return redirect(url_for('edit_venue', venue_id=venue_id))
+
+    if changes is None:
+        abort(404)
+    if changes:
+        invalidate_venue(venue_id)
+        flash('Venue ' + name + ' was successfully updated!')
 
     return redirect(url_for('show_venue', venue_id=venue_id))
 
@@ -425,6 +387,7 @@ def create_artist_submission():
         # on successful db insert, flash success
         db.session.add(artist)
         db.session.commit()
+        page_cache.invalidate('artists')
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except:
         # TODO: on unsuccessful db insert, flash an error instead.
@@ -442,24 +405,15 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
-
-    data = []
-    all_shows = db.session.query(Shows)
-    # add to the data set with usage of relationship backref with Venue and Artist
-    for show in all_shows:
-        data.append({
-            'venue_id': show.venue_id,
-            'venue_name': show.venue.name,
-            'artist_id': show.artist_id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': str(show.start_time)
-        })
-
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one page at a time
+    # the cursor argument comes from the "next" link of the previous page
+    cursor = request.args.get('cursor')
+    try:
+        data, next_cursor = page_cache.get_or_set('shows', cursor or '', lambda: shows_listing(cursor))
+    except ValueError:
+        abort(400)
+
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
 
 @app.route('/shows/create')
@@ -474,15 +428,31 @@ def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
 
-    form = ShowForm(request.form)
+    # the templates render no CSRF token, the fields are validated as in imports
+    form = ShowForm(request.form, meta={'csrf': False})
+    if not form.validate():
+        flash('Error! Show could not be listed.')
+        return render_template('pages/home.html')
+
+    end_time = importer.show_end_time(form)
+    # refuse double bookings, answered from the interval indexes instead of
+    # scanning the shows of the venue and the artist
+    conflicts = availability.booking_conflicts(int(form.venue_id.data), int(form.artist_id.data),
+                                               form.start_time.data, end_time)
+    if conflicts:
+        flash('Error! Show could not be listed: ' + ' and '.join(conflicts) + ' already booked at that time.')
+        return render_template('pages/home.html')
+
     show = Shows(artist_id=form.artist_id.data,
                  venue_id=form.venue_id.data,
-                 start_time=form.start_time.data)
+                 start_time=form.start_time.data,
+                 end_time=end_time)
 
     try:
         # on successful db insert, flash success
         db.session.add(show)
         db.session.commit()
+        invalidate_show(form.venue_id.data, form.artist_id.data)
         flash('Show to be held in ' + request.form['start_time'] + ' is successfully listed!')
     except:
         # TODO: on unsuccessful db insert, flash an error instead.
@@ -495,6 +465,74 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+@app.route('/api/<any(venues, artists):kind>/browse')
+def browse(kind):
+    # faceted browse, e.g. jazz venues in CA seeking talent:
+    # /api/venues/browse?genre=Jazz&state=CA&seeking=true
+    # answered from the in-memory bitmap index in facets.py, each facet comes
+    # with the counts of its values under the other filters
+    page = request.args.get('page', 1, type=int)
+    if page < 1:
+        abort(400)
+
+    result = facets.browse(kind, facets.parse_filters(request.args), page)
+    result['success'] = True
+    result['page'] = page
+    return jsonify(result)
+
+
+@app.route('/venues/free')
+def free_venues():
+    # venues of a city that have no show overlapping the requested time,
+    # e.g. /venues/free?city=San Francisco&state=CA&start_time=2035-04-01T20:00&duration=120
+    city = request.args.get('city')
+    duration = request.args.get('duration', 120, type=int)
+    try:
+        start_time = datetime.datetime.fromisoformat(request.args.get('start_time', ''))
+    except ValueError:
+        abort(400)
+    if not city or duration <= 0:
+        abort(400)
+
+    venues = availability.free_venues(city, start_time, start_time + datetime.timedelta(minutes=duration),
+                                      request.args.get('state'))
+    return jsonify({
+        'success': True,
+        'venues': venues
+    })
+
+
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<kind>.<format>')
+def export_catalog(kind, format):
+    # streams every venue, artist or show as JSON Lines or CSV, the rows are
+    # read through a server-side cursor and sent in chunks as they arrive
+    if kind not in exporter.EXPORTS or format not in exporter.FORMATS:
+        abort(404)
+
+    return Response(stream_with_context(exporter.export_lines(kind, format)),
+                    mimetype=exporter.FORMATS[format],
+                    headers={'Content-Disposition': 'attachment; filename={}.{}'.format(kind, format)})
+
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics/cache')
+def cache_metrics():
+    # hit, miss and eviction counters of the page cache
+    return jsonify(page_cache.stats())
+
+
+@app.route('/metrics/pool')
+def pool_metrics_view():
+    # checkouts, checkout wait time and overflow use of the connection pool,
+    # used to size DATABASE_POOL_SIZE for the number of workers
+    return jsonify(pool_metrics.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,236 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Shows
+
+# venues or artists whose intervals an index keeps, the least recently used
+# are dropped beyond it
+MAX_INTERVAL_KEYS = 10000
+
+
+# ----------------------------------------------------------------------------#
+# In-memory interval index.
+# ----------------------------------------------------------------------------#
+
+class IntervalIndex(object):
+    """Booked (start, end) intervals per venue or artist, for SQLite.
+
+    The intervals of a key are kept sorted by start with the running maximum
+    of their ends, so an overlap check is one bisect even when intervals
+    overlap (nothing prevents that on SQLite). Keys are loaded from Shows on
+    first use, many at once with load(), and dropped again once a change to
+    their shows is committed. Shows booked by other processes (other workers,
+    import-shows) are picked up when a key is reloaded, `ttl` seconds after
+    it was loaded. At most `max_keys` keys are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, column, ttl=60, max_keys=MAX_INTERVAL_KEYS):
+        self.column = column
+        self.ttl = ttl
+        self.max_keys = max_keys
+        # key -> (loaded at, entry), in least recently used order
+        self._keys = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry(intervals):
+        # (starts, running max of the ends) of (start, end) pairs
+        starts = []
+        max_ends = []
+        for start, end in sorted(intervals, key=lambda interval: interval[0]):
+            starts.append(start)
+            max_ends.append(end if not max_ends or end > max_ends[-1] else max_ends[-1])
+        return starts, max_ends
+
+    def _cached(self, key):
+        # the entry of a loaded key, None when it is not loaded or expired
+        with self._lock:
+            item = self._keys.get(key)
+            if item is None:
+                return None
+            if time.monotonic() - item[0] > self.ttl:
+                del self._keys[key]
+                return None
+            self._keys.move_to_end(key)
+            return item[1]
+
+    def _store(self, key, entry):
+        # under self._lock
+        self._keys[key] = (time.monotonic(), entry)
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+    def load(self, keys, condition=None):
+        # loads the intervals of the keys that are not loaded yet in one
+        # query, selecting the shows with `condition` instead of a list of
+        # the keys when given (e.g. a subquery for the venues of a city)
+        keys = [key for key in keys if self._cached(key) is None]
+        if not keys:
+            return
+        if condition is None:
+            condition = self.column.in_(keys)
+        generation = self._generation
+
+        intervals = {key: [] for key in keys}
+        for key, start, end in db.session.query(self.column, Shows.start_time, Shows.end_time).filter(condition):
+            if key in intervals:
+                intervals[key].append((start, end))
+        with self._lock:
+            # keys changed while the query ran are left to the next lookup
+            if generation == self._generation:
+                for key, key_intervals in intervals.items():
+                    self._store(key, self.entry(key_intervals))
+
+    def _intervals(self, key):
+        intervals = self._cached(key)
+        if intervals is None:
+            self.load([key])
+            intervals = self._cached(key)
+            if intervals is None:
+                # changed during the load (or evicted right away), not cached
+                rows = db.session.query(Shows.start_time, Shows.end_time).filter(self.column == key).all()
+                intervals = self.entry(rows)
+        return intervals
+
+    def overlaps(self, key, start, end):
+        # True when [start, end) intersects a booked interval of key: one of
+        # the intervals starting before `end` ends after `start`
+        starts, max_ends = self._intervals(key)
+        position = bisect_left(starts, end)
+        return position > 0 and max_ends[position - 1] > start
+
+    def discard(self, key):
+        with self._lock:
+            self._generation += 1
+            self._keys.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._keys.clear()
+
+
+venue_intervals = IntervalIndex(Shows.venue_id)
+artist_intervals = IntervalIndex(Shows.artist_id)
+
+
+# ----------------------------------------------------------------------------#
+# Index updates.
+#
+# The venue and artist ids of changed shows are queued per session and their
+# keys dropped once the transaction commits, so a concurrent reader cannot
+# cache the shows from before the commit after they were dropped. A rollback
+# drops the queue.
+# ----------------------------------------------------------------------------#
+
+@event.listens_for(Shows, 'after_insert')
+@event.listens_for(Shows, 'after_update')
+@event.listens_for(Shows, 'after_delete')
+def _show_changed(mapper, connection, show):
+    changed = inspect(show).session.info.setdefault('availability_changes', set())
+    changed.add((venue_intervals, show.venue_id))
+    changed.add((artist_intervals, show.artist_id))
+    # the previous venue or artist of a moved show
+    for index, attribute in ((venue_intervals, 'venue_id'), (artist_intervals, 'artist_id')):
+        for key in inspect(show).attrs[attribute].history.deleted:
+            changed.add((index, key))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for index, key in session.info.pop('availability_changes', ()):
+        index.discard(key)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('availability_changes', None)
+
+
+def clear():
+    # after set-based writes to Shows (imports, deletes)
+    venue_intervals.clear()
+    artist_intervals.clear()
+
+
+# ----------------------------------------------------------------------------#
+# Lookups.
+# ----------------------------------------------------------------------------#
+
+def _overlapping(start_time, end_time):
+    # matches shows intersecting [start_time, end_time), the expression of the
+    # exclusion constraints so PostgreSQL can use their GiST indexes
+    return db.func.tsrange(Shows.start_time, Shows.end_time).op('&&')(db.func.tsrange(start_time, end_time))
+
+
+def booking_conflicts(venue_id, artist_id, start_time, end_time):
+    # returns which of 'venue' and 'artist' already have a show overlapping
+    # [start_time, end_time)
+    if db.engine.dialect.name == 'postgresql':
+        conflicts = []
+        for name, column, key in (('venue', Shows.venue_id, venue_id), ('artist', Shows.artist_id, artist_id)):
+            if db.session.query(Shows.id).filter(column == key, _overlapping(start_time, end_time)).first():
+                conflicts.append(name)
+        return conflicts
+
+    conflicts = []
+    if venue_intervals.overlaps(venue_id, start_time, end_time):
+        conflicts.append('venue')
+    if artist_intervals.overlaps(artist_id, start_time, end_time):
+        conflicts.append('artist')
+    return conflicts
+
+
+def free_venues(city, start_time, end_time, state=None):
+    # venues of a city without a show overlapping [start_time, end_time),
+    # found through ix_Venue_city_state and the interval indexes
+    query = db.session.query(Venue.id, Venue.name).filter(Venue.city == city)
+    if state is not None:
+        query = query.filter(Venue.state == state)
+
+    if db.engine.dialect.name == 'postgresql':
+        booked = db.session.query(Shows.id) \
+            .filter(Shows.venue_id == Venue.id, _overlapping(start_time, end_time))
+        rows = query.filter(~booked.exists()).order_by(Venue.id).all()
+    else:
+        rows = query.order_by(Venue.id).all()
+        # the intervals of the city's venues in one query
+        venue_intervals.load([row[0] for row in rows], Shows.venue_id.in_(query.with_entities(Venue.id)))
+        rows = [row for row in rows if not venue_intervals.overlaps(row[0], start_time, end_time)]
+
+    return [{
+        'id': row[0],
+        'name': row[1]
+    } for row in rows]
+
+
+def import_conflicts(rows):
+    # {position: conflicts} of a batch of show values to import, against the
+    # booked shows and the earlier rows of the batch. the intervals of the
+    # batch's venues and artists are loaded with one query per index
+    venue_intervals.load({row['venue_id'] for row in rows})
+    artist_intervals.load({row['artist_id'] for row in rows})
+    accepted = {}
+    conflicts = {}
+    for position, row in enumerate(rows):
+        row_conflicts = []
+        for name, index, key in (('venue', venue_intervals, row['venue_id']),
+                                 ('artist', artist_intervals, row['artist_id'])):
+            booked = any(start < row['end_time'] and end > row['start_time']
+                         for start, end in accepted.get((name, key), ()))
+            if booked or index.overlaps(key, row['start_time'], row['end_time']):
+                row_conflicts.append(name)
+        if row_conflicts:
+            conflicts[position] = row_conflicts
+            continue
+        for name, key in (('venue', row['venue_id']), ('artist', row['artist_id'])):
+            accepted.setdefault((name, key), []).append((row['start_time'], row['end_time']))
+    return conflicts
@@ -0,0 +1,67 @@
+# ----------------------------------------------------------------------------#
+# Benchmark helpers.
+#
+# The benchmarks are run as modules from the starter_code directory, e.g.
+#   python -m benchmarks.search --database-url postgresql://localhost/fyyur_bench
+# and default to a SQLite file next to this package when no URL is given.
+# ----------------------------------------------------------------------------#
+
+import argparse
+import os
+import statistics
+import time
+
+from models import app, db
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.db')
+
+
+def argument_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--database-url', default=os.environ.get('FYYUR_BENCH_DATABASE_URL', DEFAULT_DATABASE_URL),
+                        help='database to seed and query (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case')
+    return parser
+
+
+def setup_database(database_url):
+    # binds the app to the benchmark database and creates the tables
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ECHO'] = False
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def insert_in_batches(table, rows, batch_size=10000):
+    # multi-row inserts of an iterable of dicts, committing once per batch
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+
+
+def measure(function, repeat):
+    # runs function `repeat` times and returns the wall clock samples in ms
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
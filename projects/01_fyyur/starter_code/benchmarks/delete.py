@@ -0,0 +1,81 @@
+# ----------------------------------------------------------------------------#
+# Venue deletion benchmark.
+#
+# Seeds one venue with --shows shows spread over --artists artists, deletes it
+# with the chunked set-based deletes and reports the total time and the
+# longest single chunk transaction, which bounds how long other writers wait.
+#   python -m benchmarks.delete --shows 100000 --database-url postgresql://localhost/fyyur_bench
+# ----------------------------------------------------------------------------#
+
+import datetime
+import json
+import time
+
+from sqlalchemy import event
+
+from benchmarks import argument_parser, setup_database, insert_in_batches, summary
+from deletes import delete_venue, DELETE_CHUNK_SIZE
+from models import db, Venue, Artist, Shows
+import stats
+
+
+def seed(shows, artists):
+    venue = Venue(name='Doomed Venue', city='San Francisco', state='CA', address='1015 Folsom Street')
+    db.session.add(venue)
+    insert_in_batches(Artist.__table__, ({
+        'name': 'Artist {}'.format(number), 'city': 'San Francisco', 'state': 'CA',
+    } for number in range(artists)))
+    artist_ids = [row[0] for row in db.session.query(Artist.id)]
+    start = datetime.datetime(2020, 1, 1)
+    venue_id = venue.id
+    insert_in_batches(Shows.__table__, ({
+        'venue_id': venue_id, 'artist_id': artist_ids[number % len(artist_ids)],
+        'start_time': start + datetime.timedelta(hours=3 * number),
+    } for number in range(shows)))
+    stats.refresh(venue_ids=None, artist_ids=None)
+    db.session.commit()
+    return venue_id
+
+
+def main():
+    parser = argument_parser('Measure deleting a venue with many shows.')
+    parser.add_argument('--shows', type=int, default=100000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=DELETE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        venue_id = seed(args.shows, args.artists)
+
+        # each commit ends one chunk transaction
+        commits = []
+        last = [time.perf_counter()]
+
+        def on_commit(connection):
+            now = time.perf_counter()
+            commits.append((now - last[0]) * 1000)
+            last[0] = now
+
+        event.listen(db.engine, 'commit', on_commit)
+        start = time.perf_counter()
+        delete_venue(venue_id, chunk_size=args.chunk_size)
+        seconds = time.perf_counter() - start
+        event.remove(db.engine, 'commit', on_commit)
+
+        results = {
+            'dialect': db.engine.dialect.name,
+            'shows': args.shows,
+            'chunk_size': args.chunk_size,
+            'seconds': round(seconds, 3),
+            'shows_per_sec': round(args.shows / seconds) if seconds else None,
+            'transactions': len(commits),
+            'transaction': summary(commits),
+            'remaining_shows': db.session.query(Shows.id).filter(Shows.venue_id == venue_id).count(),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
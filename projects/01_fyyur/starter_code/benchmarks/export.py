@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------#
+# Catalog export benchmark.
+#
+# Seeds venues, artists and shows and streams each export, reporting rows per
+# second and the peak Python memory used while exporting. Peak memory should
+# stay flat when --shows grows.
+#   python -m benchmarks.export --shows 1000000 --database-url postgresql://localhost/fyyur_bench
+# ----------------------------------------------------------------------------#
+
+import datetime
+import json
+import random
+import time
+import tracemalloc
+
+from benchmarks import argument_parser, setup_database, insert_in_batches
+from exporter import export_lines, stream_rows
+from models import db, Venue, Artist, Shows
+
+
+def seed(venues, artists, shows, seed=2021):
+    generator = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    insert_in_batches(Venue.__table__, ({
+        'name': 'Venue {}'.format(number), 'city': 'City {}'.format(number % 500), 'state': 'CA',
+        'address': '{} Folsom Street'.format(number), 'genres': ['Jazz', 'Blues'],
+    } for number in range(venues)))
+    insert_in_batches(Artist.__table__, ({
+        'name': 'Artist {}'.format(number), 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz'],
+    } for number in range(artists)))
+    venue_ids = [row[0] for row in db.session.query(Venue.id)]
+    artist_ids = [row[0] for row in db.session.query(Artist.id)]
+    generator.shuffle(venue_ids)
+    generator.shuffle(artist_ids)
+    # a venue and an artist play at most once per three hour slot, so the
+    # shows do not violate the booking constraints on PostgreSQL
+    per_slot = min(len(venue_ids), len(artist_ids))
+    insert_in_batches(Shows.__table__, ({
+        'venue_id': venue_ids[number % len(venue_ids)], 'artist_id': artist_ids[number % len(artist_ids)],
+        'start_time': start + datetime.timedelta(hours=3 * (number // per_slot)),
+    } for number in range(shows)))
+
+
+def run(kind, export_format):
+    # consumes the export like the HTTP response would, returns (rows, bytes, seconds)
+    rows = sum(1 for _ in stream_rows(kind))
+    size = 0
+    start = time.perf_counter()
+    for chunk in export_lines(kind, export_format):
+        size += len(chunk)
+    return rows, size, time.perf_counter() - start
+
+
+def peak_memory(kind, export_format):
+    tracemalloc.start()
+    for _ in export_lines(kind, export_format):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argument_parser('Measure the throughput and memory of the streaming catalog export.')
+    parser.add_argument('--venues', type=int, default=10000)
+    parser.add_argument('--artists', type=int, default=50000)
+    parser.add_argument('--shows', type=int, default=500000)
+    parser.add_argument('--format', dest='export_format', choices=['jsonl', 'csv'], default='jsonl')
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        if not db.session.query(Shows.id).first():
+            seed(args.venues, args.artists, args.shows)
+
+        results = {'dialect': db.engine.dialect.name, 'format': args.export_format, 'exports': {}}
+        for kind in ('venues', 'artists', 'shows'):
+            rows, size, seconds = run(kind, args.export_format)
+            results['exports'][kind] = {
+                'rows': rows,
+                'megabytes': round(size / 1e6, 2),
+                'seconds': round(seconds, 3),
+                'rows_per_sec': round(rows / seconds) if seconds else None,
+                'peak_memory_kb': round(peak_memory(kind, args.export_format) / 1024),
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# ----------------------------------------------------------------------------#
+# Faceted browse benchmark.
+#
+# Seeds --venues venues with random genres, cities, states and seeking
+# flags, loads the bitmap index once and times facet queries with their
+# per-facet counts, from no filter to four combined facets.
+#   python -m benchmarks.facets --venues 1000000 --database-url postgresql://localhost/fyyur_bench
+# ----------------------------------------------------------------------------#
+
+import json
+import random
+import time
+
+from benchmarks import argument_parser, setup_database, insert_in_batches, measure, summary
+from facets import indexes
+from forms import genres_choices, state_choices
+from models import db, Venue
+
+GENRES = [choice[0] for choice in genres_choices]
+STATES = [choice[0] for choice in state_choices]
+
+QUERIES = {
+    'no_filter': {},
+    'genre': {'genre': ['Jazz']},
+    'jazz_in_ca_seeking': {'genre': ['Jazz'], 'state': ['CA'], 'seeking': [True]},
+    'two_genres_in_city': {'genre': ['Jazz', 'Blues'], 'city': ['City 7'], 'seeking': [False]},
+    'four_facets': {'genre': ['Jazz'], 'city': ['City 7', 'City 8'], 'state': ['CA'], 'seeking': [True]},
+}
+
+
+def seed(venues, cities, seed=2021):
+    generator = random.Random(seed)
+    insert_in_batches(Venue.__table__, ({
+        'name': 'Venue {}'.format(number), 'city': 'City {}'.format(generator.randrange(cities)),
+        'state': generator.choice(STATES), 'address': '{} Folsom Street'.format(number),
+        'genres': generator.sample(GENRES, generator.randint(1, 3)),
+        'seeking_talent': generator.random() < 0.3,
+    } for number in range(venues)))
+
+
+def main():
+    parser = argument_parser('Measure faceted browse queries on the in-memory bitmap index.')
+    parser.add_argument('--venues', type=int, default=1000000)
+    parser.add_argument('--cities', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        if not db.session.query(Venue.id).first():
+            seed(args.venues, args.cities)
+
+        index = indexes['venues']
+        start = time.perf_counter()
+        index.load()
+        results = {
+            'dialect': db.engine.dialect.name,
+            'venues': len(index.ids),
+            'load_seconds': round(time.perf_counter() - start, 3),
+            'queries': {},
+        }
+        for name, filters in QUERIES.items():
+            timings = summary(measure(lambda: index.browse(filters), args.repeat))
+            timings['total'] = index.browse(filters)[1]
+            results['queries'][name] = timings
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
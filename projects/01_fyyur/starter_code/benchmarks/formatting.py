@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------------#
+# Show time formatting micro-benchmark.
+#
+# Formats the start times of a page of --shows shows three ways and reports
+# the per-row cost: the old filter (str() in the view, dateutil parse and a
+# Babel pattern lookup per row), the filter on native datetimes with the
+# cached formatter, and the batch helper the page loaders use.
+# No database is needed.
+#   python -m benchmarks.formatting --shows 10000
+# ----------------------------------------------------------------------------#
+
+import argparse
+import datetime
+import json
+import random
+
+import babel.dates
+import dateutil.parser
+
+from benchmarks import measure, summary
+from formatting import format_datetime, format_show_times, DATETIME_FORMATS
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was before formatting.py
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS.get(format, format))
+
+
+def make_shows(count, seed=2021):
+    # shows start on the hour, so a page repeats some start times
+    generator = random.Random(seed)
+    start = datetime.datetime(2035, 1, 1, 20)
+    return [{'start_time': start + datetime.timedelta(hours=generator.randrange(24 * 365))}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure formatting the show times of one page.')
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per case')
+    args = parser.parse_args()
+
+    shows = make_shows(args.shows)
+    as_strings = [str(show['start_time']) for show in shows]
+
+    cases = {
+        'legacy_filter': lambda: [legacy_format_datetime(value, 'full') for value in as_strings],
+        'cached_filter': lambda: [format_datetime(show['start_time'], 'full') for show in shows],
+        'batch': lambda: format_show_times(shows),
+    }
+    results = {'shows': args.shows, 'cases': {}}
+    for name, function in cases.items():
+        timings = summary(measure(function, args.repeat))
+        timings['per_row_us'] = round(timings['median_ms'] * 1000 / args.shows, 2)
+        results['cases'][name] = timings
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# ----------------------------------------------------------------------------#
+# Artist search benchmark.
+#
+# Seeds the Artist table up to --rows rows and compares the ranked search in
+# search.py against the previous unbounded ilike('%term%') query. The legacy
+# query is timed first, with the trigram index dropped as it was before the
+# search subsystem, then the index is rebuilt for the ranked search.
+#   python -m benchmarks.search --rows 1000000 --database-url postgresql://localhost/fyyur_bench
+# ----------------------------------------------------------------------------#
+
+import json
+import random
+
+from benchmarks import argument_parser, setup_database, insert_in_batches, measure, summary
+from models import db, Artist
+from search import search_artists
+
+FIRST_WORDS = ['The', 'Wild', 'Electric', 'Blue', 'Midnight', 'Golden', 'Silent', 'Velvet', 'Crimson', 'Lucky']
+SECOND_WORDS = ['Sax', 'Petals', 'Riders', 'Owls', 'Echoes', 'Strings', 'Drums', 'Foxes', 'Lights', 'Kings']
+LAST_WORDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Club', 'Ensemble']
+
+SEARCH_TERMS = ['band', 'velvet owls', 'Quartet', 'xyz']
+
+
+def artist_rows(count, seed=2021):
+    generator = random.Random(seed)
+    for number in range(count):
+        yield {
+            'name': '{} {} {} {}'.format(generator.choice(FIRST_WORDS), generator.choice(SECOND_WORDS),
+                                         generator.choice(LAST_WORDS), number),
+            'city': 'San Francisco',
+            'state': 'CA',
+            'genres': ['Jazz'],
+        }
+
+
+def legacy_search(term):
+    # the query search_artists used before the search subsystem
+    return db.session.query(Artist.id, Artist.name).filter(Artist.name.ilike('%' + term + '%')).all()
+
+
+def trigram_index():
+    return next(index for index in Artist.__table__.indexes if index.name == 'ix_Artist_name_trgm')
+
+
+def main():
+    parser = argument_parser('Compare the ranked artist search with the legacy ilike query.')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of artists to seed')
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        existing = db.session.query(db.func.count(Artist.id)).scalar()
+        if existing < args.rows:
+            insert_in_batches(Artist.__table__, artist_rows(args.rows - existing))
+
+        results = {'rows': args.rows, 'dialect': db.engine.dialect.name, 'terms': {}}
+        index = trigram_index()
+        db.session.commit()
+        index.drop(db.engine)
+        try:
+            for term in SEARCH_TERMS:
+                results['terms'][term] = {'ilike': summary(measure(lambda: legacy_search(term), args.repeat))}
+        finally:
+            index.create(db.engine)
+        for term in SEARCH_TERMS:
+            results['terms'][term]['search'] = summary(measure(lambda: search_artists(term), args.repeat))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
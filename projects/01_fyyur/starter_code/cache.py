@@ -0,0 +1,238 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from models import db, Shows
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class CacheBackend(object):
+    """Storage interface used by PageCache.
+
+    Values are only read back through get(); a backend may keep them as they
+    are or serialize them. delete_prefix() must remove every key starting
+    with the prefix, it is used to drop all cached pages of a namespace.
+    get() counts its hits and misses, which PageCache reports.
+    """
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return 0
+
+
+class LRUBackend(CacheBackend):
+    """In-process backend bounded by max_entries, evicting the least recently used"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # the counters are updated under the lock of the lookup so concurrent
+        # requests do not lose increments
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(CacheBackend):
+    """Backend for a Redis client or anything exposing the same commands.
+
+    Only get, set (with px), delete and scan_iter are used, so a local
+    stand-in can be passed as the client. Expiry and memory eviction are left
+    to the server, which does not report them per key.
+    """
+
+    def __init__(self, client, key_prefix='fyyur:'):
+        self.client = client
+        self.key_prefix = key_prefix
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.client.get(self.key_prefix + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.key_prefix + key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=self.key_prefix + prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.key_prefix + '*'))
+
+
+# ----------------------------------------------------------------------------#
+# Page cache.
+# ----------------------------------------------------------------------------#
+
+class PageCache(object):
+    """Read-through cache of the data the views render.
+
+    Entries are grouped in namespaces such as 'venues' or 'venue:3' and keyed
+    by the view arguments inside them, invalidate() drops whole namespaces.
+    Cached values are shared between requests and must not be mutated.
+
+    invalidate() and clear() only reach the processes sharing the backend.
+    With LRUBackend that is the calling process alone, so writes made from
+    the CLI or another worker show up once the entries expire, after at most
+    `ttl` seconds. RedisBackend is shared by every process.
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend if backend is not None else LRUBackend()
+        self.ttl = ttl
+        self.enabled = True
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'lru')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_TTL', 60)
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+        self.ttl = app.config['CACHE_TTL']
+        backend = app.config['CACHE_BACKEND']
+        if backend == 'redis':
+            import redis
+            self.backend = RedisBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+        elif backend == 'lru':
+            self.backend = LRUBackend(app.config['CACHE_MAX_ENTRIES'])
+        elif backend == 'null':
+            self.enabled = False
+        else:
+            raise ValueError('unknown CACHE_BACKEND: ' + backend)
+
+    @staticmethod
+    def _key(namespace, args):
+        return '{}|{}'.format(namespace, args)
+
+    def get_or_set(self, namespace, args, loader):
+        # returns the cached value or calls loader() and caches its result,
+        # None results (e.g. a missing venue) are not cached
+        if not self.enabled:
+            return loader()
+
+        key = self._key(namespace, args)
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+
+        value = loader()
+        if value is not None:
+            self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, *namespaces):
+        if not self.enabled:
+            return
+        for namespace in namespaces:
+            self.backend.delete_prefix(namespace + '|')
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__ if self.enabled else None,
+            'entries': len(self.backend) if self.enabled else 0,
+            'hits': self.backend.hits,
+            'misses': self.backend.misses,
+            'evictions': self.backend.evictions,
+        }
+
+
+page_cache = PageCache()
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+
+def invalidate_venue(venue_id, artist_ids=None):
+    # a venue's name and image appear on its own page, the area listing, the
+    # shows listing and the pages of the artists that played there.
+    # artist_ids can be passed when the shows are already gone
+    if artist_ids is None:
+        artist_ids = [row[0] for row in
+                      db.session.query(Shows.artist_id).filter(Shows.venue_id == venue_id).distinct()]
+    page_cache.invalidate('venues', 'shows', 'venue:{}'.format(venue_id),
+                          *['artist:{}'.format(artist_id) for artist_id in artist_ids])
+
+
+def invalidate_artist(artist_id, venue_ids=None):
+    # an artist's name and image appear on its own page, the artist listing,
+    # the shows listing and the pages of the venues it played at.
+    # venue_ids can be passed when the shows are already gone
+    if venue_ids is None:
+        venue_ids = [row[0] for row in
+                     db.session.query(Shows.venue_id).filter(Shows.artist_id == artist_id).distinct()]
+    page_cache.invalidate('artists', 'shows', 'artist:{}'.format(artist_id),
+                          *['venue:{}'.format(venue_id) for venue_id in venue_ids])
+
+
+def invalidate_show(venue_id, artist_id):
+    # a new show changes the shows listing, the upcoming counts of the area
+    # listing and the timelines of its venue and artist
+    page_cache.invalidate('shows', 'venues', 'venue:{}'.format(venue_id), 'artist:{}'.format(artist_id))
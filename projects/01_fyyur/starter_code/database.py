@@ -0,0 +1,129 @@
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+# ----------------------------------------------------------------------------#
+# Pool metrics.
+# ----------------------------------------------------------------------------#
+
+class PoolMetrics(object):
+    """Counters of the connection pool, read by /metrics/pool.
+
+    Checkouts and connects are counted from pool events for every pool
+    class. The time spent waiting for a free connection and the overflow
+    connections are only known for the TimedQueuePool the engine factory
+    uses with server databases.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pool = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.connects = 0
+            self.timeouts = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+            self.peak_overflow = 0
+
+    def watch(self, engine):
+        # starts counting the checkouts of a newly created engine
+        self.pool = engine.pool
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'connect', self._on_connect)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def record_wait(self, seconds, overflow, timed_out=False):
+        with self._lock:
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self.peak_overflow = max(self.peak_overflow, overflow)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self):
+        pool = self.pool
+        sized = isinstance(pool, QueuePool)
+        return {
+            'pool': type(pool).__name__ if pool is not None else None,
+            'size': pool.size() if sized else None,
+            'checked_out': pool.checkedout() if sized else None,
+            'overflow': max(pool.overflow(), 0) if sized else None,
+            'peak_overflow': self.peak_overflow,
+            'checkouts': self.checkouts,
+            'connects': self.connects,
+            'timeouts': self.timeouts,
+            'wait_ms_total': round(self.wait_seconds * 1000, 3),
+            'wait_ms_max': round(self.max_wait_seconds * 1000, 3),
+            'wait_ms_avg': round(self.wait_seconds * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited to pool_metrics"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start, max(self.overflow(), 0), timed_out)
+
+
+# ----------------------------------------------------------------------------#
+# Engine factory.
+# ----------------------------------------------------------------------------#
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension building its engine from the DATABASE_* settings.
+
+    The options are applied when the engine is created, i.e. on first use
+    after the configuration is loaded, and only to server databases: SQLite
+    keeps the single connection or null pool Flask-SQLAlchemy gives it.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super(PooledSQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        config = app.config
+        options.setdefault('pool_pre_ping', config.get('DATABASE_POOL_PRE_PING', True))
+        if sa_url.drivername.startswith('sqlite'):
+            return sa_url, options
+
+        options.setdefault('poolclass', TimedQueuePool)
+        options.setdefault('pool_size', config.get('DATABASE_POOL_SIZE', 5))
+        options.setdefault('max_overflow', config.get('DATABASE_MAX_OVERFLOW', 10))
+        options.setdefault('pool_timeout', config.get('DATABASE_POOL_TIMEOUT', 30))
+        options.setdefault('pool_recycle', config.get('DATABASE_POOL_RECYCLE', 1800))
+
+        statement_timeout = config.get('DATABASE_STATEMENT_TIMEOUT', 0)
+        if statement_timeout and sa_url.drivername.startswith('postgresql'):
+            # milliseconds, enforced by the server for every statement
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = '-c statement_timeout={}'.format(int(statement_timeout))
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(PooledSQLAlchemy, self).create_engine(sa_url, engine_opts)
+        pool_metrics.watch(engine)
+        return engine
@@ -0,0 +1,66 @@
+from models import db, Venue, Artist, Shows, VenueShowStats, ArtistShowStats
+import stats
+import availability
+import facets
+
+DELETE_CHUNK_SIZE = 5000
+
+# entity -> (model, its statistics model, Shows column pointing at it,
+#            Shows column of the other side)
+DELETES = {
+    'venue': (Venue, VenueShowStats, Shows.venue_id, Shows.artist_id),
+    'artist': (Artist, ArtistShowStats, Shows.artist_id, Shows.venue_id),
+}
+
+
+def _delete_shows(entity, entity_id, chunk_size):
+    # deletes the shows of a venue or artist with one DELETE per chunk of
+    # show ids, committing each chunk so the row locks are held briefly.
+    # the statistics of the other side are recomputed in the same
+    # transaction as each chunk, returns the ids of the other side
+    key, counterpart = DELETES[entity][2:]
+    counterpart_ids = set()
+    while True:
+        rows = db.session.query(Shows.id, counterpart) \
+            .filter(key == entity_id) \
+            .limit(chunk_size) \
+            .all()
+        if not rows:
+            return counterpart_ids
+
+        chunk_counterparts = {row[1] for row in rows}
+        db.session.query(Shows).filter(Shows.id.in_([row[0] for row in rows])) \
+            .delete(synchronize_session=False)
+        if entity == 'venue':
+            stats.refresh(artist_ids=chunk_counterparts)
+        else:
+            stats.refresh(venue_ids=chunk_counterparts)
+        db.session.commit()
+        counterpart_ids |= chunk_counterparts
+
+
+def delete_entity(entity, entity_id, chunk_size=DELETE_CHUNK_SIZE):
+    # deletes a venue or artist with set-based statements instead of loading
+    # its shows through the relationship. returns the ids of the artists
+    # (for a venue) or venues (for an artist) that lost shows, or None when
+    # the entity does not exist
+    model, stats_model = DELETES[entity][:2]
+    if db.session.query(model.id).filter(model.id == entity_id).first() is None:
+        return None
+
+    counterpart_ids = _delete_shows(entity, entity_id, chunk_size)
+    db.session.query(stats_model).filter(list(stats_model.__table__.primary_key)[0] == entity_id) \
+        .delete(synchronize_session=False)
+    db.session.query(model).filter(model.id == entity_id).delete(synchronize_session=False)
+    db.session.commit()
+    availability.clear()
+    facets.indexes[entity + 's'].remove(entity_id)
+    return counterpart_ids
+
+
+def delete_venue(venue_id, chunk_size=DELETE_CHUNK_SIZE):
+    return delete_entity('venue', venue_id, chunk_size)
+
+
+def delete_artist(artist_id, chunk_size=DELETE_CHUNK_SIZE):
+    return delete_entity('artist', artist_id, chunk_size)
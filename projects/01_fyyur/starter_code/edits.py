@@ -0,0 +1,92 @@
+from models import db, Venue, Artist
+import facets
+
+# entity -> (model, facet index, its seeking column)
+EDITS = {
+    'venue': (Venue, 'venues', 'seeking_talent'),
+    'artist': (Artist, 'artists', 'seeking_venue'),
+}
+
+# columns the facet index is built from
+FACET_COLUMNS = ('genres', 'city', 'state', 'seeking_talent', 'seeking_venue')
+
+
+class EditConflict(Exception):
+    """The entity was saved by someone else since the edit form was loaded"""
+
+    def __init__(self, current_version):
+        super(EditConflict, self).__init__(current_version)
+        self.current_version = current_version
+
+
+def form_values(entity, form):
+    # column values of a submitted venue or artist edit form
+    values = {
+        'name': form.get('name'),
+        'city': form.get('city'),
+        'state': form.get('state'),
+        'phone': form.get('phone'),
+        'genres': form.getlist('genres'),
+        'website': form.get('website'),
+        'facebook_link': form.get('facebook_link'),
+        'image_link': form.get('image_link'),
+        'seeking_description': form.get('seeking_description'),
+    }
+    if entity == 'venue':
+        values['address'] = form.get('address')
+    values[EDITS[entity][2]] = form.get('seeking') == 'Yes'
+    return values
+
+
+def _same(current, value):
+    # an empty form field matches a NULL column
+    return current == value or (current in (None, '') and value in (None, ''))
+
+
+def update_entity(entity, entity_id, version, values):
+    # saves the values of an edit form that was loaded at `version`.
+    # the current columns are read by primary key and only the ones that
+    # differ are written, in one UPDATE that also bumps the version and only
+    # matches while the version is unchanged. returns the changed columns,
+    # or None when the entity does not exist. raises EditConflict when the
+    # entity was saved since the form was loaded
+    model, kind, seeking = EDITS[entity]
+    table = model.__table__
+    names = list(values)
+    row = db.session.execute(db.select([table.c.version] + [table.c[name] for name in names])
+                             .where(table.c.id == entity_id)).first()
+    if row is None:
+        return None
+    if row[0] != version:
+        db.session.rollback()
+        raise EditConflict(row[0])
+
+    current = dict(zip(names, row[1:]))
+    changes = {name: value for name, value in values.items() if not _same(current[name], value)}
+    if not changes:
+        db.session.rollback()
+        return changes
+
+    result = db.session.execute(table.update()
+                                .where(table.c.id == entity_id)
+                                .where(table.c.version == version)
+                                .values(version=table.c.version + 1, **changes))
+    if result.rowcount != 1:
+        # saved by a concurrent request between the read and the update
+        db.session.rollback()
+        raise EditConflict(None)
+
+    if any(name in FACET_COLUMNS for name in changes):
+        current.update(changes)
+        facets.queue_update(db.session(), kind, entity_id, current['genres'], current['city'], current['state'],
+                            current[seeking])
+    db.session.commit()
+    return changes
+
+
+def update_venue(venue_id, version, values):
+    return update_entity('venue', venue_id, version, values)
+
+
+def update_artist(artist_id, version, values):
+    return update_entity('artist', artist_id, version, values)
@@ -0,0 +1,131 @@
+import csv
+import datetime
+import io
+import json
+
+import click
+
+from models import db, Venue, Artist, Shows
+
+EXPORT_CHUNK_SIZE = 1000
+# the format ShowForm parses, so exported shows can be imported again
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+def _show_counts(foreign_key, entity_id, current_date):
+    # correlated past/upcoming counts, answered per row from the
+    # (venue_id, start_time) and (artist_id, start_time) indexes
+    past = db.select([db.func.count(Shows.id)]) \
+        .where(db.and_(foreign_key == entity_id, Shows.start_time < current_date)).as_scalar()
+    upcoming = db.select([db.func.count(Shows.id)]) \
+        .where(db.and_(foreign_key == entity_id, Shows.start_time >= current_date)).as_scalar()
+    return past.label('past_shows_count'), upcoming.label('upcoming_shows_count')
+
+
+def _venues(current_date):
+    columns = list(Venue.__table__.columns)
+    return db.select(columns + list(_show_counts(Shows.venue_id, Venue.id, current_date))).order_by(Venue.id)
+
+
+def _artists(current_date):
+    columns = list(Artist.__table__.columns)
+    return db.select(columns + list(_show_counts(Shows.artist_id, Artist.id, current_date))).order_by(Artist.id)
+
+
+def _shows(current_date):
+    return db.select([Shows.id, Shows.artist_id, Shows.venue_id, Shows.start_time,
+                      (Shows.start_time >= current_date).label('upcoming')]).order_by(Shows.id)
+
+
+EXPORTS = {
+    'venues': _venues,
+    'artists': _artists,
+    'shows': _shows,
+}
+
+
+def stream_rows(kind, current_date=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # yields the rows of an export as dicts. stream_results makes psycopg2 use
+    # a server-side cursor, so only chunk_size rows are held in memory however
+    # large the table is
+    if current_date is None:
+        current_date = datetime.datetime.now()
+
+    with db.engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(EXPORTS[kind](current_date))
+        keys = list(result.keys())
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(keys, row))
+
+
+# ----------------------------------------------------------------------------#
+# Encoding.
+# ----------------------------------------------------------------------------#
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    raise TypeError(repr(value))
+
+
+def export_lines(kind, format='jsonl', current_date=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # yields the export as text chunks of up to chunk_size rows, genres are
+    # ";"-separated in CSV like the import commands expect
+    buffer = io.StringIO()
+    writer = None
+    rows_in_buffer = 0
+
+    for row in stream_rows(kind, current_date, chunk_size):
+        if format == 'csv':
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(row))
+                writer.writeheader()
+            if row.get('genres') is not None:
+                row['genres'] = ';'.join(row['genres'])
+            if row.get('start_time') is not None:
+                row['start_time'] = row['start_time'].strftime(DATETIME_FORMAT)
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, default=_json_default))
+            buffer.write('\n')
+
+        rows_in_buffer += 1
+        if rows_in_buffer == chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows_in_buffer = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'output_format', type=click.Choice(list(FORMATS)), default='jsonl', show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='file to write, stdout by default')
+@click.option('--chunk-size', default=EXPORT_CHUNK_SIZE, show_default=True, help='rows fetched per round trip')
+def export_command(kind, output_format, output, chunk_size):
+    """Export all venues, artists or shows as JSON Lines or CSV."""
+    for chunk in export_lines(kind, output_format, chunk_size=chunk_size):
+        output.write(chunk)
+
+
+def register_commands(app):
+    app.cli.command('export')(export_command)
@@ -0,0 +1,331 @@
+import re
+import threading
+import time
+from itertools import islice
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Venue, Artist
+
+FACETS = ('genre', 'city', 'state', 'seeking')
+BROWSE_PER_PAGE = 20
+# below this many matches, counting the city of each match is cheaper than
+# cutting out the window of every city
+SPARSE_MATCHES = 2000
+
+# bit offsets set in each byte value, used to list the members of a bitmap
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+_NON_ZERO_BYTE = re.compile(b'[^\x00]')
+
+
+def _popcount(bits):
+    # int.bit_count is Python 3.10+
+    return bits.bit_count() if hasattr(bits, 'bit_count') else bin(bits).count('1')
+
+
+def _bitmap(positions, size):
+    # builds a bitmap from positions in one pass instead of one big-int
+    # operation per position
+    data = bytearray((size >> 3) + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _positions(bits):
+    # yields the set positions of a bitmap in ascending order, skipping the
+    # zero bytes with a regular expression rather than a Python loop
+    data = bits.to_bytes((bits.bit_length() + 7) >> 3, 'little')
+    for match in _NON_ZERO_BYTE.finditer(data):
+        offset = match.start() << 3
+        for bit in _BYTE_BITS[data[offset >> 3]]:
+            yield offset + bit
+
+
+# ----------------------------------------------------------------------------#
+# Bitmap index.
+# ----------------------------------------------------------------------------#
+
+class FacetIndex(object):
+    """In-memory facet index of the venues or the artists.
+
+    Every entity gets a position, ordered by (city, state, id) when the index
+    is loaded and appended afterwards. genre, state and seeking values map to
+    bitmaps (Python ints with one bit per position), so combining filters is
+    a few big-int ANDs and a count is a popcount.
+
+    Cities have too many values for one full-size bitmap each. Since the
+    positions are grouped by city, a city keeps a small bitmap of the window
+    of positions it had at load time, plus a set of the positions it gained
+    later. Reloading (reset) compacts them again.
+
+    Commits of this process are applied as they happen. Writes of other
+    processes (CLI imports and deletes, other workers) are picked up when
+    the index is reloaded, every `ttl` seconds.
+    """
+
+    def __init__(self, model, seeking_column, ttl=60):
+        self.model = model
+        self.seeking_column = seeking_column
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._loaded_at = 0
+
+    def _entity_values(self, genres, city, state, seeking):
+        return {
+            'genre': tuple(genres or ()),
+            'city': city,
+            'state': state,
+            'seeking': bool(seeking),
+        }
+
+    def reset(self):
+        # the index is reloaded from the database on its next use
+        with self._lock:
+            self.loaded = False
+
+    def load(self):
+        rows = db.session.query(self.model.id, self.model.genres, self.model.city, self.model.state,
+                                self.seeking_column) \
+            .order_by(self.model.city, self.model.state, self.model.id) \
+            .all()
+        positions = {'genre': {}, 'state': {}, 'seeking': {}}
+        with self._lock:
+            self.ids = []
+            self.positions = {}
+            self.values = []
+            # city -> [first position, window bitmap, positions added later]
+            self.cities = {}
+            for row in rows:
+                position = len(self.ids)
+                values = self._entity_values(*row[1:])
+                self.ids.append(row[0])
+                self.positions[row[0]] = position
+                self.values.append(values)
+                city = self.cities.get(values['city'])
+                if city is None:
+                    city = self.cities[values['city']] = [position, 0, set()]
+                city[1] |= 1 << (position - city[0])
+                for genre in values['genre']:
+                    positions['genre'].setdefault(genre, []).append(position)
+                positions['state'].setdefault(values['state'], []).append(position)
+                positions['seeking'].setdefault(values['seeking'], []).append(position)
+
+            size = len(self.ids)
+            self.bitmaps = {facet: {value: _bitmap(members, size) for value, members in bitmaps.items()}
+                            for facet, bitmaps in positions.items()}
+            self.live = (1 << size) - 1
+            self.loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if not self.loaded or time.monotonic() - self._loaded_at > self.ttl:
+            self.load()
+
+    def _set_city(self, position, name, on):
+        city = self.cities.get(name)
+        if city is None:
+            city = self.cities[name] = [0, 0, set()]
+        offset = position - city[0]
+        if 0 <= offset < city[1].bit_length():
+            if on:
+                city[1] |= 1 << offset
+            else:
+                city[1] &= ~(1 << offset)
+        elif on:
+            city[2].add(position)
+        else:
+            city[2].discard(position)
+
+    def _set(self, position, values, on):
+        bit = 1 << position
+        for facet in ('genre', 'state', 'seeking'):
+            members = values[facet] if facet == 'genre' else (values[facet],)
+            bitmaps = self.bitmaps[facet]
+            for value in members:
+                if on:
+                    bitmaps[value] = bitmaps.get(value, 0) | bit
+                else:
+                    bitmaps[value] &= ~bit
+        self._set_city(position, values['city'], on)
+        if on:
+            self.live |= bit
+        else:
+            self.live &= ~bit
+
+    def put(self, entity_id, genres, city, state, seeking):
+        # adds a new entity or replaces the facet values of an edited one
+        with self._lock:
+            if not self.loaded:
+                return
+            values = self._entity_values(genres, city, state, seeking)
+            position = self.positions.get(entity_id)
+            if position is None:
+                position = self.positions[entity_id] = len(self.ids)
+                self.ids.append(entity_id)
+                self.values.append(values)
+            else:
+                self._set(position, self.values[position], False)
+                self.values[position] = values
+            self._set(position, values, True)
+
+    def remove(self, entity_id):
+        with self._lock:
+            if not self.loaded:
+                return
+            position = self.positions.pop(entity_id, None)
+            if position is not None:
+                self._set(position, self.values[position], False)
+
+    def _city_bitmap(self, name):
+        city = self.cities.get(name)
+        if city is None:
+            return 0
+        return city[1] << city[0] | _bitmap(city[2], len(self.ids))
+
+    def _match(self, filters, skip=None):
+        # AND across facets, OR across the values of one facet
+        bits = self.live
+        for facet, values in filters.items():
+            if facet == skip or not values:
+                continue
+            union = 0
+            for value in values:
+                if facet == 'city':
+                    union |= self._city_bitmap(value)
+                else:
+                    union |= self.bitmaps[facet].get(value, 0)
+            bits &= union
+        return bits
+
+    def _city_counts(self, bits):
+        # each city's window is cut out of the byte string of the matches and
+        # counted on its own, so the cost follows the number of cities and
+        # not the size of the index
+        data = bits.to_bytes((len(self.ids) >> 3) + 1, 'little')
+        counts = {}
+        for name, (first, window, added) in self.cities.items():
+            count = 0
+            if window:
+                chunk = int.from_bytes(data[first >> 3:((first + window.bit_length()) >> 3) + 1], 'little')
+                count = _popcount(chunk >> (first & 7) & window)
+            for position in added:
+                count += data[position >> 3] >> (position & 7) & 1
+            counts[name] = count
+        return counts
+
+    def _sparse_city_counts(self, bits):
+        counts = {}
+        for position in _positions(bits):
+            city = self.values[position]['city']
+            counts[city] = counts.get(city, 0) + 1
+        return counts
+
+    def _counts(self, facet, filters):
+        # counts of each value of a facet under the filters of the other
+        # facets, so selecting one genre still shows how many match the others.
+        # entities without a city or state are counted in no bucket of it
+        bits = self._match(filters, skip=facet)
+        if bits == self.live and facet == 'city':
+            counts = {name: _popcount(window) + len(added) for name, (_, window, added) in self.cities.items()}
+        elif facet == 'city':
+            counts = self._sparse_city_counts(bits) if _popcount(bits) <= SPARSE_MATCHES else self._city_counts(bits)
+        elif bits == self.live:
+            counts = {value: _popcount(bitmap) for value, bitmap in self.bitmaps[facet].items()}
+        else:
+            counts = {value: _popcount(bits & bitmap) for value, bitmap in self.bitmaps[facet].items()}
+        return {value: count for value, count in counts.items() if count and value is not None}
+
+    def browse(self, filters, page=1, per_page=BROWSE_PER_PAGE):
+        # returns (ids of the page, total matches, {facet: {value: count}})
+        with self._lock:
+            self._ensure_loaded()
+            bits = self._match(filters)
+            start = (page - 1) * per_page
+            ids = [self.ids[position] for position in islice(_positions(bits), start, start + per_page)]
+            counts = {facet: self._counts(facet, filters) for facet in FACETS}
+            return ids, _popcount(bits), counts
+
+
+indexes = {
+    'venues': FacetIndex(Venue, Venue.seeking_talent),
+    'artists': FacetIndex(Artist, Artist.seeking_venue),
+}
+
+
+def reset():
+    for index in indexes.values():
+        index.reset()
+
+
+# ----------------------------------------------------------------------------#
+# Incremental updates.
+# ----------------------------------------------------------------------------#
+
+def queue_update(session, kind, entity_id, genres, city, state, seeking):
+    # creates and edits are applied to the index once their transaction
+    # commits, a rollback drops them
+    session.info.setdefault('facet_updates', []).append((kind, (entity_id, genres, city, state, seeking)))
+
+
+def _queue(kind):
+
+    def listener(mapper, connection, entity):
+        queue_update(object_session(entity), kind, entity.id, entity.genres, entity.city, entity.state,
+                     getattr(entity, indexes[kind].seeking_column.key))
+
+    return listener
+
+
+for kind, model in (('venues', Venue), ('artists', Artist)):
+    event.listen(model, 'after_insert', _queue(kind))
+    event.listen(model, 'after_update', _queue(kind))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_updates(session):
+    for kind, values in session.info.pop('facet_updates', []):
+        indexes[kind].put(*values)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_updates(session):
+    session.info.pop('facet_updates', None)
+
+
+# ----------------------------------------------------------------------------#
+# Browse.
+# ----------------------------------------------------------------------------#
+
+def parse_filters(args):
+    # facet filters from the query string, a facet may be repeated:
+    # ?genre=Jazz&genre=Blues&state=CA&seeking=true
+    filters = {facet: args.getlist(facet) for facet in FACETS if args.getlist(facet)}
+    if 'seeking' in filters:
+        filters['seeking'] = [value.lower() in ('true', 'yes', '1') for value in filters['seeking']]
+    return filters
+
+
+def browse(kind, filters, page=1, per_page=BROWSE_PER_PAGE):
+    # one page of the venues or artists matching the filters with the
+    # per-facet counts. the index gives the ids, their names are read in one
+    # query by primary key
+    index = indexes[kind]
+    ids, total, counts = index.browse(filters, page, per_page)
+    model = index.model
+    rows = {row[0]: row for row in db.session.query(model.id, model.name, model.city, model.state)
+            .filter(model.id.in_(ids))} if ids else {}
+    counts['seeking'] = {str(value).lower(): count for value, count in counts['seeking'].items()}
+
+    return {
+        'total': total,
+        kind: [{
+            'id': row[0],
+            'name': row[1],
+            'city': row[2],
+            'state': row[3]
+        } for row in (rows[entity_id] for entity_id in ids if entity_id in rows)],
+        'facets': counts
+    }
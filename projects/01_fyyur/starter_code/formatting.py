@@ -0,0 +1,52 @@
+import functools
+
+import babel
+import babel.dates
+import dateutil.parser
+
+# names the templates use for the patterns of the datetime filter
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def _formatter(format, locale):
+    # parses the Babel pattern and the locale once per (format, locale)
+    # instead of on every call, the cache is bounded so arbitrary formats
+    # passed to the filter cannot grow it
+    pattern = babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+    return pattern, babel.Locale.parse(locale or babel.dates.LC_TIME)
+
+
+def format_datetime(value, format='medium', locale=None):
+    # the `datetime` Jinja filter. values are expected to be datetimes,
+    # strings are still parsed for callers that pass formatted dates
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern, locale = _formatter(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetimes(values, format='medium', locale=None):
+    # formats a list of datetimes with one formatter lookup, values that
+    # repeat (shows starting at the same time) are formatted once
+    pattern, locale = _formatter(format, locale)
+    formatted = {}
+    result = []
+    for value in values:
+        text = formatted.get(value)
+        if text is None:
+            text = formatted[value] = pattern.apply(value, locale)
+        result.append(text)
+    return result
+
+
+def format_show_times(shows, format='full', locale=None):
+    # adds 'start_time_formatted' to each show dict of a page in one batch,
+    # the templates render it instead of filtering every row
+    texts = format_datetimes([show['start_time'] for show in shows], format, locale)
+    for show, text in zip(shows, texts):
+        show['start_time_formatted'] = text
+    return shows
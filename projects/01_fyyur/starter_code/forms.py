@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, IntegerField, HiddenField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 
 class ShowForm(FlaskForm):
@@ -16,6 +16,10 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    # minutes, shows without a duration last two hours
+    duration = IntegerField(
+        'duration', validators=[Optional(), NumberRange(min=1, max=24 * 60)]
+    )
 
 
 state_choices = [
@@ -134,6 +138,10 @@ class VenueForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description'
     )
+    # row version the edit form was loaded with, see edits.py
+    version = HiddenField(
+        'version'
+    )
 
 
 class ArtistForm(FlaskForm):
@@ -170,3 +178,7 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description'
     )
+    # row version the edit form was loaded with, see edits.py
+    version = HiddenField(
+        'version'
+    )
@@ -0,0 +1,317 @@
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+import click
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Shows, DEFAULT_SHOW_DURATION
+from cache import page_cache
+import stats
+import availability
+import facets
+
+BATCH_SIZE = 1000
+
+
+# ----------------------------------------------------------------------------#
+# Reading.
+# ----------------------------------------------------------------------------#
+
+class InvalidLine(object):
+    """A JSON line that could not be parsed, rejected by import_rows"""
+
+    def __init__(self, raw, error):
+        self.raw = raw
+        self.error = error
+
+
+def read_rows(stream, format):
+    # yields one dict per CSV row or JSON line without reading the whole input,
+    # unparsable JSON lines are yielded as InvalidLine
+    if format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    yield InvalidLine(line.rstrip('\n'), error)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _formdata(row):
+    # maps a CSV or JSON row onto what the forms receive from a POST:
+    # genres are a list (";"-separated in CSV) and seeking is "Yes"/"No"
+    data = MultiDict()
+    for field, value in row.items():
+        if value is None:
+            continue
+        if field == 'genres':
+            genres = value.split(';') if isinstance(value, str) else value
+            data.setlist('genres', [genre.strip() for genre in genres if genre.strip()])
+        elif field == 'seeking' and isinstance(value, bool):
+            data['seeking'] = 'Yes' if value else 'No'
+        else:
+            data[field] = str(value)
+    return data
+
+
+# ----------------------------------------------------------------------------#
+# Validation.
+# ----------------------------------------------------------------------------#
+
+def show_end_time(form):
+    duration = form.duration.data
+    if duration is None:
+        return form.start_time.data + DEFAULT_SHOW_DURATION
+    return form.start_time.data + datetime.timedelta(minutes=duration)
+
+
+def venue_values(form):
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'website': form.website.data,
+        'facebook_link': form.facebook_link.data,
+        'image_link': form.image_link.data,
+        'seeking_talent': form.seeking.data == 'Yes',
+        'seeking_description': form.seeking_description.data,
+    }
+
+
+def artist_values(form):
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'website': form.website.data,
+        'facebook_link': form.facebook_link.data,
+        'image_link': form.image_link.data,
+        'seeking_venue': form.seeking.data == 'Yes',
+        'seeking_description': form.seeking_description.data,
+    }
+
+
+def show_values(form):
+    return {
+        'artist_id': int(form.artist_id.data),
+        'venue_id': int(form.venue_id.data),
+        'start_time': form.start_time.data,
+        'end_time': show_end_time(form),
+    }
+
+
+# kind -> (model, form validating a row, values for the insert)
+IMPORTS = {
+    'venues': (Venue, VenueForm, venue_values),
+    'artists': (Artist, ArtistForm, artist_values),
+    'shows': (Shows, ShowForm, show_values),
+}
+
+
+def validate_row(kind, row):
+    # validates a row with the same form as the web handlers,
+    # returns (values, None) or (None, errors)
+    model, form_class, values = IMPORTS[kind]
+    if not isinstance(row, dict):
+        return None, {'row': ['not a JSON object']}
+    form = form_class(formdata=_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    try:
+        return values(form), None
+    except ValueError as error:
+        return None, {'row': [str(error)]}
+
+
+def _unknown_foreign_keys(values):
+    # resolves the artist and venue ids of a batch of shows with one query per
+    # table, returns {position in batch: errors} for the unknown ones
+    artist_ids = {row['artist_id'] for row in values}
+    venue_ids = {row['venue_id'] for row in values}
+    known_artists = {row[0] for row in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    known_venues = {row[0] for row in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+
+    errors = {}
+    for position, row in enumerate(values):
+        if row['artist_id'] not in known_artists:
+            errors.setdefault(position, {})['artist_id'] = ['Unknown artist.']
+        if row['venue_id'] not in known_venues:
+            errors.setdefault(position, {})['venue_id'] = ['Unknown venue.']
+    return errors
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+
+class ImportReport(object):
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return 'imported {} of {} rows in {:.2f}s ({:.0f} rows/sec), {} rejected'.format(
+            self.inserted, self.rows, self.elapsed, self.rows_per_second, self.rejected)
+
+
+def _after_shows_inserted(values):
+    # the multi-row inserts bypass the ORM events that maintain the show
+    # statistics, so the touched venues and artists are recomputed instead
+    stats.refresh(venue_ids={row['venue_id'] for row in values},
+                  artist_ids={row['artist_id'] for row in values})
+
+
+def _insert(table, values, lines, reject, after_insert=None):
+    # inserts a validated batch in one multi-row INSERT. when the database
+    # refuses the batch, the rows are retried one by one in savepoints so a
+    # single bad row does not lose the rest of the batch.
+    # after_insert(inserted values) runs in the same transaction
+    try:
+        db.session.execute(table.insert(), values)
+        if after_insert is not None:
+            after_insert(values)
+        db.session.commit()
+        return len(values)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    inserted = []
+    for line, row in zip(lines, values):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert(), row)
+            inserted.append(row)
+        except SQLAlchemyError as error:
+            reject(line, row, {'database': [str(getattr(error, 'orig', error))]})
+    if after_insert is not None and inserted:
+        after_insert(inserted)
+    db.session.commit()
+    return len(inserted)
+
+
+def import_rows(kind, rows, batch_size=BATCH_SIZE, on_error=None):
+    # validates and inserts rows of the given kind in batches of batch_size,
+    # rejected rows are passed to on_error(line, row, errors)
+    model = IMPORTS[kind][0]
+    report = ImportReport()
+
+    def reject(line, row, errors):
+        report.rejected += 1
+        if on_error is not None:
+            on_error(line, row, errors)
+
+    for batch in batches(enumerate(rows, start=1), batch_size):
+        report.rows += len(batch)
+        values = []
+        lines = []
+        for line, row in batch:
+            if isinstance(row, InvalidLine):
+                reject(line, row.raw, {'row': ['invalid JSON: {}'.format(row.error)]})
+                continue
+            row_values, errors = validate_row(kind, row)
+            if errors:
+                reject(line, row, errors)
+            else:
+                values.append(row_values)
+                lines.append(line)
+
+        if kind == 'shows' and values:
+            unknown = _unknown_foreign_keys(values)
+            for position in sorted(unknown):
+                reject(lines[position], values[position], unknown[position])
+            values = [row for position, row in enumerate(values) if position not in unknown]
+            lines = [line for position, line in enumerate(lines) if position not in unknown]
+
+        if kind == 'shows' and values:
+            # the double bookings the show form refuses, against the booked
+            # shows and the earlier rows of the batch
+            conflicts = availability.import_conflicts(values)
+            for position in sorted(conflicts):
+                reject(lines[position], values[position], {'start_time': [
+                    ' and '.join(conflicts[position]) + ' already booked at that time.']})
+            values = [row for position, row in enumerate(values) if position not in conflicts]
+            lines = [line for position, line in enumerate(lines) if position not in conflicts]
+
+        if values:
+            after_insert = _after_shows_inserted if kind == 'shows' else None
+            report.inserted += _insert(model.__table__, values, lines, reject, after_insert)
+            if kind == 'shows':
+                # the multi-row inserts bypass the ORM events of the booking
+                # intervals, dropped once the batch is committed
+                availability.clear()
+
+    if report.inserted:
+        # from the CLI this only reaches a server through the redis backend,
+        # with the lru backend its pages expire within CACHE_TTL seconds
+        page_cache.clear()
+        if kind in facets.indexes:
+            facets.indexes[kind].reset()
+    return report
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+def _import_command(kind):
+
+    @click.argument('input', type=click.File('r'))
+    @click.option('--format', 'input_format', type=click.Choice(['csv', 'jsonl']),
+                  help='input format, guessed from the file extension by default')
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='rows per INSERT and commit')
+    @click.option('--errors', type=click.File('w'),
+                  help='file the rejected rows are written to as JSON lines, stderr by default')
+    def command(input, input_format, batch_size, errors):
+        if input_format is None:
+            input_format = 'csv' if os.path.splitext(input.name)[1].lower() == '.csv' else 'jsonl'
+        if errors is None:
+            errors = sys.stderr
+
+        def on_error(line, row, messages):
+            errors.write(json.dumps({'line': line, 'row': row, 'errors': messages}, default=str) + '\n')
+
+        report = import_rows(kind, read_rows(input, input_format), batch_size, on_error)
+        click.echo(report)
+
+    command.__doc__ = 'Import {} from a CSV or JSON Lines file ("-" for stdin).'.format(kind)
+    return command
+
+
+def register_commands(app):
+    for kind in IMPORTS:
+        app.cli.command('import-' + kind)(_import_command(kind))
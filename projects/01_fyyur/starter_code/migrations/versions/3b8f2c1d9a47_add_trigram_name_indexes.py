@@ -0,0 +1,30 @@
+"""add trigram indexes for venue and artist name search
+
+Revision ID: 3b8f2c1d9a47
+Revises: 0e2e249166cd
+Create Date: 2021-01-09 18:42:10.513204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f2c1d9a47'
+down_revision = '0e2e249166cd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # gin_trgm_ops lets PostgreSQL answer ILIKE '%term%' from the index
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
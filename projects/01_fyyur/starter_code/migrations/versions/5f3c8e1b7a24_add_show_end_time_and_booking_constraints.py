@@ -0,0 +1,37 @@
+"""add show end times and refuse overlapping bookings
+
+Revision ID: 5f3c8e1b7a24
+Revises: e4b7c9a2d613
+Create Date: 2021-01-18 15:03:22.174609
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f3c8e1b7a24'
+down_revision = 'e4b7c9a2d613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # existing shows get the default two hour duration
+    op.execute('UPDATE "Shows" SET end_time = start_time + interval \'2 hours\'')
+    op.alter_column('Shows', 'end_time', nullable=False)
+
+    # btree_gist lets the GiST index of the constraints cover the integer ids.
+    # the constraints fail to create while overlapping shows exist, those
+    # have to be rescheduled first
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute('ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_{0}_overlap" '
+                   'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column))
+
+
+def downgrade():
+    op.drop_constraint('ex_Shows_artist_id_overlap', 'Shows')
+    op.drop_constraint('ex_Shows_venue_id_overlap', 'Shows')
+    op.drop_column('Shows', 'end_time')
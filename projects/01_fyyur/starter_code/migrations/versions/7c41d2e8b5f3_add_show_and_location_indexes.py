@@ -0,0 +1,34 @@
+"""add composite indexes for show timelines and the area listing
+
+Revision ID: 7c41d2e8b5f3
+Revises: 3b8f2c1d9a47
+Create Date: 2021-01-12 20:05:37.882410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41d2e8b5f3'
+down_revision = '3b8f2c1d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # venue pages and the area listing filter shows by venue and time
+    op.create_index('ix_Shows_venue_id_start_time', 'Shows', ['venue_id', 'start_time'], unique=False)
+    # artist pages filter shows by artist and time
+    op.create_index('ix_Shows_artist_id_start_time', 'Shows', ['artist_id', 'start_time'], unique=False)
+    # /shows seeks and orders on (start_time, id)
+    op.create_index('ix_Shows_start_time_id', 'Shows', ['start_time', 'id'], unique=False)
+    # the area listing groups and orders venues by location
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Shows_start_time_id', table_name='Shows')
+    op.drop_index('ix_Shows_artist_id_start_time', table_name='Shows')
+    op.drop_index('ix_Shows_venue_id_start_time', table_name='Shows')
@@ -0,0 +1,55 @@
+"""add precomputed show statistics per venue and artist
+
+Revision ID: 9d2a6e4f1c58
+Revises: 7c41d2e8b5f3
+Create Date: 2021-01-14 18:42:11.305127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2a6e4f1c58'
+down_revision = '7c41d2e8b5f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('VenueShowStats',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('past_shows_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+    sa.Column('next_show_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+    # roll-show-stats looks up the rows whose next show has started
+    op.create_index(op.f('ix_VenueShowStats_next_show_time'), 'VenueShowStats', ['next_show_time'], unique=False)
+    op.create_table('ArtistShowStats',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('past_shows_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+    sa.Column('next_show_time', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ),
+    sa.PrimaryKeyConstraint('artist_id')
+    )
+    op.create_index(op.f('ix_ArtistShowStats_next_show_time'), 'ArtistShowStats', ['next_show_time'], unique=False)
+
+    # fill in the statistics of the existing shows
+    for table, key in (('VenueShowStats', 'venue_id'), ('ArtistShowStats', 'artist_id')):
+        op.execute(
+            'INSERT INTO "{table}" ({key}, past_shows_count, upcoming_shows_count, next_show_time) '
+            'SELECT {key}, '
+            'SUM(CASE WHEN start_time >= now() THEN 0 ELSE 1 END), '
+            'SUM(CASE WHEN start_time >= now() THEN 1 ELSE 0 END), '
+            'MIN(CASE WHEN start_time >= now() THEN start_time END) '
+            'FROM "Shows" GROUP BY {key}'.format(table=table, key=key))
+
+
+def downgrade():
+    op.drop_index(op.f('ix_ArtistShowStats_next_show_time'), table_name='ArtistShowStats')
+    op.drop_table('ArtistShowStats')
+    op.drop_index(op.f('ix_VenueShowStats_next_show_time'), table_name='VenueShowStats')
+    op.drop_table('VenueShowStats')
@@ -0,0 +1,27 @@
+"""add GIN indexes on venue and artist genres
+
+Revision ID: a81f4d6c3e90
+Revises: 5f3c8e1b7a24
+Create Date: 2021-01-20 10:16:54.823311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81f4d6c3e90'
+down_revision = '5f3c8e1b7a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # genre filters (genres @> / && ARRAY[...]) use these instead of scanning
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
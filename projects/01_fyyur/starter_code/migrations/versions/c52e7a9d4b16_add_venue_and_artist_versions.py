@@ -0,0 +1,28 @@
+"""add row versions to venues and artists
+
+Revision ID: c52e7a9d4b16
+Revises: a81f4d6c3e90
+Create Date: 2021-01-21 09:42:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52e7a9d4b16'
+down_revision = 'a81f4d6c3e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # every UPDATE bumps the version, an edit form saved at an older version
+    # is refused. existing rows start at 1
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
@@ -0,0 +1,39 @@
+"""delete shows and show statistics with their venue or artist
+
+Revision ID: e4b7c9a2d613
+Revises: 9d2a6e4f1c58
+Create Date: 2021-01-16 11:27:48.590316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c9a2d613'
+down_revision = '9d2a6e4f1c58'
+branch_labels = None
+depends_on = None
+
+# (table, constraint, column, referenced table), the constraint names are
+# the PostgreSQL defaults of the tables created without explicit names
+FOREIGN_KEYS = [
+    ('Shows', 'Shows_artist_id_fkey', 'artist_id', 'Artist'),
+    ('Shows', 'Shows_venue_id_fkey', 'venue_id', 'Venue'),
+    ('VenueShowStats', 'VenueShowStats_venue_id_fkey', 'venue_id', 'Venue'),
+    ('ArtistShowStats', 'ArtistShowStats_artist_id_fkey', 'artist_id', 'Artist'),
+]
+
+
+def _replace_foreign_keys(ondelete):
+    for table, name, column, referenced in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referenced, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _replace_foreign_keys(None)
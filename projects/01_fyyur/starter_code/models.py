@@ -1,15 +1,32 @@
+import datetime
+
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from database import PooledSQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import DDL, event
 from sqlalchemy.types import ARRAY
 
 app = Flask(__name__)
-db = SQLAlchemy(app)
+# the configuration is loaded before the extension is bound, so the engine is
+# built from the pool settings in config.py
+app.config.from_object('config')
+db = PooledSQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# the trigram indexes used by the name search need the pg_trgm extension
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # area listing groups and orders venues by location
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        # genre filters (genres @> / && ARRAY[...]) on PostgreSQL
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
@@ -17,36 +34,99 @@ class Venue(db.Model):
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(350))
-    genres = db.Column(ARRAY(db.String), nullable=True)
+    # ARRAY on PostgreSQL, JSON on SQLite so the tests can run without a server
+    genres = db.Column(ARRAY(db.String).with_variant(db.JSON, 'sqlite'), nullable=True)
     facebook_link = db.Column(db.String(200))
     website = db.Column(db.String(200))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(120), default='no details provided')
-    shows = db.relationship('Shows', backref='venue', lazy=True)
+    shows = db.relationship('Shows', backref='venue', lazy=True, passive_deletes=True)
+    # bumped by every UPDATE, the edit forms send it back so a save based on
+    # stale values is refused instead of overwriting a concurrent edit
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(350))
-    genres = db.Column(ARRAY(db.String(120)))
+    genres = db.Column(ARRAY(db.String(120)).with_variant(db.JSON, 'sqlite'))
     facebook_link = db.Column(db.String(200))
     website = db.Column(db.String(200))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(120), default='no details provided')
-    shows = db.relationship('Shows', backref='artist', lazy=True)
+    shows = db.relationship('Shows', backref='artist', lazy=True, passive_deletes=True)
+    # bumped by every UPDATE, the edit forms send it back so a save based on
+    # stale values is refused instead of overwriting a concurrent edit
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 
+DEFAULT_SHOW_DURATION = datetime.timedelta(hours=2)
+
+
+def _default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
+
 class Shows(db.Model):
     __tablename__ = 'Shows'
+    __table_args__ = (
+        # venue pages and the area listing filter shows by venue and time
+        db.Index('ix_Shows_venue_id_start_time', 'venue_id', 'start_time'),
+        # artist pages filter shows by artist and time
+        db.Index('ix_Shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows seeks and orders on (start_time, id)
+        db.Index('ix_Shows_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    # the database removes the shows of a deleted venue or artist
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # shows without an explicit end last DEFAULT_SHOW_DURATION
+    end_time = db.Column(db.DateTime, nullable=False, default=_default_end_time)
+
+
+# a venue or an artist cannot be booked for two overlapping shows. on
+# PostgreSQL the exclusion constraints enforce it and their GiST indexes
+# answer overlap lookups, availability.py keeps an in-memory index otherwise
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+for column in ('venue_id', 'artist_id'):
+    event.listen(Shows.__table__, 'after_create', DDL(
+        'ALTER TABLE "Shows" ADD CONSTRAINT "ex_Shows_{0}_overlap" '
+        'EXCLUDE USING gist ({0} WITH =, tsrange(start_time, end_time) WITH &&)'.format(column)
+    ).execute_if(dialect='postgresql'))
+
+
+class VenueShowStats(db.Model):
+    # show counts per venue, maintained by stats.py
+    __tablename__ = 'VenueShowStats'
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime, index=True)
+
+
+class ArtistShowStats(db.Model):
+    # show counts per artist, maintained by stats.py
+    __tablename__ = 'ArtistShowStats'
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime, index=True)
@@ -0,0 +1,125 @@
+import json
+import logging
+import time
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('sql_profiler')
+
+
+# ----------------------------------------------------------------------------#
+# Per-request SQL profiler.
+#
+# Counts the statements a request runs and the time spent in the database,
+# adds them to the response as a Server-Timing header and logs requests over
+# the configured thresholds as one JSON object per line, e.g.
+#   profiler = SQLProfiler(app)
+# Settings (app.config):
+#   SQL_PROFILER_ENABLED      profile requests, True by default
+#   SQL_PROFILER_SLOW_MS      log requests spending more ms in the database
+#   SQL_PROFILER_MAX_QUERIES  log requests running more statements (N+1)
+#   SQL_PROFILER_TOP          number of slowest statements logged
+#
+# This file is copied as it is into the three projects, keep them in sync:
+#   01_fyyur/starter_code/profiler.py
+#   02_trivia_api/starter/backend/profiler.py
+#   03_coffee_shop_full_stack/starter_code/backend/src/profiler.py
+# Only the fyyur and trivia copies are covered by tests.
+# ----------------------------------------------------------------------------#
+
+class RequestProfile(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.statements.append((seconds, statement))
+
+    def slowest(self, count):
+        statements = sorted(self.statements, key=lambda item: item[0], reverse=True)[:count]
+        return [{'ms': round(seconds * 1000, 3), 'statement': ' '.join(statement.split())[:500]}
+                for seconds, statement in statements]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('sql_profiler_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['sql_profiler_started'].pop()
+    # statements outside of a profiled request (CLI commands, streamed
+    # responses after the request ended) are not recorded
+    profile = g.get('sql_profile') if g else None
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('sql_profiler_started'):
+        connection.info['sql_profiler_started'].pop()
+
+
+class SQLProfiler(object):
+
+    _listening = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER_ENABLED', True)
+        app.config.setdefault('SQL_PROFILER_SLOW_MS', 500)
+        app.config.setdefault('SQL_PROFILER_MAX_QUERIES', 50)
+        app.config.setdefault('SQL_PROFILER_TOP', 3)
+
+        # the listeners are registered on the Engine class, so engines created
+        # later (Flask-SQLAlchemy creates them on first use) are covered too
+        if not SQLProfiler._listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            SQLProfiler._listening = True
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    @staticmethod
+    def _before_request():
+        if current_app.config['SQL_PROFILER_ENABLED']:
+            g.sql_profile = RequestProfile()
+
+    @staticmethod
+    def _after_request(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        config = current_app.config
+        db_ms = profile.db_seconds * 1000
+        request_ms = (time.perf_counter() - profile.started) * 1000
+        response.headers.add('Server-Timing', 'db;dur={:.3f};desc="{} queries"'.format(db_ms, profile.queries))
+        response.headers.add('Server-Timing', 'app;dur={:.3f}'.format(request_ms))
+
+        if db_ms > config['SQL_PROFILER_SLOW_MS'] or profile.queries > config['SQL_PROFILER_MAX_QUERIES']:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'route': request.url_rule.rule if request.url_rule is not None else None,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': profile.queries,
+                'db_ms': round(db_ms, 3),
+                'request_ms': round(request_ms, 3),
+                'slowest': profile.slowest(config['SQL_PROFILER_TOP']),
+            }))
+        return response
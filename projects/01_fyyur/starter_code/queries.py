@@ -0,0 +1,212 @@
+import base64
+import datetime
+from itertools import groupby
+
+from models import db, Venue, Artist, Shows, VenueShowStats, ArtistShowStats
+
+SHOWS_PER_PAGE = 30
+
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+def venue_areas(current_date=None):
+    # builds the /venues listing grouped by (city, state) from a single query.
+    # the upcoming show counts come from the maintained VenueShowStats rows,
+    # unless a show of the venue started since the last roll-show-stats run,
+    # then they are counted from its shows as _show_counts does. the rows are
+    # ordered by location so they can be grouped without extra queries
+    if current_date is None:
+        current_date = datetime.datetime.now()
+    counted = db.select([db.func.count(Shows.id)]) \
+        .where(db.and_(Shows.venue_id == Venue.id, Shows.start_time >= current_date)).as_scalar()
+    upcoming_shows_count = db.case([
+        (VenueShowStats.next_show_time == None, VenueShowStats.upcoming_shows_count),  # noqa: E711
+        (VenueShowStats.next_show_time > current_date, VenueShowStats.upcoming_shows_count),
+    ], else_=counted)
+    rows = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+                            db.func.coalesce(upcoming_shows_count, 0)) \
+        .outerjoin(VenueShowStats, VenueShowStats.venue_id == Venue.id) \
+        .order_by(Venue.city, Venue.state, Venue.id) \
+        .all()
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': venue[2],
+                'name': venue[3],
+                'num_upcoming_shows': venue[4]
+            } for venue in venues]
+        })
+
+    return areas
+
+
+def _split_shows(rows, current_date, counterpart):
+    # splits the joined show columns of a detail query into past and upcoming
+    # shows, rows without a show come from the outer join and are skipped
+    past_shows = []
+    upcoming_shows = []
+    for row in rows:
+        start_time, counterpart_id, counterpart_name, counterpart_image_link = row[2:]
+        if start_time is None:
+            continue
+        show = {
+            counterpart + '_id': counterpart_id,
+            counterpart + '_name': counterpart_name,
+            counterpart + '_image_link': counterpart_image_link,
+            'start_time': start_time
+        }
+        if start_time < current_date:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+def _show_counts(stats, past_shows, upcoming_shows, current_date):
+    # the counts are read from the statistics row unless a show started since
+    # the last roll-show-stats run, then the split lists are the fresh answer
+    if stats is not None and (stats.next_show_time is None or stats.next_show_time > current_date):
+        return stats.past_shows_count, stats.upcoming_shows_count
+    return len(past_shows), len(upcoming_shows)
+
+
+def venue_details(venue_id, current_date=None):
+    # loads a venue together with all of its shows and the artist columns the
+    # page renders in one query, returns None when the venue does not exist
+    if current_date is None:
+        current_date = datetime.datetime.now()
+
+    rows = db.session.query(Venue, VenueShowStats, Shows.start_time, Artist.id, Artist.name, Artist.image_link) \
+        .outerjoin(VenueShowStats, VenueShowStats.venue_id == Venue.id) \
+        .outerjoin(Shows, Shows.venue_id == Venue.id) \
+        .outerjoin(Artist, Artist.id == Shows.artist_id) \
+        .filter(Venue.id == venue_id) \
+        .order_by(Shows.start_time) \
+        .all()
+    if not rows:
+        return None
+
+    venue = rows[0][0]
+    past_shows, upcoming_shows = _split_shows(rows, current_date, 'artist')
+    past_shows_count, upcoming_shows_count = _show_counts(rows[0][1], past_shows, upcoming_shows, current_date)
+    return {
+        'id': venue.id,
+        'name': venue.name,
+        'genres': venue.genres,
+        'city': venue.city,
+        'state': venue.state,
+        'address': venue.address,
+        'phone': venue.phone,
+        'website': venue.website,
+        'facebook_link': venue.facebook_link,
+        'image_link': venue.image_link,
+        'seeking_talent': venue.seeking_talent,
+        'seeking_description': venue.seeking_description,
+        'past_shows': past_shows,
+        'upcoming_shows': upcoming_shows,
+        'past_shows_count': past_shows_count,
+        'upcoming_shows_count': upcoming_shows_count
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Artists.
+# ----------------------------------------------------------------------------#
+
+def artist_list():
+    # ids and names of all artists for the /artists listing
+    return [{
+        'id': artist[0],
+        'name': artist[1]
+    } for artist in db.session.query(Artist.id, Artist.name).order_by(Artist.id)]
+
+
+def artist_details(artist_id, current_date=None):
+    # loads an artist together with all of its shows and the venue columns the
+    # page renders in one query, returns None when the artist does not exist
+    if current_date is None:
+        current_date = datetime.datetime.now()
+
+    rows = db.session.query(Artist, ArtistShowStats, Shows.start_time, Venue.id, Venue.name, Venue.image_link) \
+        .outerjoin(ArtistShowStats, ArtistShowStats.artist_id == Artist.id) \
+        .outerjoin(Shows, Shows.artist_id == Artist.id) \
+        .outerjoin(Venue, Venue.id == Shows.venue_id) \
+        .filter(Artist.id == artist_id) \
+        .order_by(Shows.start_time) \
+        .all()
+    if not rows:
+        return None
+
+    artist = rows[0][0]
+    past_shows, upcoming_shows = _split_shows(rows, current_date, 'venue')
+    past_shows_count, upcoming_shows_count = _show_counts(rows[0][1], past_shows, upcoming_shows, current_date)
+    return {
+        'id': artist.id,
+        'name': artist.name,
+        'genres': artist.genres,
+        'city': artist.city,
+        'state': artist.state,
+        'phone': artist.phone,
+        'website': artist.website,
+        'facebook_link': artist.facebook_link,
+        'image_link': artist.image_link,
+        'seeking_venue': artist.seeking_venue,
+        'seeking_description': artist.seeking_description,
+        'past_shows': past_shows,
+        'upcoming_shows': upcoming_shows,
+        'past_shows_count': past_shows_count,
+        'upcoming_shows_count': upcoming_shows_count
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+def encode_cursor(start_time, show_id):
+    # opaque cursor pointing at the last show of a page
+    value = '{}|{}'.format(start_time.isoformat(), show_id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # inverse of encode_cursor, raises ValueError for a malformed cursor
+    start_time, show_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.datetime.fromisoformat(start_time), int(show_id)
+
+
+def shows_page(cursor=None, per_page=SHOWS_PER_PAGE):
+    # one page of the /shows listing ordered by (start_time, id).
+    # the page starts after the show the cursor points at so the query can
+    # seek with the index instead of skipping rows, and only the columns the
+    # template renders are selected. returns the shows and the next cursor
+    query = db.session.query(Shows.id, Shows.start_time, Shows.venue_id, Venue.name,
+                             Shows.artist_id, Artist.name, Artist.image_link) \
+        .join(Venue, Venue.id == Shows.venue_id) \
+        .join(Artist, Artist.id == Shows.artist_id)
+    if cursor is not None:
+        query = query.filter(db.tuple_(Shows.start_time, Shows.id) > decode_cursor(cursor))
+
+    # one extra row tells whether there is a next page
+    rows = query.order_by(Shows.start_time, Shows.id).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+    data = [{
+        'venue_id': row[2],
+        'venue_name': row[3],
+        'artist_id': row[4],
+        'artist_name': row[5],
+        'artist_image_link': row[6],
+        'start_time': row[1]
+    } for row in rows]
+    return data, next_cursor
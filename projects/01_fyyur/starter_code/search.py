@@ -0,0 +1,64 @@
+from models import db, Venue, Artist
+
+SEARCH_RESULTS_LIMIT = 50
+
+
+# ----------------------------------------------------------------------------#
+# Ranked name search.
+# ----------------------------------------------------------------------------#
+
+def _escape_like(term):
+    # escapes the LIKE wildcards so a search for "50%" matches literally
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _rank(column, term):
+    # ordering expression, best match first.
+    # PostgreSQL ranks with pg_trgm word similarity, which the trigram index
+    # created in migration 3b8f2c1d9a47 supports; SQLite has no trigram
+    # support so exact and prefix matches are ranked ahead of the rest
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.word_similarity(term, column).desc()
+
+    name = db.func.lower(column)
+    escaped = _escape_like(term.lower())
+    return db.case([
+        (name == term.lower(), 0),
+        (name.like(escaped + '%', escape='\\'), 1),
+        (name.like('% ' + escaped + '%', escape='\\'), 2),
+    ], else_=3)
+
+
+def _search(model, term, limit):
+    # case-insensitive partial name search returning the best `limit` matches
+    # and their count in a single query. the count stops at limit + 1 matches
+    # instead of counting them all, so a broad term reports `limit` with
+    # `more` set ("50+"). ranking still reads every match
+    term = (term or '').strip()
+    match = model.name.ilike('%' + _escape_like(term) + '%', escape='\\')
+    matches = db.select([db.func.count()]) \
+        .select_from(db.select([model.id]).where(match).limit(limit + 1).alias()) \
+        .label('matches')
+    rows = db.session.query(model.id, model.name, matches) \
+        .filter(match) \
+        .order_by(_rank(model.name, term), model.name, model.id) \
+        .limit(limit) \
+        .all()
+    count = rows[0][2] if rows else 0
+
+    return {
+        'count': min(count, limit),
+        'more': count > limit,
+        'data': [{
+            'id': row[0],
+            'name': row[1]
+        } for row in rows]
+    }
+
+
+def search_venues(term, limit=SEARCH_RESULTS_LIMIT):
+    return _search(Venue, term, limit)
+
+
+def search_artists(term, limit=SEARCH_RESULTS_LIMIT):
+    return _search(Artist, term, limit)
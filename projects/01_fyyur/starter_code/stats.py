@@ -0,0 +1,156 @@
+import datetime
+
+import click
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Shows, VenueShowStats, ArtistShowStats
+from cache import page_cache
+
+REFRESH_CHUNK_SIZE = 1000
+# dialects with INSERT ... ON CONFLICT DO UPDATE. SQLAlchemy 1.3 has no
+# SQLite upsert, SQLite then keeps update-then-insert, which cannot race as
+# it runs one write transaction at a time
+UPSERT_DIALECTS = {name: dialect for name, dialect in (('postgresql', postgresql), ('sqlite', sqlite))
+                   if hasattr(dialect, 'insert')}
+
+# entity -> (statistics table, its key column, the matching Shows column)
+STATS = {
+    'venue': (VenueShowStats.__table__, VenueShowStats.__table__.c.venue_id, Shows.__table__.c.venue_id),
+    'artist': (ArtistShowStats.__table__, ArtistShowStats.__table__.c.artist_id, Shows.__table__.c.artist_id),
+}
+
+
+# ----------------------------------------------------------------------------#
+# Incremental updates.
+# ----------------------------------------------------------------------------#
+
+def _record_show(connection, entity, entity_id, start_time, current_date):
+    # counts one new show in the statistics row of a venue or artist,
+    # creating the row on the first show
+    table, key, _ = STATS[entity]
+    upcoming = start_time >= current_date
+    if not upcoming:
+        values = {'past_shows_count': table.c.past_shows_count + 1}
+    else:
+        values = {
+            'upcoming_shows_count': table.c.upcoming_shows_count + 1,
+            'next_show_time': db.case([
+                (table.c.next_show_time == None, start_time),  # noqa: E711
+                (table.c.next_show_time > start_time, start_time),
+            ], else_=table.c.next_show_time),
+        }
+    row = {
+        key.name: entity_id,
+        'past_shows_count': 0 if upcoming else 1,
+        'upcoming_shows_count': 1 if upcoming else 0,
+        'next_show_time': start_time if upcoming else None,
+    }
+    # one upsert, so two transactions adding the first show of the same
+    # venue cannot both try to insert its row
+    dialect = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect is not None:
+        connection.execute(dialect.insert(table).values(row).on_conflict_do_update(
+            index_elements=[key], set_=values))
+    elif connection.execute(table.update().where(key == entity_id).values(**values)).rowcount == 0:
+        connection.execute(table.insert().values(row))
+
+
+@event.listens_for(Shows, 'after_insert')
+def _show_inserted(mapper, connection, show):
+    # keeps the statistics up to date in the same transaction as the show
+    current_date = datetime.datetime.now()
+    _record_show(connection, 'venue', show.venue_id, show.start_time, current_date)
+    _record_show(connection, 'artist', show.artist_id, show.start_time, current_date)
+
+
+@event.listens_for(Shows, 'after_delete')
+def _show_deleted(mapper, connection, show):
+    refresh(connection, venue_ids=[show.venue_id], artist_ids=[show.artist_id])
+
+
+# ----------------------------------------------------------------------------#
+# Set-based refresh.
+# ----------------------------------------------------------------------------#
+
+def _refresh_entities(connection, entity, entity_ids, current_date):
+    # recomputes the rows of the given ids (all of them for None) from Shows
+    # with one DELETE and one INSERT ... SELECT per chunk
+    table, key, show_key = STATS[entity]
+    upcoming = Shows.start_time >= current_date
+    select = db.select([
+        show_key,
+        db.func.sum(db.case([(upcoming, 0)], else_=1)),
+        db.func.sum(db.case([(upcoming, 1)], else_=0)),
+        db.func.min(db.case([(upcoming, Shows.start_time)])),
+    ]).group_by(show_key)
+    columns = [key.name, 'past_shows_count', 'upcoming_shows_count', 'next_show_time']
+
+    if entity_ids is None:
+        connection.execute(table.delete())
+        connection.execute(table.insert().from_select(columns, select))
+        return
+
+    entity_ids = sorted(set(entity_ids))
+    for start in range(0, len(entity_ids), REFRESH_CHUNK_SIZE):
+        chunk = entity_ids[start:start + REFRESH_CHUNK_SIZE]
+        connection.execute(table.delete().where(key.in_(chunk)))
+        connection.execute(table.insert().from_select(columns, select.where(show_key.in_(chunk))))
+
+
+def refresh(connection=None, venue_ids=(), artist_ids=(), current_date=None):
+    # recomputes the statistics of the given venues and artists, None
+    # rebuilds every row. used after set-based writes to Shows
+    if connection is None:
+        connection = db.session.connection()
+    if current_date is None:
+        current_date = datetime.datetime.now()
+    if venue_ids is None or venue_ids:
+        _refresh_entities(connection, 'venue', venue_ids, current_date)
+    if artist_ids is None or artist_ids:
+        _refresh_entities(connection, 'artist', artist_ids, current_date)
+
+
+def roll(current_date=None):
+    # moves shows that started since the last run from upcoming to past.
+    # only the venues and artists whose next show time has passed are
+    # recomputed, found through the next_show_time indexes
+    if current_date is None:
+        current_date = datetime.datetime.now()
+
+    venue_ids = [row[0] for row in db.session.query(VenueShowStats.venue_id)
+                 .filter(VenueShowStats.next_show_time <= current_date)]
+    artist_ids = [row[0] for row in db.session.query(ArtistShowStats.artist_id)
+                  .filter(ArtistShowStats.next_show_time <= current_date)]
+    refresh(venue_ids=venue_ids, artist_ids=artist_ids, current_date=current_date)
+    db.session.commit()
+    return venue_ids, artist_ids
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+def roll_command():
+    """Move past shows out of the upcoming counts, run it from cron every minute."""
+    venue_ids, artist_ids = roll()
+    # reaches a server's pages only with the redis backend, with the lru
+    # backend they are at most CACHE_TTL seconds stale (see config.py)
+    if venue_ids or artist_ids:
+        page_cache.invalidate('venues', *['venue:{}'.format(venue_id) for venue_id in venue_ids] +
+                              ['artist:{}'.format(artist_id) for artist_id in artist_ids])
+    click.echo('rolled {} venues and {} artists'.format(len(venue_ids), len(artist_ids)))
+
+
+def rebuild_command():
+    """Recompute the show statistics of every venue and artist."""
+    refresh(venue_ids=None, artist_ids=None)
+    db.session.commit()
+    # see roll_command about the cache backends
+    page_cache.clear()
+    click.echo('rebuilt show statistics')
+
+
+def register_commands(app):
+    app.cli.command('roll-show-stats')(roll_command)
+    app.cli.command('rebuild-show-stats')(rebuild_command)
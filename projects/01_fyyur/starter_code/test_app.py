@@ -0,0 +1,976 @@
+import io
+import os
+import json
+import time
+import fnmatch
+import tempfile
+import threading
+import unittest
+import datetime
+
+from sqlalchemy import event, exc, create_engine
+from sqlalchemy.engine.url import make_url
+
+from app import app
+from models import db, Venue, Artist, Shows, VenueShowStats, ArtistShowStats
+from queries import venue_areas, artist_details, shows_page
+from search import search_artists
+from cache import page_cache, LRUBackend, RedisBackend, PageCache
+from database import pool_metrics, TimedQueuePool
+from importer import import_rows, read_rows, _insert
+from exporter import export_lines
+import stats
+import babel.dates
+from formatting import format_datetime, format_datetimes, format_show_times
+import deletes
+import facets
+import availability
+from availability import IntervalIndex
+
+
+class QueryCounter(object):
+    """Counts the SQL statements sent to the database while it is active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and bind the app to a throwaway database."""
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FYYUR_TEST_DATABASE_URL', 'sqlite://')
+        self.client = self.app.test_client
+        self.now = datetime.datetime.now()
+        page_cache.clear()
+        availability.clear()
+        facets.reset()
+
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def seed_venues(self, cities, venues_per_city=2):
+        with self.app.app_context():
+            artist = Artist(name='The Wild Sax Band', city='San Francisco', state='CA',
+                            genres=['Jazz'])
+            db.session.add(artist)
+            for city in range(cities):
+                for number in range(venues_per_city):
+                    venue = Venue(name='Venue {} {}'.format(city, number), city='City {}'.format(city),
+                                  state='CA', address='1015 Folsom Street', genres=['Jazz'])
+                    # the artist plays the venues one after the other
+                    offset = datetime.timedelta(hours=3 * (city * venues_per_city + number))
+                    venue.shows = [
+                        Shows(artist=artist, start_time=self.now + datetime.timedelta(days=1) + offset),
+                        Shows(artist=artist, start_time=self.now - datetime.timedelta(days=1) - offset),
+                    ]
+                    db.session.add(venue)
+            db.session.commit()
+
+    def count_queries(self, url):
+        page_cache.clear()
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        return counter.count
+
+    def test_get_venues(self):
+        self.seed_venues(cities=2)
+        res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'City 0, CA', res.data)
+        self.assertIn(b'Venue 1 1', res.data)
+
+    def test_venue_areas_upcoming_shows(self):
+        self.seed_venues(cities=2)
+        with self.app.app_context():
+            areas = venue_areas()
+
+        self.assertEqual([(area['city'], area['state']) for area in areas], [('City 0', 'CA'), ('City 1', 'CA')])
+        self.assertEqual(len(areas[0]['venues']), 2)
+        self.assertEqual(areas[0]['venues'][0]['num_upcoming_shows'], 1)
+
+    def test_get_venues_query_count_is_constant(self):
+        self.seed_venues(cities=1)
+        few_cities = self.count_queries('/venues')
+        self.seed_venues(cities=20)
+        many_cities = self.count_queries('/venues')
+
+        self.assertEqual(few_cities, 1)
+        self.assertEqual(many_cities, few_cities)
+
+    def test_show_venue(self):
+        self.seed_venues(cities=1)
+        res = self.client().get('/venues/1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'1 Upcoming Show', res.data)
+        self.assertIn(b'1 Past Show', res.data)
+        self.assertIn(b'The Wild Sax Band', res.data)
+
+    def test_show_venue_not_found(self):
+        res = self.client().get('/venues/777777')
+
+        self.assertEqual(res.status_code, 302)
+
+    def test_artist_details(self):
+        self.seed_venues(cities=2)
+        with self.app.app_context():
+            data = artist_details(1)
+
+        self.assertEqual(data['name'], 'The Wild Sax Band')
+        self.assertEqual(data['past_shows_count'], 4)
+        self.assertEqual(data['upcoming_shows_count'], 4)
+        self.assertEqual(data['upcoming_shows'][0]['venue_name'], 'Venue 0 0')
+
+    def test_detail_pages_query_count_is_constant(self):
+        self.seed_venues(cities=1)
+        venue_few_shows = self.count_queries('/venues/1')
+        artist_few_shows = self.count_queries('/artists/1')
+        self.seed_venues(cities=20)
+        artist_many_shows = self.count_queries('/artists/1')
+
+        self.assertEqual(venue_few_shows, 1)
+        self.assertEqual(artist_few_shows, 1)
+        self.assertEqual(artist_many_shows, artist_few_shows)
+
+    def test_shows_pages(self):
+        self.seed_venues(cities=20)
+        with self.app.app_context():
+            first_page, cursor = shows_page(per_page=30)
+            second_page, last_cursor = shows_page(cursor, per_page=30)
+            third_page, no_cursor = shows_page(last_cursor, per_page=30)
+
+        self.assertEqual(len(first_page), 30)
+        self.assertEqual(len(second_page), 30)
+        self.assertEqual(len(third_page), 20)
+        self.assertIsNone(no_cursor)
+        self.assertLessEqual(first_page[-1]['start_time'], second_page[0]['start_time'])
+
+    def test_get_shows(self):
+        self.seed_venues(cities=1)
+        res = self.client().get('/shows')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Wild Sax Band', res.data)
+        self.assertIn(b'Venue 0 1', res.data)
+
+    def test_get_shows_invalid_cursor(self):
+        res = self.client().get('/shows?cursor=not-a-cursor')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_shows_query_count_is_constant(self):
+        self.seed_venues(cities=1)
+        few_shows = self.count_queries('/shows')
+        self.seed_venues(cities=20)
+        many_shows = self.count_queries('/shows')
+
+        self.assertEqual(few_shows, 1)
+        self.assertEqual(many_shows, few_shows)
+
+    def seed_artists(self, names):
+        with self.app.app_context():
+            for name in names:
+                db.session.add(Artist(name=name, city='San Francisco', state='CA', genres=['Jazz']))
+            db.session.commit()
+
+    def test_search_artists_is_case_insensitive_and_ranked(self):
+        self.seed_artists(['Guns N Petals', 'Matt Quevado', 'The Wild Sax Band', 'Bandit', 'band'])
+        with self.app.app_context():
+            results = search_artists('BAND')
+
+        self.assertEqual(results['count'], 3)
+        self.assertEqual([artist['name'] for artist in results['data']], ['band', 'Bandit', 'The Wild Sax Band'])
+
+    def test_search_artists_count_stops_after_the_limit(self):
+        self.seed_artists(['Artist {}'.format(number) for number in range(12)])
+        with self.app.app_context():
+            results = search_artists('artist', limit=5)
+            exact = search_artists('artist', limit=12)
+
+        self.assertEqual((results['count'], results['more']), (5, True))
+        self.assertEqual(len(results['data']), 5)
+        self.assertEqual((exact['count'], exact['more']), (12, False))
+        res = self.client().post('/artists/search', data={'search_term': 'artist 1'})
+        self.assertIn(b'"artist 1": 3</h3>', res.data)
+
+    def test_search_artists_escapes_wildcards(self):
+        self.seed_artists(['100% Jazz', '100 Jazz'])
+        with self.app.app_context():
+            results = search_artists('100%')
+
+        self.assertEqual([artist['name'] for artist in results['data']], ['100% Jazz'])
+
+    def test_search_venues(self):
+        self.seed_venues(cities=1)
+        res = self.client().post('/venues/search', data={'search_term': 'venue 0'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Number of search results for "venue 0": 2', res.data)
+
+    def test_search_artists_no_results(self):
+        res = self.client().post('/artists/search', data={'search_term': 'nothing'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b': 0</h3>', res.data)
+
+    def test_cached_page_skips_the_database(self):
+        self.seed_venues(cities=1)
+        self.count_queries('/venues/1')
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                res = self.client().get('/venues/1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(counter.count, 0)
+        self.assertGreaterEqual(page_cache.stats()['hits'], 1)
+
+    def test_create_show_invalidates_affected_pages(self):
+        self.seed_venues(cities=1)
+        self.client().get('/venues/1')
+        self.client().get('/venues/2')
+        res = self.client().post('/shows/create', data={
+            'artist_id': '1',
+            'venue_id': '1',
+            'start_time': (self.now + datetime.timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.assertEqual(res.status_code, 200)
+
+        self.assertIn(b'2 Upcoming Shows', self.client().get('/venues/1').data)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                self.client().get('/venues/2')
+        self.assertEqual(counter.count, 0)
+
+    def test_get_cache_metrics(self):
+        res = self.client().get('/metrics/cache')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(res.get_json()), {'backend', 'entries', 'hits', 'misses', 'evictions'})
+
+    def test_server_timing_header(self):
+        self.seed_venues(cities=1)
+        res = self.client().get('/venues/1')
+
+        timings = res.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('db;dur='))
+        self.assertIn('desc="1 queries"', timings[0])
+        self.assertTrue(timings[1].startswith('app;dur='))
+
+    def test_slow_requests_are_logged(self):
+        self.seed_venues(cities=1)
+        self.app.config['SQL_PROFILER_MAX_QUERIES'] = 0
+        self.addCleanup(self.app.config.update, SQL_PROFILER_MAX_QUERIES=50)
+
+        with self.assertLogs('sql_profiler', level='WARNING') as logs:
+            self.client().get('/artists/1')
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['route'], entry['queries'], entry['status']), ('/artists/<int:artist_id>', 1, 200))
+        self.assertTrue(entry['slowest'][0]['statement'].startswith('SELECT "Artist".id'))
+
+    def test_get_pool_metrics(self):
+        self.client().get('/venues')
+        res = self.client().get('/metrics/pool')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreaterEqual(res.get_json()['checkouts'], 1)
+
+    def test_engine_options_for_server_databases(self):
+        self.app.config['DATABASE_POOL_SIZE'] = 7
+        self.app.config['DATABASE_STATEMENT_TIMEOUT'] = 5000
+        self.addCleanup(self.app.config.update, DATABASE_POOL_SIZE=5, DATABASE_STATEMENT_TIMEOUT=0)
+
+        url, options = db.apply_driver_hacks(self.app, make_url('postgresql://fyyur@localhost/fyyur'), {})
+        self.assertEqual(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 7)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+        url, options = db.apply_driver_hacks(self.app, make_url('sqlite://'), {})
+        self.assertNotIn('pool_size', options)
+
+    def test_pool_metrics_record_waits_and_overflow(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=1, max_overflow=1, pool_timeout=0.05)
+        self.addCleanup(setattr, pool_metrics, 'pool', pool_metrics.pool)
+        pool_metrics.watch(engine)
+        pool_metrics.reset()
+
+        first, second = engine.connect(), engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        stats = pool_metrics.stats()
+        first.close()
+        second.close()
+
+        self.assertEqual((stats['checkouts'], stats['overflow'], stats['peak_overflow']), (2, 1, 1))
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_ms_max'], 50)
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def venue_row(self, **values):
+        row = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+               'phone': '123-123-1234', 'genres': ['Jazz', 'Reggae'], 'website': 'https://www.themusicalhop.com',
+               'facebook_link': 'https://www.facebook.com/TheMusicalHop', 'image_link': 'https://example.com/hop.jpg',
+               'seeking': True, 'seeking_description': 'We are on the lookout for a local artist'}
+        row.update(values)
+        return row
+
+    def test_import_venues_jsonl(self):
+        rows = [self.venue_row(), self.venue_row(state='XX'), self.venue_row(name='Park Square Live Music')]
+        path = self.write_file('.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        errors_path = self.write_file('.jsonl', '')
+
+        result = self.app.test_cli_runner().invoke(args=['import-venues', path, '--batch-size', '2',
+                                                         '--errors', errors_path])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('imported 2 of 3 rows', result.output)
+        with open(errors_path) as stream:
+            rejected = [json.loads(line) for line in stream]
+        self.assertEqual([row['line'] for row in rejected], [2])
+        self.assertIn('state', rejected[0]['errors'])
+        with self.app.app_context():
+            venue = Venue.query.filter_by(name='Park Square Live Music').one()
+            self.assertEqual(venue.genres, ['Jazz', 'Reggae'])
+            self.assertTrue(venue.seeking_talent)
+
+    def test_import_shows_csv_rejects_unknown_ids(self):
+        self.seed_venues(cities=1)
+        path = self.write_file('.csv', 'artist_id,venue_id,start_time\n'
+                                       '1,1,2035-04-01 20:00:00\n'
+                                       '1,777,2035-04-01 20:00:00\n'
+                                       '1,2,not a date\n')
+        rejected = []
+
+        with self.app.app_context():
+            with open(path) as stream:
+                report = import_rows('shows', read_rows(stream, 'csv'),
+                                     on_error=lambda line, row, errors: rejected.append((line, sorted(errors))))
+            shows_count = Shows.query.count()
+
+        self.assertEqual((report.rows, report.inserted, report.rejected), (3, 1, 2))
+        self.assertEqual(rejected, [(3, ['start_time']), (2, ['venue_id'])])
+        self.assertEqual(shows_count, 5)
+
+    def test_import_rejects_invalid_json_lines(self):
+        path = self.write_file('.jsonl', json.dumps(self.venue_row()) + '\n'
+                                         '{"name": "The Dueling Pianos Bar", "city": \n' +
+                               json.dumps(self.venue_row(name='Park Square Live Music')) + '\n')
+        result = self.app.test_cli_runner().invoke(args=['import-venues', path])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('imported 2 of 3 rows', result.output)
+        self.assertIn('"line": 2', result.output)
+        self.assertIn('invalid JSON', result.output)
+
+    def test_import_rejects_json_lines_that_are_not_objects(self):
+        path = self.write_file('.jsonl', '[1, 2]\n' + json.dumps(self.venue_row()) + '\n"The Dueling Pianos Bar"\n')
+        rejected = []
+
+        with self.app.app_context():
+            with open(path) as stream:
+                report = import_rows('venues', read_rows(stream, 'jsonl'),
+                                     on_error=lambda line, row, errors: rejected.append((line, row, errors)))
+
+        self.assertEqual((report.rows, report.inserted, report.rejected), (3, 1, 2))
+        self.assertEqual(rejected, [(1, [1, 2], {'row': ['not a JSON object']}),
+                                    (3, 'The Dueling Pianos Bar', {'row': ['not a JSON object']})])
+
+    def test_import_keeps_batch_when_a_row_fails_in_the_database(self):
+        rejected = []
+        with self.app.app_context():
+            inserted = _insert(Venue.__table__, [
+                {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street'},
+                {'name': None, 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street'},
+            ], [1, 2], lambda line, row, errors: rejected.append(line))
+            venues_count = Venue.query.count()
+
+        self.assertEqual(inserted, 1)
+        self.assertEqual(rejected, [2])
+        self.assertEqual(venues_count, 1)
+
+    def test_export_venues_jsonl(self):
+        self.seed_venues(cities=2)
+        res = self.client().get('/export/venues.jsonl')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['genres'], ['Jazz'])
+        self.assertEqual((rows[0]['past_shows_count'], rows[0]['upcoming_shows_count']), (1, 1))
+
+    def test_export_shows_csv_in_chunks(self):
+        self.seed_venues(cities=3)
+        with self.app.app_context():
+            chunks = list(export_lines('shows', 'csv', chunk_size=5))
+
+        lines = ''.join(chunks).splitlines()
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(lines[0], 'id,artist_id,venue_id,start_time,upcoming')
+        self.assertEqual(len(lines), 13)
+
+    def test_exported_shows_import_again(self):
+        self.seed_venues(cities=1)
+        for format in ('jsonl', 'csv'):
+            with self.app.app_context():
+                exported = ''.join(export_lines('shows', format))
+                start_times = sorted(show.start_time.replace(microsecond=0) for show in Shows.query)
+                Shows.query.delete()
+                db.session.commit()
+
+                report = import_rows('shows', read_rows(io.StringIO(exported), format))
+                imported = sorted(show.start_time for show in Shows.query)
+
+            self.assertEqual((report.rows, report.inserted, report.rejected), (4, 4, 0), format)
+            self.assertEqual(imported, start_times, format)
+
+    def test_export_command(self):
+        self.seed_venues(cities=1)
+        result = self.app.test_cli_runner().invoke(args=['export', 'artists', '--format', 'csv'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('The Wild Sax Band', result.output)
+        self.assertIn('Jazz', result.output)
+
+    def test_export_unknown_kind(self):
+        res = self.client().get('/export/tickets.jsonl')
+
+        self.assertEqual(res.status_code, 404)
+
+    def show_stats(self, model, entity_id):
+        with self.app.app_context():
+            row = db.session.query(model).get(entity_id)
+            return row.past_shows_count, row.upcoming_shows_count, row.next_show_time
+
+    def test_show_stats_follow_created_shows(self):
+        self.seed_venues(cities=1)
+        self.assertEqual(self.show_stats(VenueShowStats, 1), (1, 1, self.now + datetime.timedelta(days=1)))
+        self.assertEqual(self.show_stats(ArtistShowStats, 1)[:2], (2, 2))
+
+        self.client().post('/shows/create', data={
+            'artist_id': '1',
+            'venue_id': '2',
+            'start_time': (self.now + datetime.timedelta(hours=3)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        past, upcoming, next_show_time = self.show_stats(VenueShowStats, 2)
+        self.assertEqual((past, upcoming), (1, 2))
+        self.assertLess(next_show_time, self.now + datetime.timedelta(days=1))
+        self.assertEqual(self.show_stats(ArtistShowStats, 1)[:2], (2, 3))
+
+    def test_roll_show_stats_moves_started_shows_to_past(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            venue_ids, artist_ids = stats.roll(current_date=self.now + datetime.timedelta(days=2))
+
+        self.assertEqual((venue_ids, artist_ids), ([1, 2], [1]))
+        self.assertEqual(self.show_stats(VenueShowStats, 1), (2, 0, None))
+        self.assertEqual(self.show_stats(ArtistShowStats, 1), (4, 0, None))
+
+    def test_detail_counts_do_not_wait_for_the_roll(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            data = artist_details(1, current_date=self.now + datetime.timedelta(days=2))
+
+        self.assertEqual((data['past_shows_count'], data['upcoming_shows_count']), (4, 0))
+
+    def test_area_counts_do_not_wait_for_the_roll(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            areas = venue_areas(current_date=self.now + datetime.timedelta(days=2))
+
+        self.assertEqual([venue['num_upcoming_shows'] for venue in areas[0]['venues']], [0, 0])
+
+    def test_imported_shows_update_show_stats(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            import_rows('shows', [{'artist_id': 1, 'venue_id': 1, 'start_time': '2035-04-01 20:00:00'}])
+
+        self.assertEqual(self.show_stats(VenueShowStats, 1)[:2], (1, 2))
+        self.assertEqual(self.show_stats(ArtistShowStats, 1)[:2], (2, 3))
+
+    def test_rebuild_show_stats_command(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            VenueShowStats.query.delete()
+            db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['rebuild-show-stats'])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.show_stats(VenueShowStats, 2)[:2], (1, 1))
+
+    def post_show(self, artist_id, venue_id, start_time, duration=''):
+        return self.client().post('/shows/create', data={
+            'artist_id': str(artist_id),
+            'venue_id': str(venue_id),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': str(duration)
+        })
+
+    def test_create_show_refuses_double_bookings(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            db.session.add(Artist(name='Guns N Petals', city='San Francisco', state='CA'))
+            db.session.commit()
+        # venue 1 hosts the artist 1 from now + 1 day for two hours
+        booked = self.now + datetime.timedelta(days=1)
+
+        res = self.post_show(2, 1, booked + datetime.timedelta(hours=1))
+        self.assertIn(b'listed: venue already booked', res.data)
+        res = self.post_show(1, 2, booked - datetime.timedelta(minutes=30), duration=60)
+        self.assertIn(b'listed: artist already booked', res.data)
+        res = self.post_show(2, 1, booked + datetime.timedelta(hours=2, seconds=1), duration=90)
+        self.assertIn(b'successfully listed', res.data)
+
+        with self.app.app_context():
+            show = Shows.query.filter_by(artist_id=2).one()
+            self.assertEqual(show.end_time - show.start_time, datetime.timedelta(minutes=90))
+
+    def test_get_free_venues(self):
+        self.seed_venues(cities=2)
+        start_time = (self.now + datetime.timedelta(days=1, hours=1)).isoformat()
+        res = self.client().get('/venues/free', query_string={'city': 'City 0', 'start_time': start_time})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['venues'], [{'id': 2, 'name': 'Venue 0 1'}])
+
+    def test_get_free_venues_loads_the_city_in_one_query(self):
+        self.seed_venues(cities=1, venues_per_city=5)
+        start_time = (self.now + datetime.timedelta(days=1, hours=1)).isoformat()
+        count = self.count_queries('/venues/free?' + 'city=City 0&start_time=' + start_time)
+
+        self.assertEqual(count, 2)
+
+    def test_import_shows_rejects_overlapping_bookings(self):
+        self.seed_venues(cities=1)
+        with self.app.app_context():
+            db.session.add(Artist(name='Guns N Petals', city='San Francisco', state='CA'))
+            db.session.commit()
+            rejected = []
+            report = import_rows('shows', [
+                {'artist_id': 1, 'venue_id': 1, 'start_time': '2035-04-01 10:00:00', 'duration': 600},
+                {'artist_id': 2, 'venue_id': 1, 'start_time': '2035-04-01 11:00:00', 'duration': 60},
+            ], on_error=lambda line, row, errors: rejected.append((line, errors)))
+            self.assertEqual((report.inserted, report.rejected), (1, 1))
+            self.assertEqual(rejected, [(2, {'start_time': ['venue already booked at that time.']})])
+
+            # the next import checks against the committed shows
+            report = import_rows('shows', [
+                {'artist_id': 2, 'venue_id': 1, 'start_time': '2035-04-01 15:00:00', 'duration': 60},
+            ])
+            self.assertEqual(report.rejected, 1)
+            self.assertEqual(availability.booking_conflicts(1, 2, datetime.datetime(2035, 4, 1, 15),
+                                                            datetime.datetime(2035, 4, 1, 16)), ['venue'])
+
+    def test_booking_intervals_are_dropped_on_commit(self):
+        self.seed_venues(cities=1)
+        start_time = datetime.datetime(2035, 4, 1, 20)
+        end_time = start_time + datetime.timedelta(hours=2)
+        with self.app.app_context():
+            self.assertFalse(availability.venue_intervals.overlaps(1, start_time, end_time))
+            db.session.add(Shows(artist_id=1, venue_id=1, start_time=start_time, end_time=end_time))
+            db.session.flush()
+            # flushed but not committed: the loaded key is kept
+            self.assertIn(1, availability.venue_intervals._keys)
+            db.session.commit()
+            self.assertTrue(availability.venue_intervals.overlaps(1, start_time, end_time))
+
+    def test_booking_intervals_reload_shows_of_other_processes(self):
+        self.seed_venues(cities=1)
+        start_time = datetime.datetime(2035, 4, 1, 20)
+        end_time = start_time + datetime.timedelta(hours=2)
+        index = availability.venue_intervals
+        with self.app.app_context():
+            self.assertFalse(index.overlaps(1, start_time, end_time))
+            # a show the index is not told about, as booked by another worker
+            db.session.execute(Shows.__table__.insert().values(artist_id=1, venue_id=1, start_time=start_time,
+                                                               end_time=end_time))
+            db.session.commit()
+            self.assertFalse(index.overlaps(1, start_time, end_time))
+
+            self.addCleanup(setattr, index, 'ttl', index.ttl)
+            index.ttl = 0
+            self.assertTrue(index.overlaps(1, start_time, end_time))
+
+    def test_get_free_venues_invalid_time(self):
+        res = self.client().get('/venues/free', query_string={'city': 'City 0', 'start_time': 'tonight'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def seed_facets(self):
+        with self.app.app_context():
+            for name, city, state, genres, seeking in [
+                ('The Musical Hop', 'San Francisco', 'CA', ['Jazz', 'Reggae'], True),
+                ('The Dueling Pianos Bar', 'New York', 'NY', ['Classical', 'R&B'], False),
+                ('Park Square Live Music & Coffee', 'San Francisco', 'CA', ['Rock n Roll', 'Jazz'], False),
+            ]:
+                db.session.add(Venue(name=name, city=city, state=state, address='1015 Folsom Street',
+                                     genres=genres, seeking_talent=seeking))
+            db.session.commit()
+
+    def test_browse_venues_by_facets(self):
+        self.seed_facets()
+        res = self.client().get('/api/venues/browse?genre=Jazz&state=CA&seeking=true')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['venues'][0]['name'], 'The Musical Hop')
+        # each facet is counted under the filters of the other facets
+        self.assertEqual(data['facets']['seeking'], {'true': 1, 'false': 1})
+        self.assertEqual(data['facets']['state'], {'CA': 1})
+        self.assertEqual(data['facets']['genre'], {'Jazz': 1, 'Reggae': 1})
+        self.assertEqual(data['facets']['city'], {'San Francisco': 1})
+
+    def test_browse_index_follows_creates_edits_and_deletes(self):
+        self.seed_facets()
+        self.assertEqual(self.client().get('/api/venues/browse?city=New York').get_json()['total'], 1)
+
+        with self.app.app_context():
+            db.session.add(Venue(name='Blue Note', city='New York', state='NY', address='131 W 3rd St',
+                                 genres=['Jazz'], seeking_talent=True))
+            venue = db.session.query(Venue).get(1)
+            venue.city = 'New York'
+            venue.state = 'NY'
+            db.session.commit()
+            deletes.delete_venue(2)
+
+        data = self.client().get('/api/venues/browse?city=New York&genre=Jazz').get_json()
+        self.assertEqual([venue['name'] for venue in data['venues']], ['The Musical Hop', 'Blue Note'])
+        self.assertEqual(data['facets']['city'], {'New York': 2, 'San Francisco': 1})
+        self.assertEqual(data['facets']['state'], {'NY': 2})
+
+    def test_browse_city_windows_match_counting_each_venue(self):
+        self.seed_facets()
+        with self.app.app_context():
+            index = facets.indexes['venues']
+            index.load()
+            index.put(4, ['Jazz'], 'San Francisco', 'CA', True)
+            index.put(2, ['Jazz'], 'San Francisco', 'CA', True)
+            bits = index._match({'genre': ['Jazz']})
+
+            self.assertEqual(index._city_counts(bits), {'New York': 0, 'San Francisco': 4})
+            self.assertEqual(index._sparse_city_counts(bits), {'San Francisco': 4})
+
+    def test_browse_rolled_back_edit_is_not_indexed(self):
+        self.seed_facets()
+        self.client().get('/api/venues/browse')
+        with self.app.app_context():
+            db.session.query(Venue).get(1).state = 'NY'
+            db.session.flush()
+            db.session.rollback()
+
+        self.assertEqual(self.client().get('/api/venues/browse?state=NY').get_json()['total'], 1)
+
+    def test_browse_artists_without_city_or_state(self):
+        with self.app.app_context():
+            db.session.add(Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll']))
+            db.session.add(Artist(name='Matt Quevedo', genres=['Jazz']))
+            db.session.commit()
+        res = self.client().get('/api/artists/browse')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['facets']['city'], {'San Francisco': 1})
+        self.assertEqual(data['facets']['state'], {'CA': 1})
+        self.assertEqual(data['facets']['genre'], {'Jazz': 1, 'Rock n Roll': 1})
+
+    def test_browse_index_reloads_writes_of_other_processes(self):
+        self.seed_facets()
+        self.client().get('/api/venues/browse')
+        # a write the index is not told about, as from the CLI or another worker
+        with self.app.app_context():
+            db.session.execute(Venue.__table__.update().where(Venue.id == 1).values(state='NY'))
+            db.session.commit()
+
+        self.assertEqual(self.client().get('/api/venues/browse?state=NY').get_json()['total'], 1)
+        facets.indexes['venues']._loaded_at -= facets.indexes['venues'].ttl + 1
+        self.assertEqual(self.client().get('/api/venues/browse?state=NY').get_json()['total'], 2)
+
+    def test_browse_artists_pages(self):
+        self.seed_venues(cities=1)
+        res = self.client().get('/api/artists/browse?page=2')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((res.get_json()['total'], res.get_json()['artists']), (1, []))
+        self.assertEqual(self.client().get('/api/artists/browse?page=0').status_code, 400)
+
+    def test_delete_venue(self):
+        self.seed_venues(cities=1)
+        self.client().get('/artists/1')
+        res = self.client().delete('/venues/1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {'success': True, 'deleted': 1})
+        self.assertIn(b'1 Upcoming Show', self.client().get('/artists/1').data)
+        with self.app.app_context():
+            self.assertEqual(Shows.query.count(), 2)
+            self.assertIsNone(db.session.query(Venue).get(1))
+            self.assertIsNone(db.session.query(VenueShowStats).get(1))
+        self.assertEqual(self.show_stats(ArtistShowStats, 1)[:2], (1, 1))
+
+    def test_delete_artist_in_chunks(self):
+        self.seed_venues(cities=3)
+        with self.app.app_context():
+            venue_ids = deletes.delete_artist(1, chunk_size=4)
+            self.assertEqual((Shows.query.count(), Artist.query.count()), (0, 0))
+
+        self.assertEqual(venue_ids, {1, 2, 3, 4, 5, 6})
+        with self.app.app_context():
+            self.assertEqual(VenueShowStats.query.count(), 0)
+
+    def test_delete_venue_from_its_page(self):
+        self.seed_venues(cities=1)
+        res = self.client().post('/venues/2/delete')
+
+        self.assertEqual(res.status_code, 302)
+        self.assertNotIn(b'Venue 0 1', self.client().get('/venues').data)
+
+    def test_show_pages_render_formatted_start_times(self):
+        self.seed_venues(cities=1)
+        expected = format_datetime(self.now + datetime.timedelta(days=1), 'full').encode()
+
+        self.assertIn(expected, self.client().get('/venues/1').data)
+        self.assertIn(expected, self.client().get('/artists/1').data)
+        self.assertIn(expected, self.client().get('/shows').data)
+
+    def test_delete_venue_not_found(self):
+        res = self.client().delete('/venues/777777')
+
+        self.assertEqual(res.status_code, 404)
+
+    def venue_form(self, **values):
+        form = {'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom Street',
+                'genres': ['Jazz', 'Reggae'], 'seeking': 'Yes', 'seeking_description': 'no details provided',
+                'version': '1'}
+        form.update(values)
+        return form
+
+    def test_edit_venue_updates_only_changed_columns(self):
+        self.seed_facets()
+        self.assertIn(b'The Musical Hop', self.client().get('/venues/1').data)
+
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                res = self.client().post('/venues/1/edit', data=self.venue_form(name='The Musical Hop Club'))
+            updates = [statement for statement in counter.statements if statement.startswith('UPDATE')]
+            venue = db.session.query(Venue).get(1)
+            self.assertEqual((venue.name, venue.city, venue.version), ('The Musical Hop Club', 'San Francisco', 2))
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('name=', updates[0])
+        self.assertNotIn('city', updates[0])
+        # the cached venue page was dropped
+        self.assertIn(b'The Musical Hop Club', self.client().get('/venues/1').data)
+
+    def test_edit_venue_without_changes_writes_nothing(self):
+        self.seed_facets()
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                self.client().post('/venues/1/edit', data=self.venue_form(phone=''))
+            self.assertFalse([statement for statement in counter.statements if statement.startswith('UPDATE')])
+            self.assertEqual(db.session.query(Venue.version).filter(Venue.id == 1).scalar(), 1)
+
+    def test_edit_venue_from_a_stale_form_conflicts(self):
+        self.seed_facets()
+        self.client().post('/venues/1/edit', data=self.venue_form(name='First Edit'))
+        res = self.client().post('/venues/1/edit', data=self.venue_form(name='Second Edit'))
+
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(res.location.endswith('/venues/1/edit'))
+        with self.app.app_context():
+            self.assertEqual(db.session.query(Venue.name).filter(Venue.id == 1).scalar(), 'First Edit')
+        self.assertIn(b'value="2"', self.client().get('/venues/1/edit').data)
+
+    def test_edit_artist_updates_the_browse_index(self):
+        self.seed_venues(cities=1)
+        self.assertEqual(self.client().get('/api/artists/browse?state=NY').get_json()['total'], 0)
+
+        res = self.client().post('/artists/1/edit', data={
+            'name': 'The Wild Sax Band', 'city': 'New York', 'state': 'NY', 'genres': ['Jazz'], 'seeking': 'No',
+            'version': '1'})
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(self.client().get('/api/artists/browse?state=NY').get_json()['total'], 1)
+
+    def test_edit_venue_not_found(self):
+        self.assertEqual(self.client().post('/venues/777777/edit', data=self.venue_form()).status_code, 404)
+        self.assertEqual(self.client().post('/venues/1/edit', data=self.venue_form(version='')).status_code, 400)
+
+
+class FakeRedis(object):
+    """Local stand-in for the subset of the Redis client used by RedisBackend"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, px=None):
+        self.data[key] = (value, None if px is None else time.monotonic() + px / 1000.0)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match='*'):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+
+class PageCacheTestCase(unittest.TestCase):
+    """This class represents the page cache test case"""
+
+    def test_lru_backend_is_bounded(self):
+        cache = PageCache(LRUBackend(max_entries=2))
+        for number in range(3):
+            cache.get_or_set('venue:{}'.format(number), '', lambda: {'id': number})
+        cache.get_or_set('venue:2', '', lambda: None)
+
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['misses'], 3)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_lru_backend_counts_concurrent_lookups(self):
+        cache = PageCache(LRUBackend())
+        cache.get_or_set('venues', '', lambda: [1])
+
+        def lookups():
+            for number in range(2000):
+                cache.get_or_set('venues', '', lambda: [1])
+                cache.get_or_set('venue:{}'.format(number), '', lambda: None)
+        threads = [threading.Thread(target=lookups) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (8000, 8001))
+
+    def test_lru_backend_expires_entries(self):
+        cache = PageCache(LRUBackend(), ttl=0)
+        cache.get_or_set('venues', '', lambda: [1])
+        value = cache.get_or_set('venues', '', lambda: [2])
+
+        self.assertEqual(value, [2])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_invalidate_only_drops_its_namespace(self):
+        for backend in (LRUBackend(), RedisBackend(FakeRedis())):
+            cache = PageCache(backend)
+            cache.get_or_set('venue:3', '', lambda: {'id': 3})
+            cache.get_or_set('venue:30', '', lambda: {'id': 30})
+            cache.get_or_set('shows', 'cursor', lambda: ([], None))
+            cache.invalidate('venue:3', 'shows')
+
+            self.assertEqual(len(backend), 1)
+            self.assertEqual(cache.get_or_set('venue:30', '', lambda: None), {'id': 30})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
+
+
+class FormattingTestCase(unittest.TestCase):
+    """This class represents the date formatting test case"""
+
+    def setUp(self):
+        self.value = datetime.datetime(2035, 4, 1, 20, 30)
+
+    def test_format_datetime_matches_babel(self):
+        self.assertEqual(format_datetime(self.value, 'full'),
+                         babel.dates.format_datetime(self.value, "EEEE MMMM, d, y 'at' h:mma"))
+        self.assertEqual(format_datetime(self.value), babel.dates.format_datetime(self.value, "EE MM, dd, y h:mma"))
+
+    def test_format_datetime_accepts_strings(self):
+        self.assertEqual(format_datetime(str(self.value), 'full'), format_datetime(self.value, 'full'))
+
+    def test_format_show_times(self):
+        later = self.value + datetime.timedelta(days=1)
+        shows = format_show_times([{'start_time': self.value}, {'start_time': later}, {'start_time': self.value}])
+
+        self.assertEqual([show['start_time_formatted'] for show in shows],
+                         format_datetimes([self.value, later, self.value], 'full'))
+        self.assertEqual(shows[1]['start_time_formatted'], 'Monday April, 2, 2035 at 8:30PM')
+
+
+class IntervalIndexTestCase(unittest.TestCase):
+    """This class represents the in-memory interval index test case"""
+
+    def setUp(self):
+        self.index = IntervalIndex(Shows.venue_id, max_keys=3)
+        # loaded keys are used as they are, without a database
+        self.index._store(1, IntervalIndex.entry([(10, 15), (20, 30), (40, 50)]))
+
+    def test_overlaps(self):
+        self.assertTrue(self.index.overlaps(1, 12, 13))
+        self.assertTrue(self.index.overlaps(1, 16, 21))
+        self.assertTrue(self.index.overlaps(1, 5, 60))
+        self.assertFalse(self.index.overlaps(1, 15, 20))
+        self.assertFalse(self.index.overlaps(1, 30, 40))
+        self.assertFalse(self.index.overlaps(1, 50, 60))
+
+    def test_overlaps_overlapping_intervals(self):
+        # nothing keeps the intervals of a key apart on SQLite
+        self.index._store(2, IntervalIndex.entry([(10, 20), (11, 12)]))
+        self.assertTrue(self.index.overlaps(2, 15, 16))
+        self.assertTrue(self.index.overlaps(2, 19, 25))
+        self.assertFalse(self.index.overlaps(2, 20, 25))
+
+    def test_least_recently_used_keys_are_dropped(self):
+        for key in (2, 3):
+            self.index._store(key, IntervalIndex.entry([]))
+        self.assertTrue(self.index.overlaps(1, 12, 13))
+        self.index._store(4, IntervalIndex.entry([]))
+
+        self.assertEqual(list(self.index._keys), [3, 1, 4])
+
+    def test_expired_keys_are_reloaded(self):
+        self.index.ttl = 0
+        self.assertIsNone(self.index._cached(1))
+        self.assertNotIn(1, self.index._keys)
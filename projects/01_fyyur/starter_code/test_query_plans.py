@@ -0,0 +1,131 @@
+import os
+import re
+import unittest
+import datetime
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue, Artist, Shows
+from queries import encode_cursor
+from cache import page_cache
+
+# (method, url, form data, tables a route is allowed to read entirely): the
+# full listings, and the searches, which rank every match (ORDER BY their
+# rank) before the LIMIT, so SQLite walks the whole name index
+ROUTES = [
+    ('GET', '/venues', None, {'Venue'}),
+    ('GET', '/venues/1', None, set()),
+    ('GET', '/artists', None, {'Artist'}),
+    ('GET', '/artists/1', None, set()),
+    ('GET', '/shows', None, set()),
+    ('GET', '/shows?cursor=' + encode_cursor(datetime.datetime(2021, 1, 1), 1), None, set()),
+    ('POST', '/venues/search', {'search_term': 'Musical'}, {'Venue'}),
+    ('POST', '/artists/search', {'search_term': 'Band'}, {'Artist'}),
+]
+
+
+def sequential_scans(connection, dialect, statement, parameters):
+    """Returns the tables the database would read with a sequential scan"""
+    cursor = connection.cursor()
+    if dialect == 'postgresql':
+        # small test tables are always cheaper to scan, so only report the
+        # scans the planner cannot avoid
+        cursor.execute('SET enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plans = [cursor.fetchone()[0][0]['Plan']]
+        tables = set()
+        while plans:
+            plan = plans.pop()
+            if plan['Node Type'] == 'Seq Scan':
+                tables.add(plan['Relation Name'])
+            plans.extend(plan.get('Plans', []))
+        return tables
+
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    details = [row[3] for row in cursor.fetchall()]
+    # SQLite reports every full traversal as "SCAN <table>", optionally walking
+    # an index in its order, and "SEARCH" for seeks. An index walk is fine when
+    # a LIMIT stops it early, which it cannot when the rows are sorted in a
+    # temporary b-tree or first go through a co-routine or a window function:
+    # those read every row before the LIMIT applies. Automatic indexes are
+    # built by scanning the table. Scans of subqueries (SCAN anon_1) are not
+    # table reads
+    stops_early = ' LIMIT ' in statement and ' OVER (' not in statement and not any(
+        'TEMP B-TREE' in detail or detail.startswith('CO-ROUTINE') for detail in details)
+    tables = set()
+    for detail in details:
+        scan = re.match(r'SCAN (\w+)( USING (COVERING )?INDEX)?', detail)
+        if scan and scan.group(1) in db.metadata.tables and not (scan.group(2) and stops_early):
+            tables.add(scan.group(1))
+        automatic = re.match(r'SEARCH (\w+) USING AUTOMATIC', detail)
+        if automatic:
+            tables.add(automatic.group(1))
+    return tables
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """Fails when a route's queries need a sequential scan of a table"""
+
+    def setUp(self):
+        self.app = app
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('FYYUR_TEST_DATABASE_URL', 'sqlite://')
+        self.client = self.app.test_client
+        page_cache.clear()
+
+        with self.app.app_context():
+            db.create_all()
+            self.seed()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def seed(self):
+        start = datetime.datetime(2021, 1, 1)
+        artists = [Artist(name='The Wild Sax Band {}'.format(number), city='San Francisco', state='CA',
+                          genres=['Jazz']) for number in range(20)]
+        venues = [Venue(name='The Musical Hop {}'.format(number), city='City {}'.format(number % 5), state='CA',
+                        address='1015 Folsom Street', genres=['Jazz']) for number in range(20)]
+        db.session.add_all(artists + venues)
+        db.session.flush()
+        db.session.add_all([Shows(artist_id=artists[number % 20].id, venue_id=venues[number // 10].id,
+                                  start_time=start + datetime.timedelta(days=number))
+                            for number in range(200)])
+        db.session.commit()
+
+    def capture_statements(self, method, url, data):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            res = self.client().open(url, method=method, data=data)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(res.status_code, 200, url)
+        return statements
+
+    def test_routes_avoid_sequential_scans(self):
+        with self.app.app_context():
+            dialect = db.engine.dialect.name
+            for method, url, data, allowed in ROUTES:
+                statements = self.capture_statements(method, url, data)
+                self.assertTrue(statements, url)
+
+                connection = db.engine.raw_connection()
+                try:
+                    for statement, parameters in statements:
+                        scans = sequential_scans(connection, dialect, statement, parameters) - allowed
+                        self.assertFalse(scans, '{} {} scans {}:\n{}'.format(method, url, sorted(scans), statement))
+                finally:
+                    connection.close()
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+# ----------------------------------------------------------------------------#
+# Benchmark helpers.
+#
+# The benchmarks are run as modules from the backend directory, e.g.
+#   python -m benchmarks.quiz --database-url postgresql://localhost/trivia_bench
+# and default to a SQLite file next to this package when no URL is given.
+# ----------------------------------------------------------------------------#
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import time
+
+from flaskr import create_app
+from models import db, Category, Question
+from categories import category_cache
+from counts import question_counts
+from quiz import question_pool
+from search import search_index
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.db')
+CATEGORY_TYPES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+# synthetic words of the seeded questions, the word of rank r is used about
+# 1/r as often as the most common one (Zipf), like the words of real text
+SYLLABLES = [consonant + vowel for consonant in 'bdfgklmnprstvz' for vowel in 'aeiou']
+VOCABULARY_SIZE = 50000
+QUESTION_WORDS = 8
+ANSWER_WORDS = 2
+
+
+def argument_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--database-url', default=os.environ.get('TRIVIA_BENCH_DATABASE_URL', DEFAULT_DATABASE_URL),
+                        help='database to seed and query (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case')
+    return parser
+
+
+def setup_database(database_url):
+    # an app bound to the benchmark database, create_app creates the tables.
+    # the profiler would log most requests of a loaded database as slow
+    return create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SQLALCHEMY_ECHO': False,
+                       'SQL_PROFILER_ENABLED': False})
+
+
+def insert_in_batches(table, rows, batch_size=10000):
+    # multi-row inserts of an iterable of dicts, committing once per batch
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+
+
+def vocabulary(size=VOCABULARY_SIZE):
+    # `size` distinct words of two and three syllables, most common first
+    words = (''.join(syllables) for length in (2, 3) for syllables in itertools.product(SYLLABLES, repeat=length))
+    return list(itertools.islice(words, size))
+
+
+def seed_questions(questions, categories=len(CATEGORY_TYPES)):
+    # tops the database up to `categories` categories (the six of
+    # trivia.psql, then "Category n") and `questions` questions spread over
+    # them, a database with more is left as it is (delete bench.db to
+    # reseed). the texts are Zipf distributed words of vocabulary()
+    existing = Category.query.count()
+    if existing < categories:
+        insert_in_batches(Category.__table__, ({
+            'type': CATEGORY_TYPES[number] if number < len(CATEGORY_TYPES) else 'Category {}'.format(number + 1)
+        } for number in range(existing, categories)))
+    category_ids = [str(category_id) for category_id, in db.session.query(Category.id).order_by(Category.id)]
+    existing = Question.query.count()
+    if existing < questions:
+        words = vocabulary()
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+        generator = random.Random(2021 + existing)
+
+        def text(count):
+            return ' '.join(generator.choices(words, cum_weights=cum_weights, k=count))
+
+        insert_in_batches(Question.__table__, ({
+            'question': text(QUESTION_WORDS),
+            'answer': text(ANSWER_WORDS),
+            'category': category_ids[number % len(category_ids)],
+            'difficulty': number % 5 + 1,
+        } for number in range(existing, questions)))
+
+    # the inserts bypass the ORM events the caches follow
+    for cache in (category_cache, question_counts, question_pool, search_index):
+        cache.reset()
+
+
+def measure(function, repeat):
+    # runs function `repeat` times and returns the wall clock samples in ms
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        'min_ms': round(samples[0], 3),
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(_percentile(samples, 0.95), 3),
+        'p99_ms': round(_percentile(samples, 0.99), 3),
+        'max_ms': round(samples[-1], 3),
+    }
@@ -0,0 +1,170 @@
+# ----------------------------------------------------------------------------#
+# Load test.
+#
+# Seeds --questions questions over --categories categories, then sends
+# --requests requests to each endpoint from --concurrency client threads
+# through create_app() (the Flask test client, no server) and prints one
+# JSON document with the throughput and latency of each endpoint:
+#   questions            GET /questions?page=n
+#   category_questions   GET /categories/<id>/questions?page=n
+#   search               POST /questions/search, words and prefixes
+#   quizzes              POST /quizzes with a few previous questions
+# The caches (counts, quiz pool, search index) are loaded before the timed
+# requests, their load time is reported as warmup_seconds. A run saved with
+# --output can be passed as --baseline to a later run, which then adds the
+# change of each number against it:
+#   python -m benchmarks.loadtest --questions 100000 --output baseline.json
+#   python -m benchmarks.loadtest --questions 100000 --baseline baseline.json
+# ----------------------------------------------------------------------------#
+
+import datetime
+import json
+import math
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serialize
+from benchmarks import argument_parser, setup_database, seed_questions, summary, vocabulary, CATEGORY_TYPES
+from categories import category_cache
+from counts import question_counts
+from models import db
+from quiz import question_pool
+from search import search_index
+
+ENDPOINTS = ('questions', 'category_questions', 'search', 'quizzes')
+PER_PAGE = 10
+
+
+class Workload(object):
+    """Random requests of each endpoint over the seeded data"""
+
+    def __init__(self, seed=2021):
+        self.generator = random.Random(seed)
+        self.lock = threading.Lock()
+        self.words = vocabulary()
+        self.category_ids = sorted(category_cache.ids())
+        self.totals = {category_id: question_counts.total(category_id) for category_id in self.category_ids}
+        self.total = question_counts.total()
+
+    def _page(self, total):
+        return self.generator.randint(1, max(1, math.ceil(total / PER_PAGE)))
+
+    def _word(self):
+        # a word of rank 1 to 50000, most often a common one
+        return self.words[min(len(self.words) - 1, int(self.generator.paretovariate(0.6)) - 1)]
+
+    def request(self, endpoint):
+        # (method, url, json body) of a random request
+        with self.lock:
+            if endpoint == 'questions':
+                return 'GET', '/questions?page={}'.format(self._page(self.total)), None
+            if endpoint == 'category_questions':
+                category_id = self.generator.choice(self.category_ids)
+                return 'GET', '/categories/{}/questions?page={}'.format(
+                    category_id, self._page(self.totals[category_id])), None
+            if endpoint == 'search':
+                words = [self._word() for _ in range(self.generator.randint(1, 2))]
+                # search as you type: the last word is often cut short
+                if self.generator.random() < 0.5:
+                    words[-1] = words[-1][:self.generator.randint(2, len(words[-1]))]
+                return 'POST', '/questions/search', {'searchTerm': ' '.join(words)}
+            category_id = self.generator.choice([0] + self.category_ids)
+            previous_questions = [self.generator.randint(1, max(1, self.total)) for _ in range(4)]
+            return 'POST', '/quizzes', {'quiz_category': {'id': category_id},
+                                        'previous_questions': previous_questions}
+
+
+def run_endpoint(app, workload, endpoint, requests, concurrency):
+    # sends the requests from `concurrency` threads, each with its own test
+    # client, and returns the endpoint results
+    clients = threading.local()
+
+    def send(_):
+        client = getattr(clients, 'client', None)
+        if client is None:
+            client = clients.client = app.test_client()
+        method, url, body = workload.request(endpoint)
+        start = time.perf_counter()
+        res = client.open(url, method=method, json=body)
+        res.get_data()
+        return (time.perf_counter() - start) * 1000, res.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(send, range(requests)))
+    seconds = time.perf_counter() - start
+    samples = [elapsed for elapsed, _ in responses]
+    statuses = {}
+    for _, status in responses:
+        statuses[status] = statuses.get(status, 0) + 1
+    return dict(summary(samples),
+                requests=requests,
+                errors=sum(count for status, count in statuses.items() if status >= 400),
+                statuses={str(status): count for status, count in sorted(statuses.items())},
+                seconds=round(seconds, 3),
+                requests_per_sec=round(requests / seconds, 1))
+
+
+def compare(results, baseline):
+    # relative change of the throughput and the latencies against a
+    # previous run, e.g. -0.1 is 10% lower
+    changes = {}
+    for endpoint, result in results['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous:
+            continue
+        changes[endpoint] = {key: round(result[key] / previous[key] - 1, 3)
+                             for key in ('requests_per_sec', 'p50_ms', 'p95_ms', 'p99_ms') if previous.get(key)}
+    return changes
+
+
+def main():
+    parser = argument_parser('Load test the trivia API with concurrent clients.')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=len(CATEGORY_TYPES))
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--seed', type=int, default=2021, help='seed of the random requests')
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        seed_questions(args.questions, args.categories)
+        start = time.perf_counter()
+        workload = Workload(args.seed)
+        question_pool.load()
+        if db.engine.dialect.name != 'postgresql':
+            search_index.load()
+        warmup_seconds = time.perf_counter() - start
+
+        results = {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'dialect': db.engine.dialect.name,
+            'python': platform.python_version(),
+            'orjson': serialize.orjson is not None,
+            'questions': workload.total,
+            'categories': len(workload.category_ids),
+            'concurrency': args.concurrency,
+            'warmup_seconds': round(warmup_seconds, 3),
+            'endpoints': {endpoint: run_endpoint(app, workload, endpoint, args.requests, args.concurrency)
+                          for endpoint in args.endpoints},
+        }
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            results['change'] = compare(results, json.load(baseline))
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(document + '\n')
+    print(document)
+
+
+if __name__ == '__main__':
+    main()
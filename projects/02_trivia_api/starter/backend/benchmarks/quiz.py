@@ -0,0 +1,92 @@
+# ----------------------------------------------------------------------------#
+# Quiz benchmark.
+#
+# Seeds --questions questions and plays --quizzes quizzes at the same time:
+# every round, each quiz posts its next step to /quizzes with the questions
+# it already got, --concurrency requests in flight. Reports the step latency
+# and throughput of the in-memory question pool and, for comparison, of the
+# previous NOT IN query + random.choice over a few steps.
+#   python -m benchmarks.quiz --questions 1000000 --database-url postgresql://localhost/trivia_bench
+# ----------------------------------------------------------------------------#
+
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import argument_parser, setup_database, seed_questions, measure, summary
+from models import db, Question
+from quiz import question_pool
+
+# questions per quiz, as played by the frontend
+QUIZ_ROUNDS = 5
+
+
+def play_step(client, quiz):
+    start = time.perf_counter()
+    res = client.post('/quizzes', json={
+        'previous_questions': quiz['previous_questions'],
+        'quiz_category': {'id': quiz['category']}
+    })
+    elapsed = (time.perf_counter() - start) * 1000
+    question = res.get_json()['question']
+    if question is not None:
+        quiz['previous_questions'].append(question['id'])
+    return elapsed
+
+
+def not_in_step(category, previous_questions):
+    # the query /quizzes ran before the question pool
+    questions = Question.query.filter_by(category=category) \
+        .filter(Question.id.notin_(previous_questions)).all()
+    return random.choice(questions).format() if questions else None
+
+
+def main():
+    parser = argument_parser('Play many concurrent quizzes against /quizzes.')
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--quizzes', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32, help='requests in flight')
+    parser.add_argument('--baseline-steps', type=int, default=5, help='steps timed with the NOT IN query')
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        seed_questions(args.questions)
+        start = time.perf_counter()
+        question_pool.load()
+        total = len(question_pool.ids())
+        load_seconds = time.perf_counter() - start
+
+        generator = random.Random(2021)
+        quizzes = [{'category': generator.choice([0, 1, 2, 3, 4, 5, 6]), 'previous_questions': []}
+                   for _ in range(args.quizzes)]
+        client = app.test_client()
+        samples = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for _ in range(QUIZ_ROUNDS):
+                samples.extend(executor.map(lambda quiz: play_step(client, quiz), quizzes))
+        seconds = time.perf_counter() - start
+
+        previous_questions = [quiz['previous_questions'] for quiz in quizzes if quiz['category']][:1] or [[]]
+        baseline = summary(measure(lambda: not_in_step('1', previous_questions[0]), args.baseline_steps))
+
+        results = {
+            'dialect': db.engine.dialect.name,
+            'questions': total,
+            'pool_load_seconds': round(load_seconds, 3),
+            'quizzes': args.quizzes,
+            'steps': len(samples),
+            'steps_per_sec': round(len(samples) / seconds, 1),
+            'step': summary(samples),
+            'not_in_step': baseline,
+            'repeated_questions': sum(len(quiz['previous_questions']) - len(set(quiz['previous_questions']))
+                                      for quiz in quizzes),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
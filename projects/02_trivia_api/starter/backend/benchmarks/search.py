@@ -0,0 +1,69 @@
+# ----------------------------------------------------------------------------#
+# Search benchmark.
+#
+# Seeds --questions questions of Zipf distributed words (see seed_questions)
+# and times /questions/search for rare, mid and common words, several words
+# and short prefixes as typed in the search box, plus the load time of the
+# in-process index used on SQLite.
+#   python -m benchmarks.search --questions 1000000 --database-url postgresql://localhost/trivia_bench
+# ----------------------------------------------------------------------------#
+
+import json
+import time
+
+from benchmarks import argument_parser, setup_database, seed_questions, measure, summary, vocabulary
+from models import db, Question
+from search import search_index
+
+
+def search_cases():
+    # (name, search term, page), the rank of a word in vocabulary() is the
+    # rank of its frequency
+    words = vocabulary()
+    return [
+        ('rare word', words[20000], 1),
+        ('mid word', words[500], 1),
+        ('common word', words[0], 1),
+        ('common word, page 100', words[0], 100),
+        ('two common words', words[0] + ' ' + words[1], 1),
+        ('common and mid word', words[0] + ' ' + words[500], 1),
+        ('three words', ' '.join(words[:3]), 1),
+        ('prefix of 2 letters', words[500][:2], 1),
+        ('word and prefix of 3 letters', words[1] + ' ' + words[500][:3], 1),
+    ]
+
+
+def main():
+    parser = argument_parser('Time /questions/search over many questions.')
+    parser.add_argument('--questions', type=int, default=1000000)
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    with app.app_context():
+        seed_questions(args.questions)
+        total = Question.query.count()
+        dialect = db.engine.dialect.name
+        load_seconds = None
+        if dialect != 'postgresql':
+            start = time.perf_counter()
+            search_index.load()
+            load_seconds = round(time.perf_counter() - start, 3)
+
+        client = app.test_client()
+        cases = {}
+        for name, term, page in search_cases():
+            def search():
+                return client.post('/questions/search', json={'searchTerm': term, 'page': page}).get_json()
+            cases[name] = dict(summary(measure(search, args.repeat)), term=term, page=page,
+                               matches=search()['total_questions'])
+
+    print(json.dumps({
+        'dialect': dialect,
+        'questions': total,
+        'index_load_seconds': load_seconds,
+        'search': cases,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------#
+# Serialization benchmark.
+#
+# Encodes a response of --size questions (10k by default) three ways and
+# reports the time and the peak memory (tracemalloc) of each:
+#   orm          Question objects, [question.format() ...] and jsonify
+#   projection   the five columns as tuples, encoded with the json module
+#   orjson       the same tuples encoded with orjson, when it is installed
+#   python -m benchmarks.serialize --size 10000
+# ----------------------------------------------------------------------------#
+
+import json
+import tracemalloc
+
+from flask import jsonify
+
+import serialize
+from benchmarks import argument_parser, setup_database, seed_questions, measure, summary
+from models import db, Question
+
+
+def orm_response(size):
+    questions = Question.query.order_by(Question.id).limit(size).all()
+    return jsonify({'success': True, 'questions': [question.format() for question in questions]}).get_data()
+
+
+def projection_response(size):
+    rows = serialize.question_rows(Question.query).order_by(Question.id).limit(size).all()
+    return serialize.json_response({'success': True, 'questions': serialize.format_rows(rows)}).get_data()
+
+
+def peak_memory(function):
+    # peak bytes allocated by one call
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argument_parser('Time the encoding of a large question list.')
+    parser.add_argument('--size', type=int, default=10000, help='questions in the response')
+    args = parser.parse_args()
+
+    app = setup_database(args.database_url)
+    orjson = serialize.orjson
+    cases = [('orm', orm_response), ('projection', projection_response)]
+    if orjson is not None:
+        cases.append(('orjson', projection_response))
+
+    results = {}
+    with app.app_context(), app.test_request_context():
+        seed_questions(args.size)
+        for name, response in cases:
+            # the json module for the projection case, orjson for the last one
+            serialize.orjson = orjson if name == 'orjson' else None
+            function = lambda: response(args.size)
+            body = function()
+            db.session.remove()
+            results[name] = dict(summary(measure(function, args.repeat)),
+                                 peak_memory_mb=round(peak_memory(function) / 2 ** 20, 2),
+                                 response_kb=round(len(body) / 1024, 1))
+        serialize.orjson = orjson
+
+    print(json.dumps({
+        'dialect': db.engine.dialect.name,
+        'questions': args.size,
+        'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Category
+
+'''
+CategoryCache
+    the {id: type} catalog of categories of the category list, the question
+    pages and the category checks. it is loaded on first use, so create_app
+    and the CLI commands do not need the database, and dropped when this
+    process commits a category insert, update or delete. writes of
+    other processes are picked up when the catalog is reloaded, every `ttl`
+    seconds. the etag is a hash of the catalog, so every process serves the
+    same etag for the same categories
+'''
+
+
+class CategoryCache(object):
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._categories = None
+        self._ids = frozenset()
+        self._etag = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        categories = dict(db.session.query(Category.id, Category.type).order_by(Category.id).all())
+        etag = hashlib.sha1(json.dumps(sorted(categories.items())).encode()).hexdigest()
+        with self._lock:
+            self._categories = categories
+            self._ids = frozenset(categories)
+            self._etag = etag
+            self._loaded_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._categories = None
+
+    def _current(self):
+        if self._categories is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.load()
+
+    def all(self):
+        # {id: type}, shared by the requests: not to be modified
+        self._current()
+        return self._categories
+
+    def ids(self):
+        self._current()
+        return self._ids
+
+    def etag(self):
+        self._current()
+        return self._etag
+
+
+category_cache = CategoryCache()
+
+
+'''
+Cache invalidation
+    flagged per session by the mapper events and applied once the
+    transaction commits, a rollback drops the flag
+'''
+
+
+def _changed(mapper, connection, category):
+    object_session(category).info['category_cache_changed'] = True
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event, _changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    if session.info.pop('category_cache_changed', False):
+        category_cache.reset()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('category_cache_changed', None)
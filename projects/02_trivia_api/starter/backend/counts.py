@@ -0,0 +1,97 @@
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question
+
+'''
+QuestionCounts
+    number of questions per category, loaded with one GROUP BY and kept up to
+    date by the question inserts, deletes and category changes of this
+    process. writes of other processes are picked up when the counts are
+    reloaded, every `ttl` seconds
+'''
+
+
+class QuestionCounts(object):
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._counts = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = db.session.query(Question.category, db.func.count(Question.id)) \
+            .group_by(Question.category) \
+            .all()
+        with self._lock:
+            self._counts = {str(category): count for category, count in rows}
+            self._loaded_at = time.monotonic()
+
+    def reset(self):
+        # the counts are reloaded on their next use, e.g. after bulk writes
+        with self._lock:
+            self._counts = None
+
+    def _current(self):
+        if self._counts is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.load()
+        return self._counts
+
+    def total(self, category=None):
+        # questions of a category, or of all categories when category is None
+        counts = self._current()
+        if category is None:
+            return sum(counts.values())
+        return counts.get(str(category), 0)
+
+    def add(self, category, delta):
+        with self._lock:
+            if self._counts is not None:
+                key = str(category)
+                self._counts[key] = self._counts.get(key, 0) + delta
+
+
+question_counts = QuestionCounts()
+
+
+'''
+Count updates
+    queued per session by the mapper events and applied once the transaction
+    commits, a rollback drops them
+'''
+
+
+def _queue(question, *changes):
+    object_session(question).info.setdefault('question_count_changes', []).extend(changes)
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, question):
+    _queue(question, (question.category, 1))
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, question):
+    _queue(question, (question.category, -1))
+
+
+@event.listens_for(Question, 'after_update')
+def _question_updated(mapper, connection, question):
+    history = inspect(question).attrs.category.history
+    if history.deleted and history.added:
+        _queue(question, (history.deleted[0], -1), (history.added[0], 1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for category, delta in session.info.pop('question_count_changes', []):
+        question_counts.add(category, delta)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('question_count_changes', None)
@@ -2,19 +2,53 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category, db
+from models import setup_db, database_path, Question, Category, db
+from profiler import SQLProfiler
+from counts import question_counts
+from categories import category_cache
+from quiz import next_question
+from quiz_sessions import quiz_sessions
+from search import search_questions as find_questions, SEARCH_PER_PAGE
+from ingest import ingest_lines, import_questions_command, INGEST_CHUNK_SIZE
+from serialize import question_rows, format_rows, json_response
 
 QUESTIONS_PER_PAGE = 10
-CATEGORIES = [1, 2, 3, 4, 5, 6]
+
+
+def paginate_questions(query, page, total):
+    # one page of formatted questions ordered by id, read with LIMIT/OFFSET
+    # as column tuples so only the page is loaded, see serialize.py.
+    # returns None for a page past the last question, total comes from the
+    # cached counts so this is known before querying
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    if page < 1 or start >= total:
+        return None
+
+    rows = question_rows(query).order_by(Question.id).limit(QUESTIONS_PER_PAGE).offset(start).all()
+    if not rows:
+        # the cached count was ahead of the table (another process deleted)
+        return None
+    return format_rows(rows)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is None:
+        setup_db(app)
+    else:
+        # e.g. {'SQLALCHEMY_DATABASE_URI': 'sqlite:///bench.db'} for the
+        # benchmarks
+        app.config.update(test_config)
+        setup_db(app, test_config.get('SQLALCHEMY_DATABASE_URI', database_path))
+    # query count and database time of every request, see profiler.py
+    SQLProfiler(app)
+    # server-side quiz sessions, see quiz_sessions.py
+    quiz_sessions.init_app(app)
     CORS(app, resources={'/': {'origins': '*'}})
+    # flask import-questions FILE, see ingest.py
+    app.cli.add_command(import_questions_command)
 
     '''
       @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -38,12 +72,15 @@ def create_app(test_config=None):
     # endpoint to return all existing categories
     @app.route('/categories')
     def get_categories():
-        all_categories = Category.query.all()
-        categories = {category.id: category.type for category in all_categories}
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'categories': categories
+            'categories': category_cache.all()
         })
+        # clients revalidate with If-None-Match and get a 304 while the
+        # categories are unchanged
+        response.set_etag(category_cache.etag())
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
 
     '''
       @TODO: 
@@ -58,21 +95,17 @@ def create_app(test_config=None):
     def get_questions():
         # get page number
         page = request.args.get('page', 1, type=int)
-        questions = Question.query.all()
-        all_categories = Category.query.all()
-
-        formatted_questions = [question.format() for question in questions]
-        categories = {category.id: category.type for category in all_categories}
-
-        # set start and end to display 10 question per page
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
+        total_questions = question_counts.total()
+        questions = paginate_questions(Question.query, page, total_questions)
+        # a page without questions is not found, like in get_by_category
+        if questions is None:
+            abort(404)
 
-        return jsonify({
+        return json_response({
             'success': True,
-            'questions': formatted_questions[start:end],
-            'total_questions': len(questions),
-            'categories': categories,
+            'questions': questions,
+            'total_questions': total_questions,
+            'categories': category_cache.all(),
             'current_category': None
         })
 
@@ -138,6 +171,19 @@ def create_app(test_config=None):
             'success': True
         })
 
+    # endpoint to add many questions, the body is JSON Lines (one question
+    # object per line) and is read as a stream, see ingest.py
+    @app.route('/questions/bulk', methods=['POST'])
+    def add_questions_bulk():
+        chunk_size = request.args.get('chunk_size', INGEST_CHUNK_SIZE, type=int)
+        if chunk_size < 1:
+            abort(400)
+        report = ingest_lines(request.stream, chunk_size)
+        if not report.rows:
+            abort(400)
+
+        return jsonify(dict(report.format(), success=True))
+
     '''
     TEST: When you submit a question on the "Add" tab, 
     the form will clear and the question will appear at the end of the last page
@@ -157,21 +203,22 @@ def create_app(test_config=None):
         form = request.get_json()
         # get the search term
         search_term = form.get('searchTerm')
-        if search_term == '':
+        if not search_term:
             abort(400)
-        # query question based on the search term
-        match_questions = Question.query.filter(Question.question.ilike('%' + search_term + '%')).all()
-
-        if not match_questions:
-            abort(404)
-
-        questions = [question.format() for question in match_questions]
+        page = form.get('page', request.args.get('page', 1, type=int))
+        if not isinstance(page, int) or page < 1:
+            abort(400)
+        # question and answer words ranked by relevance, the last word of the
+        # term as a prefix so results follow typing, see search.py.
+        # no match is an empty page, not an error
+        questions, total_questions = find_questions(search_term, page, SEARCH_PER_PAGE)
 
-        return jsonify({
+        return json_response({
             'success': True,
             'questions': questions,
-            'total_questions': len(match_questions),
-            'current_category': None
+            'total_questions': total_questions,
+            'current_category': None,
+            'page': page
         })
 
     '''
@@ -196,23 +243,19 @@ def create_app(test_config=None):
         # get page number
         page = request.args.get('page', 1, type=int)
         # handle invalid category id
-        if category_id not in CATEGORIES:
+        if category_id not in category_cache.ids():
             abort(400)
 
-        questions = Question.query.filter_by(category=category_id).all()
-        # if no question returned based on the category, abort
-        if not questions:
+        total_questions = question_counts.total(category_id)
+        questions = paginate_questions(Question.query.filter_by(category=str(category_id)), page, total_questions)
+        # if no question returned based on the category and page, abort
+        if questions is None:
             abort(404)
 
-        formatted_questions = [question.format() for question in questions]
-        # set start and end to display 10 question per page
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-
-        return jsonify({
+        return json_response({
             'success': True,
-            'questions': formatted_questions[start:end],
-            'total_questions': len(questions),
+            'questions': questions,
+            'total_questions': total_questions,
             'current_category': category_id
         })
 
@@ -238,26 +281,52 @@ def create_app(test_config=None):
 
         previous_questions = data.get('previous_questions')
         quiz_category = data.get('quiz_category')
-        # query questions based on category, and not already returned
-        if quiz_category['id'] == 0:
-            questions = Question.query.filter(Question.id.notin_(previous_questions)).all()
-        else:
-            questions = Question.query.filter_by(category=quiz_category['id']) \
-                .filter(Question.id.notin_(previous_questions)).all()
-
-        # select one random question of the list of questions
-        if questions:
-            question = random.choice(questions)
-            question = question.format()
-        else:
-            question = None
-
-        print(question)
+        # pick a random question of the category that was not played yet
+        # from the in-memory id arrays, see quiz.py
+        category = None if quiz_category['id'] == 0 else quiz_category['id']
+        question = next_question(category, previous_questions)
+
+        return jsonify({
+            'success': True,
+            'question': question
+        })
+
+    # quiz sessions: the server keeps the question order and the position
+    # in it, so each step only sends the session id
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        data = request.get_json()
+        if not data or 'quiz_category' not in data:
+            abort(400)
+
+        quiz_category = data.get('quiz_category')
+        category = None if quiz_category['id'] == 0 else quiz_category['id']
+        session_id, total_questions = quiz_sessions.create(category, data.get('seed'))
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'total_questions': total_questions
+        }), 201
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_session_question(session_id):
+        found, question = quiz_sessions.next(session_id)
+        # unknown or expired session
+        if not found:
+            abort(404)
+
         return jsonify({
             'success': True,
             'question': question
         })
 
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def end_quiz_session(session_id):
+        quiz_sessions.end(session_id)
+        return jsonify({
+            'success': True
+        })
+
     '''
     @TODO: 
     Create error handlers for all expected errors 
@@ -0,0 +1,153 @@
+import json
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, Category
+from counts import question_counts
+from quiz import question_pool
+from search import search_index
+
+# rows inserted and committed together
+INGEST_CHUNK_SIZE = 1000
+# rejected rows listed in a report, the others are only counted
+MAX_REJECTED_LISTED = 100
+DIFFICULTIES = range(1, 6)
+
+'''
+Bulk ingestion
+    reads question banks as JSON Lines, one question object per line:
+        {"question": "...", "answer": "...", "category": 3, "difficulty": 2}
+    the lines are validated as they are read and the valid rows are inserted
+    `chunk_size` at a time, as one multi-row insert and one commit per
+    chunk, so memory stays bounded by a chunk whatever the size of the
+    input. the inserts bypass the ORM, so the question counts are updated
+    per chunk and the quiz pool and search index are reloaded on their next
+    use
+'''
+
+
+class IngestReport(object):
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.rows = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.rejected_rows = []
+
+    def reject(self, line, error):
+        self.rejected += 1
+        if len(self.rejected_rows) < MAX_REJECTED_LISTED:
+            self.rejected_rows.append({'line': line, 'error': error})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_sec(self):
+        return self.inserted / self.seconds if self.seconds else 0.0
+
+    def format(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+            'rejected_rows': self.rejected_rows,
+        }
+
+
+def validate(row, category_ids):
+    # (column values, None) for a valid question object, (None, error)
+    # otherwise. category ids are compared as strings, like the column
+    if not isinstance(row, dict):
+        return None, 'not a JSON object'
+    values = {}
+    for name in ('question', 'answer'):
+        value = row.get(name)
+        if not isinstance(value, str) or not value.strip():
+            return None, 'missing ' + name
+        values[name] = value
+    category = row.get('category')
+    if isinstance(category, bool) or not isinstance(category, (int, str)) or str(category) not in category_ids:
+        return None, 'unknown category {!r}'.format(category)
+    values['category'] = str(category)
+    difficulty = row.get('difficulty')
+    if isinstance(difficulty, bool) or difficulty not in DIFFICULTIES:
+        return None, 'difficulty must be 1 to 5'
+    values['difficulty'] = difficulty
+    return values, None
+
+
+def _insert(chunk, report):
+    # chunk: [(line number, values)]
+    try:
+        db.session.execute(Question.__table__.insert(), [values for _, values in chunk])
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        message = 'chunk not inserted: ' + str(getattr(error, 'orig', error)).splitlines()[0]
+        for line, _ in chunk:
+            report.reject(line, message)
+        return
+    report.inserted += len(chunk)
+    categories = {}
+    for _, values in chunk:
+        categories[values['category']] = categories.get(values['category'], 0) + 1
+    for category, count in categories.items():
+        question_counts.add(category, count)
+
+
+def ingest_lines(lines, chunk_size=INGEST_CHUNK_SIZE):
+    # inserts the questions of an iterable of JSON lines (str or bytes),
+    # returns the IngestReport
+    report = IngestReport()
+    category_ids = {str(category_id) for category_id, in db.session.query(Category.id)}
+    chunk = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        if not line.strip():
+            continue
+        report.rows += 1
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            report.reject(number, 'invalid JSON: {}'.format(error))
+            continue
+        values, error = validate(row, category_ids)
+        if error:
+            report.reject(number, error)
+            continue
+        chunk.append((number, values))
+        if len(chunk) >= chunk_size:
+            _insert(chunk, report)
+            chunk = []
+    if chunk:
+        _insert(chunk, report)
+
+    if report.inserted:
+        question_pool.reset()
+        search_index.reset()
+    return report.finish()
+
+
+@click.command('import-questions')
+@click.argument('source', type=click.File('rb'))
+@click.option('--chunk-size', default=INGEST_CHUNK_SIZE, show_default=True, help='rows per insert and commit')
+@with_appcontext
+def import_questions_command(source, chunk_size):
+    """Insert the questions of a JSON Lines file (- for stdin)."""
+    report = ingest_lines(source, chunk_size)
+    click.echo('{} rows: {} inserted, {} rejected in {:.1f}s ({:.0f} rows/s)'.format(
+        report.rows, report.inserted, report.rejected, report.seconds, report.rows_per_sec))
+    for rejected in report.rejected_rows:
+        click.echo('line {line}: {error}'.format(**rejected), err=True)
+    if report.rejected > len(report.rejected_rows):
+        click.echo('... {} more rejected rows'.format(report.rejected - len(report.rejected_rows)), err=True)
@@ -0,0 +1,10 @@
+-- Full-text search of the questions (PostgreSQL 12+), see search.py.
+-- A generated tsvector of the question (weight A) and the answer (weight B)
+-- with a GIN index, for databases restored from trivia.psql:
+--   psql trivia < migrations/001_question_search.sql
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector);
@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, Index, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -30,6 +30,10 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # category pages read (category, id) ranges with LIMIT/OFFSET
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
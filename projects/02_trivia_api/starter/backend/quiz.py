@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from array import array
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question
+
+# random draws before falling back to listing the eligible ids, a draw hits
+# an eligible id at least half of the time while less than half of the
+# category is excluded
+MAX_DRAWS = 16
+
+'''
+QuestionPool
+    the question ids of each category (and of all categories, key None) in
+    append-only arrays, so a random question is picked by drawing random
+    positions instead of loading the category. new questions are appended,
+    deleted ones are tombstoned and skipped by the draws until the arrays
+    are compacted. the arrays are loaded with one query of ids on first use
+    and reloaded every `ttl` seconds to pick up writes of other processes
+'''
+
+
+class QuestionPool(object):
+
+    def __init__(self, ttl=60, draws=MAX_DRAWS):
+        self.ttl = ttl
+        self.draws = draws
+        self._categories = None
+        self._loaded_at = 0
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(category):
+        return None if category is None else str(category)
+
+    def load(self):
+        # every array in one pass over the (id, category) pairs
+        categories = {None: array('q')}
+        result = db.session.execute(db.select([Question.id, Question.category]).order_by(Question.id))
+        for question_id, category in result:
+            categories[None].append(question_id)
+            key = self._key(category)
+            if key not in categories:
+                categories[key] = array('q')
+            categories[key].append(question_id)
+        with self._lock:
+            self._categories = categories
+            self._loaded_at = time.monotonic()
+            self._deleted.clear()
+        return categories
+
+    def ids(self, category=None):
+        categories = self._categories
+        if categories is None or time.monotonic() - self._loaded_at > self.ttl:
+            categories = self.load()
+        return categories.get(self._key(category), ())
+
+    def reset(self):
+        # the arrays are reloaded on their next use, e.g. after bulk writes
+        with self._lock:
+            self._categories = None
+            self._deleted.clear()
+
+    def add(self, question_id, category):
+        with self._lock:
+            if self._categories is None:
+                return
+            self._deleted.discard(question_id)
+            for key in (None, self._key(category)):
+                self._categories.setdefault(key, array('q')).append(question_id)
+
+    def remove(self, question_id):
+        # tombstones the id in every array. a reused id (SQLite) is revived by add
+        with self._lock:
+            if self._categories is None:
+                return
+            self._deleted.add(question_id)
+            # compacts the arrays once the tombstones make up half of them
+            if len(self._deleted) * 2 > len(self._categories[None]):
+                self._categories = None
+                self._deleted.clear()
+
+    def is_deleted(self, question_id):
+        return question_id in self._deleted
+
+    def pick(self, category=None, exclude=(), generator=random):
+        # a random id of the category that is not in exclude, None when every
+        # question was excluded. draws random positions and retries, the
+        # eligible ids are only listed when the draws keep missing
+        ids = self.ids(category)
+        exclude = set(exclude)
+        deleted = self._deleted
+        if not ids:
+            return None
+
+        for _ in range(self.draws):
+            question_id = ids[generator.randrange(len(ids))]
+            if question_id not in exclude and question_id not in deleted:
+                return question_id
+
+        eligible = [question_id for question_id in ids if question_id not in exclude and question_id not in deleted]
+        return generator.choice(eligible) if eligible else None
+
+
+question_pool = QuestionPool()
+
+
+def next_question(category=None, previous_questions=(), generator=random):
+    # the formatted next quiz question, or None when the category is played
+    # out. an id whose question is gone (deleted by another process) is
+    # tombstoned and another one is drawn
+    exclude = set(previous_questions)
+    while True:
+        question_id = question_pool.pick(category, exclude, generator)
+        if question_id is None:
+            return None
+        question = Question.query.get(question_id)
+        if question is not None:
+            return question.format()
+        question_pool.remove(question_id)
+        exclude.add(question_id)
+
+
+'''
+Pool updates
+    queued per session by the mapper events and applied once the transaction
+    commits, a rollback drops them
+'''
+
+
+def _queue(question, *changes):
+    object_session(question).info.setdefault('question_pool_changes', []).extend(changes)
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, question):
+    _queue(question, ('add', question.id, question.category))
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, question):
+    _queue(question, ('remove', question.id, question.category))
+
+
+@event.listens_for(Question, 'after_update')
+def _question_updated(mapper, connection, question):
+    # a question moved to another category is dropped from the arrays, which
+    # are reloaded on their next use
+    history = inspect(question).attrs.category.history
+    if history.deleted and history.added:
+        _queue(question, ('move', question.id, question.category))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for change, question_id, category in session.info.pop('question_pool_changes', []):
+        if change == 'add':
+            question_pool.add(question_id, category)
+        elif change == 'remove':
+            question_pool.remove(question_id)
+        else:
+            question_pool.reset()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('question_pool_changes', None)
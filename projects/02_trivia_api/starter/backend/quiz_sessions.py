@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from models import Question
+from quiz import question_pool
+
+'''
+Session stores
+    keep the state of each quiz session under its id for `ttl` seconds after
+    its last step. values are JSON strings, so the in-process store and a
+    Redis server hold the same data
+'''
+
+
+class MemoryStore(object):
+    """In-process store bounded by max_entries, evicting the least recently used"""
+
+    def __init__(self, ttl=3600, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisStore(object):
+    """Store on a Redis client, the keys expire `ttl` seconds after each step"""
+
+    def __init__(self, client, ttl=3600, key_prefix='trivia:quiz:'):
+        self.client = client
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        value = self.client.get(self.key_prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value):
+        self.client.set(self.key_prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + key)
+
+
+class LocalRedis(object):
+    """In-process stand-in for the part of the redis-py client RedisStore uses,
+    to run the Redis store without a server (development, tests)"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._values[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._values[key] = (value.encode(), time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._values.pop(key, None) is not None)
+
+
+def create_store(config):
+    # QUIZ_SESSION_BACKEND: 'memory', 'redis' (QUIZ_SESSION_REDIS_URL) or
+    # 'local-redis'
+    backend = config['QUIZ_SESSION_BACKEND']
+    ttl = config['QUIZ_SESSION_TTL']
+    if backend == 'memory':
+        return MemoryStore(ttl)
+    if backend == 'redis':
+        import redis
+        return RedisStore(redis.Redis.from_url(config['QUIZ_SESSION_REDIS_URL']), ttl)
+    if backend == 'local-redis':
+        return RedisStore(LocalRedis(), ttl)
+    raise ValueError('unknown QUIZ_SESSION_BACKEND: ' + backend)
+
+
+'''
+Quiz sessions
+    a session walks the id range of its category's questions in a seeded
+    order: step i of a range of n ids starting at `first` is the id
+    first + (a * i + b) mod n, a permutation since a is coprime with n. ids
+    are visited once each, so every question of the category in the range
+    comes up exactly once whatever happens to the question pool meanwhile,
+    and deleted or moved questions are skipped. the state is a few integers,
+    and a step reads the candidate ids it needs with one primary key query,
+    about n / questions of them for a category spread over the range
+'''
+
+# candidate ids read by a step's query, at most
+MAX_CANDIDATES = 512
+
+
+def _permutation(size, seed):
+    generator = random.Random(seed)
+    if size < 2:
+        return 1, 0
+    multiplier = generator.randrange(1, size)
+    while math.gcd(multiplier, size) != 1:
+        multiplier = generator.randrange(1, size)
+    return multiplier, generator.randrange(size)
+
+
+class QuizSessions(object):
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemoryStore()
+
+    def init_app(self, app):
+        app.config.setdefault('QUIZ_SESSION_BACKEND', os.environ.get('QUIZ_SESSION_BACKEND', 'memory'))
+        app.config.setdefault('QUIZ_SESSION_TTL', int(os.environ.get('QUIZ_SESSION_TTL', 3600)))
+        app.config.setdefault('QUIZ_SESSION_REDIS_URL',
+                              os.environ.get('QUIZ_SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+        self.store = create_store(app.config)
+
+    def create(self, category=None, seed=None):
+        # starts a session over the current questions of the category,
+        # returns (session id, number of questions)
+        if seed is None:
+            seed = secrets.randbits(64)
+        ids = question_pool.ids(category)
+        questions = sum(1 for question_id in ids if not question_pool.is_deleted(question_id))
+        first, span = (min(ids), max(ids) - min(ids) + 1) if ids else (0, 0)
+        multiplier, offset = _permutation(span, seed)
+        session_id = secrets.token_urlsafe(16)
+        self._save(session_id, {
+            'category': category,
+            'first': first,
+            'span': span,
+            'questions': questions,
+            'multiplier': multiplier,
+            'offset': offset,
+            'step': 0,
+        })
+        return session_id, questions
+
+    def _save(self, session_id, state):
+        self.store.set(session_id, json.dumps(state, separators=(',', ':')))
+
+    def get(self, session_id):
+        value = self.store.get(session_id)
+        return json.loads(value) if value is not None else None
+
+    @staticmethod
+    def _candidates(state, count):
+        # the ids of the next `count` steps, in order
+        return [state['first'] + (state['multiplier'] * step + state['offset']) % state['span']
+                for step in range(state['step'], min(state['step'] + count, state['span']))]
+
+    def next(self, session_id):
+        # (found, question): found is False for an unknown or expired session,
+        # question is None once the category is played out
+        state = self.get(session_id)
+        if state is None:
+            return False, None
+
+        # enough candidates for one question on average, twice over
+        count = min(MAX_CANDIDATES, 2 * -(-state['span'] // max(state['questions'], 1)))
+        question = None
+        while question is None and state['step'] < state['span']:
+            candidates = self._candidates(state, count)
+            query = Question.query.filter(Question.id.in_(candidates))
+            if state['category'] is not None:
+                query = query.filter(Question.category == str(state['category']))
+            questions = {question.id: question for question in query}
+            for question_id in candidates:
+                state['step'] += 1
+                question = questions.get(question_id)
+                if question is not None:
+                    break
+
+        self._save(session_id, state)
+        return True, question.format() if question is not None else None
+
+    def end(self, session_id):
+        self.store.delete(session_id)
+
+
+quiz_sessions = QuizSessions()
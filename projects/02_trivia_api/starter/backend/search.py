@@ -0,0 +1,399 @@
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from sqlalchemy import DDL, event, text
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Question
+from serialize import question_rows, format_rows
+
+SEARCH_PER_PAGE = 10
+# a prefix matching more words than this only looks at the most common ones
+MAX_PREFIX_WORDS = 64
+# a word of the question counts more than a word of the answer
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+# words of more questions than this are kept as bitmaps, see SearchIndex
+DENSE_POSTINGS = 4096
+# common prefixes up to this length also get a bitmap of all their words
+DENSE_PREFIX_LENGTH = 2
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(value):
+    return _WORD.findall((value or '').lower())
+
+
+'''
+PostgreSQL
+    questions.search_vector is a generated tsvector of the question (weight
+    A) and the answer (weight B) with a GIN index, created with the table
+    here and for existing databases by migrations/001_question_search.sql
+'''
+
+SEARCH_VECTOR_DDL = '''
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector);
+'''
+
+event.listen(Question.__table__, 'after_create', DDL(SEARCH_VECTOR_DDL).execute_if(dialect='postgresql'))
+
+
+def _ts_query(words):
+    # every word must match, the last one as a prefix for search as you type
+    return ' & '.join(words[:-1] + [words[-1] + ':*'])
+
+
+def _postgresql_search(words, page, per_page):
+    matches = "search_vector @@ to_tsquery('english', :query)"
+    params = {'query': _ts_query(words)}
+    total = db.session.execute(text('SELECT count(*) FROM questions WHERE ' + matches), params).scalar()
+    if not total:
+        return [], 0
+    ids = [row[0] for row in db.session.execute(text(
+        'SELECT id FROM questions WHERE ' + matches +
+        " ORDER BY ts_rank(search_vector, to_tsquery('english', :query)) DESC, id"
+        ' LIMIT :limit OFFSET :offset'), dict(params, limit=per_page, offset=(page - 1) * per_page))]
+    return ids, total
+
+
+'''
+SearchIndex
+    in-process inverted index for SQLite and the tests: every word maps to
+    the ids of the questions containing it, in the question and in the
+    answer. the ids of rare words are kept in arrays, the ones of common
+    words in bitmaps (python ints, bit i set for question i), which are
+    smaller for them and are intersected in C. the words are also kept
+    sorted, so the words of a prefix are found by bisecting. the short
+    prefixes of many questions, the ones typed first in the search box, get
+    a bitmap of all their words under the key '<prefix>*', other prefixes
+    match their MAX_PREFIX_WORDS most common words. deleted questions are
+    tombstoned until the index is reloaded. writes of this process are
+    applied as they commit, writes of other processes (import-questions,
+    other workers) are picked up when the index is reloaded, every `ttl`
+    seconds
+'''
+
+_bit_count = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+
+def _to_bits(arrays):
+    # bitmap of the ids of arrays in increasing order
+    buffer = bytearray((max(ids[-1] for ids in arrays) >> 3) + 1 if arrays else 0)
+    for ids in arrays:
+        for question_id in ids:
+            buffer[question_id >> 3] |= 1 << (question_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def _has(buffer, question_id):
+    index = question_id >> 3
+    return index < len(buffer) and buffer[index] >> (question_id & 7) & 1
+
+
+def _select(bits, start, count):
+    # ids of the set bits of rank start to start + count - 1
+    offset = 0
+    if start:
+        # the lowest position with `start` set bits below it
+        low, high = 0, bits.bit_length()
+        while low < high:
+            middle = (low + high) // 2
+            if _bit_count(bits & ((1 << middle) - 1)) < start:
+                low = middle + 1
+            else:
+                high = middle
+        bits >>= low
+        offset = low
+    ids = []
+    while bits and len(ids) < count:
+        lowest = bits & -bits
+        ids.append(offset + lowest.bit_length() - 1)
+        bits ^= lowest
+    return ids
+
+
+class SearchIndex(object):
+
+    def __init__(self, dense_postings=DENSE_POSTINGS, ttl=60):
+        self.dense_postings = dense_postings
+        self.ttl = ttl
+        self.loaded = False
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        question_words = {}
+        answer_words = {}
+        result = db.session.execute(db.select([Question.id, Question.question, Question.answer])
+                                    .order_by(Question.id))
+        for question_id, question, answer in result:
+            for postings, value in ((question_words, question), (answer_words, answer)):
+                for word in set(tokenize(value)):
+                    ids = postings.get(word)
+                    if ids is None:
+                        ids = postings[word] = array('q')
+                    ids.append(question_id)
+        with self._lock:
+            self.question_words = question_words
+            self.answer_words = answer_words
+            self.counts = {word: len(ids) for word, ids in question_words.items()}
+            for word, ids in answer_words.items():
+                self.counts[word] = self.counts.get(word, 0) + len(ids)
+            self.words = sorted(self.counts)
+            self.deleted = set()
+            self.deleted_bits = 0
+            self._make_dense()
+            self.loaded = True
+            self._loaded_at = time.monotonic()
+
+    def _is_dense(self, size, last_id):
+        # more than dense_postings questions, and an array larger than a
+        # bitmap (8 bytes per id against 1 bit per question)
+        return size > self.dense_postings and size * 64 > last_id
+
+    def _make_dense(self):
+        last_id = 0
+        for postings in (self.question_words, self.answer_words):
+            last_id = max([last_id] + [ids[-1] for ids in postings.values() if isinstance(ids, array) and ids])
+        for postings in (self.question_words, self.answer_words):
+            for word, ids in postings.items():
+                if isinstance(ids, array) and self._is_dense(len(ids), last_id):
+                    postings[word] = _to_bits([ids])
+
+        prefix_counts = {}
+        for word, count in self.counts.items():
+            for length in range(1, min(len(word), DENSE_PREFIX_LENGTH) + 1):
+                prefix_counts[word[:length]] = prefix_counts.get(word[:length], 0) + count
+        for prefix, count in prefix_counts.items():
+            if self._is_dense(count, last_id):
+                words = self._words_of(prefix)
+                self.question_words[prefix + '*'] = self._bits(words, self.question_words)
+                self.answer_words[prefix + '*'] = self._bits(words, self.answer_words)
+                self.counts[prefix + '*'] = count
+
+    @staticmethod
+    def _keys(word):
+        # the word and the keys of its prefix bitmaps
+        return [word] + [word[:length] + '*' for length in range(1, min(len(word), DENSE_PREFIX_LENGTH) + 1)]
+
+    @classmethod
+    def _add(cls, postings, question_id, value):
+        for word in set(tokenize(value)):
+            if word not in postings:
+                postings[word] = array('q')
+            for key in cls._keys(word):
+                ids = postings.get(key)
+                if isinstance(ids, int):
+                    postings[key] = ids | 1 << question_id
+                elif ids is not None:
+                    ids.append(question_id)
+
+    def reset(self):
+        with self._lock:
+            self.loaded = False
+
+    def add(self, question_id, question, answer):
+        with self._lock:
+            if not self.loaded:
+                return
+            self.deleted.discard(question_id)
+            self.deleted_bits &= ~(1 << question_id)
+            self._add(self.question_words, question_id, question)
+            self._add(self.answer_words, question_id, answer)
+            for word in set(tokenize(question)) | set(tokenize(answer)):
+                if word not in self.counts:
+                    insort(self.words, word)
+                for key in self._keys(word):
+                    if key == word or key in self.counts:
+                        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def remove(self, question_id):
+        with self._lock:
+            if self.loaded:
+                self.deleted.add(question_id)
+                self.deleted_bits |= 1 << question_id
+
+    def _words_of(self, prefix):
+        return self.words[bisect_left(self.words, prefix):bisect_left(self.words, prefix + '\uffff')]
+
+    def _prefix_words(self, prefix):
+        # the words (or the prefix bitmap) to search for a prefix
+        if prefix + '*' in self.counts:
+            return [prefix + '*']
+        words = self._words_of(prefix)
+        if len(words) > MAX_PREFIX_WORDS:
+            words = heapq.nlargest(MAX_PREFIX_WORDS, words, key=self.counts.get)
+        return words
+
+    def _size(self, words):
+        # postings of the words, deleted questions included
+        return sum(self.counts.get(word, 0) for word in words)
+
+    @staticmethod
+    def _bits(words, postings):
+        # bitmap of the questions with any of the words
+        bits = 0
+        arrays = []
+        for word in words:
+            ids = postings.get(word)
+            if isinstance(ids, int):
+                bits |= ids
+            elif ids:
+                arrays.append(ids)
+        return bits | _to_bits(arrays)
+
+    def _scores(self, words):
+        # {id: weight} of the questions matching one query word (or the words
+        # of a prefix), all of them kept in arrays
+        scores = {}
+        for postings, weight in ((self.answer_words, ANSWER_WEIGHT), (self.question_words, QUESTION_WEIGHT)):
+            for word in words:
+                for question_id in postings.get(word, ()):
+                    scores[question_id] = weight
+        return scores
+
+    def _search_rare(self, matches, page, per_page):
+        # the questions of the rarest word, filtered by bitmaps of the others
+        scores = {question_id: score for question_id, score in self._scores(matches[0]).items()
+                  if question_id not in self.deleted}
+        for match in matches[1:]:
+            if not scores:
+                break
+            question = _to_bytes(self._bits(match, self.question_words))
+            answer = _to_bytes(self._bits(match, self.answer_words))
+            filtered = {}
+            for question_id, score in scores.items():
+                if _has(question, question_id):
+                    filtered[question_id] = score + QUESTION_WEIGHT
+                elif _has(answer, question_id):
+                    filtered[question_id] = score + ANSWER_WEIGHT
+            scores = filtered
+
+        start = (page - 1) * per_page
+        ranked = heapq.nsmallest(start + per_page, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [question_id for question_id, _ in ranked[start:]], len(scores)
+
+    def _search_common(self, matches, page, per_page):
+        # every word is common: the matches are the AND of the bitmaps, and
+        # the questions are ranked by the number of words found in their
+        # question text (the same order as the weights), counted per bit by
+        # adding the bitmaps into bit planes
+        terms = [(self._bits(match, self.question_words), self._bits(match, self.answer_words))
+                 for match in matches]
+        matching = ~self.deleted_bits
+        for question, answer in terms:
+            matching &= question | answer
+        planes = []
+        for question, _ in terms:
+            carry = question & matching
+            for position, plane in enumerate(planes):
+                planes[position], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+
+        start = (page - 1) * per_page
+        ids = []
+        for found in range(len(terms), -1, -1):
+            if len(ids) == per_page:
+                break
+            if found >> len(planes):
+                continue
+            tier = matching
+            for position, plane in enumerate(planes):
+                tier = tier & plane if found >> position & 1 else tier & ~plane
+            size = _bit_count(tier)
+            if start >= size:
+                start -= size
+                continue
+            ids.extend(_select(tier, start, per_page - len(ids)))
+            start = 0
+        return ids, _bit_count(matching)
+
+    def search(self, words, page=1, per_page=SEARCH_PER_PAGE):
+        # (ids of the page, total) of the questions matching every word,
+        # ranked by the summed weights of the words, then by id
+        if not self.loaded or time.monotonic() - self._loaded_at > self.ttl:
+            self.load()
+        with self._lock:
+            matches = [[word] for word in words[:-1]] + [self._prefix_words(words[-1])]
+            # the rarest word first, the other words only filter its questions
+            matches.sort(key=self._size)
+            if self._size(matches[0]) <= self.dense_postings:
+                return self._search_rare(matches, page, per_page)
+            return self._search_common(matches, page, per_page)
+
+
+search_index = SearchIndex()
+
+
+def search_questions(term, page=1, per_page=SEARCH_PER_PAGE):
+    # (formatted questions of the page, total matches), best matches first
+    words = tokenize(term)
+    if not words or page < 1:
+        return [], 0
+
+    if db.engine.dialect.name == 'postgresql':
+        ids, total = _postgresql_search(words, page, per_page)
+    else:
+        ids, total = search_index.search(words, page, per_page)
+    if not ids:
+        return [], total
+
+    questions = {question['id']: question
+                 for question in format_rows(question_rows(Question.query.filter(Question.id.in_(ids))))}
+    return [questions[question_id] for question_id in ids if question_id in questions], total
+
+
+'''
+Index updates
+    queued per session by the mapper events and applied once the transaction
+    commits, a rollback drops them
+'''
+
+
+def _queue(question, change):
+    object_session(question).info.setdefault('search_index_changes', []).append(change)
+
+
+@event.listens_for(Question, 'after_insert')
+def _question_inserted(mapper, connection, question):
+    _queue(question, ('add', question.id, question.question, question.answer))
+
+
+@event.listens_for(Question, 'after_delete')
+def _question_deleted(mapper, connection, question):
+    _queue(question, ('remove', question.id, None, None))
+
+
+@event.listens_for(Question, 'after_update')
+def _question_updated(mapper, connection, question):
+    _queue(question, ('reset', question.id, None, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    for change, question_id, question, answer in session.info.pop('search_index_changes', []):
+        if change == 'add':
+            search_index.add(question_id, question, answer)
+        elif change == 'remove':
+            search_index.remove(question_id)
+        else:
+            search_index.reset()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('search_index_changes', None)
@@ -0,0 +1,48 @@
+import json
+
+from flask import current_app
+
+from models import Question
+
+# optional faster encoder (pip install orjson), the standard json module is
+# used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+Question lists
+    the list endpoints select the five columns of Question.format() as
+    tuples instead of loading Question objects, and build the same dicts
+    from them. responses are encoded in one pass, with orjson when it is
+    installed
+'''
+
+# the keys of Question.format(), in order
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = [getattr(Question, field) for field in QUESTION_FIELDS]
+
+
+def question_rows(query):
+    # the query selecting the (id, question, answer, category, difficulty)
+    # tuples of its questions
+    return query.with_entities(*QUESTION_COLUMNS)
+
+
+def format_rows(rows):
+    # Question.format() of each row of question_rows()
+    return [{'id': question_id, 'question': question, 'answer': answer, 'category': category,
+             'difficulty': difficulty} for question_id, question, answer, category, difficulty in rows]
+
+
+def dumps(payload):
+    # bytes of the JSON payload, dict keys may be ints (categories)
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200):
+    # jsonify for the list payloads, without its key sorting and indentation
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
@@ -1,10 +1,18 @@
 import os
+import time
+import random
 import unittest
 import json
+from array import array
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category
+from categories import category_cache
+from counts import question_counts
+from quiz import QuestionPool, question_pool
+from quiz_sessions import MemoryStore, RedisStore, LocalRedis, quiz_sessions
+from search import SearchIndex, search_index
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -17,6 +25,8 @@ class TriviaTestCase(unittest.TestCase):
         self.database_name = "trivia_test"
         self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
         setup_db(self.app, self.database_path)
+        # the catalog is loaded from the test database on first use
+        category_cache.reset()
 
         # binds the app to the current context
         with self.app.app_context():
@@ -42,6 +52,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_category_cache_follows_category_writes(self):
+        etag = self.client().get('/categories').headers['ETag']
+        category = Category(type='Music')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.id
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['categories'][str(category_id)], 'Music')
+        self.assertEqual(self.client().get(f'/categories/{category_id}/questions').status_code, 404)
+
+        db.session.delete(category)
+        db.session.commit()
+        self.assertEqual(self.client().get(f'/categories/{category_id}/questions').status_code, 400)
+
     def test_get_questions(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -50,6 +84,45 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['questions']))
 
+    def test_question_lists_keep_format_shape(self):
+        questions = Question.query.order_by(Question.id).limit(10).all()
+        data = json.loads(self.client().get('/questions').data)
+
+        self.assertEqual(data['questions'], [question.format() for question in questions])
+
+    def test_get_questions_page_not_found(self):
+        res = self.client().get('/questions?page=100000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_get_by_category_pages(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(data['questions']) <= 10)
+        self.assertEqual(data['total_questions'], Question.query.filter_by(category='1').count())
+        self.assertEqual(self.client().get('/categories/1/questions?page=100000').status_code, 404)
+
+    def test_total_questions_follow_inserts_and_deletes(self):
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        test_question = Question(question="what nanodegree is this?", answer="FSND", category=3, difficulty=3)
+        test_question.insert()
+        question_id = test_question.id
+        self.assertEqual(question_counts.total(), total + 1)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total + 1)
+
+        self.client().delete(f'/questions/{question_id}')
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total)
+
+    def test_server_timing_header(self):
+        res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers.getlist('Server-Timing')[0].startswith('db;dur='))
+
     def test_delete_question(self):
         test_question = Question(question="what nanodegree is this?", answer="FSND", category=3, difficulty=3)
         test_question.insert()
@@ -79,6 +152,47 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_add_questions_bulk(self):
+        total = question_counts.total()
+        lines = [
+            json.dumps({'question': 'bulk question one', 'answer': 'one', 'category': 1, 'difficulty': 1}),
+            '',
+            json.dumps({'question': 'bulk question two', 'answer': 'two', 'category': '2', 'difficulty': 5}),
+            json.dumps({'question': 'bulk question three', 'answer': 'three', 'category': 777, 'difficulty': 2}),
+            '{"question": ',
+            json.dumps({'question': 'bulk question four', 'answer': '', 'category': 1, 'difficulty': 2}),
+        ]
+        res = self.client().post('/questions/bulk?chunk_size=1', data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['rows'], data['inserted'], data['rejected']), (5, 2, 3))
+        self.assertEqual([row['line'] for row in data['rejected_rows']], [4, 5, 6])
+        self.assertEqual(question_counts.total(), total + 2)
+        inserted = Question.query.filter(Question.question.like('bulk question%'))
+        self.assertEqual(sorted(question.category for question in inserted), ['1', '2'])
+        inserted.delete(synchronize_session=False)
+        db.session.commit()
+        question_counts.reset()
+
+    def test_add_questions_bulk_empty(self):
+        res = self.client().post('/questions/bulk', data='', content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 400)
+
+    def test_import_questions_command(self):
+        lines = '\n'.join(json.dumps({'question': 'imported question %d' % number, 'answer': 'answer',
+                                      'category': 3, 'difficulty': 3}) for number in range(25))
+        result = self.app.test_cli_runner().invoke(args=['import-questions', '--chunk-size', '10', '-'],
+                                                   input=lines + '\n{}')
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('26 rows: 25 inserted, 1 rejected', result.output)
+        self.assertIn('line 26: missing question', result.output)
+        Question.query.filter(Question.question.like('imported question%')).delete(synchronize_session=False)
+        db.session.commit()
+        question_counts.reset()
+
     def test_search_questions(self):
 
         res = self.client().post('/questions/search', json={
@@ -89,6 +203,45 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_search_questions_no_match(self):
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'qwxzvbnm'
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((data['questions'], data['total_questions']), ([], 0))
+        self.assertEqual(self.client().post('/questions/search', json={'searchTerm': ''}).status_code, 400)
+
+    def test_search_follows_inserts_and_deletes(self):
+        test_question = Question(question="which city is zanzibarian spice from?", answer="Stone Town",
+                                 category=3, difficulty=3)
+        test_question.insert()
+        question_id = test_question.id
+        data = json.loads(self.client().post('/questions/search', json={'searchTerm': 'Zanzib'}).data)
+        self.assertEqual([question['id'] for question in data['questions']], [question_id])
+
+        self.client().delete(f'/questions/{question_id}')
+        data = json.loads(self.client().post('/questions/search', json={'searchTerm': 'Zanzib'}).data)
+        self.assertEqual(data['questions'], [])
+
+    def test_search_index_reloads_writes_of_other_processes(self):
+        with self.app.app_context():
+            search_index.search(['zanzib'])
+            # an insert the index is not told about, as from import-questions
+            # in another process
+            db.session.execute(Question.__table__.insert().values(
+                question='which city is zanzibarian spice from?', answer='Stone Town', category='3', difficulty=3))
+            db.session.commit()
+            question_id = Question.query.filter_by(answer='Stone Town').one().id
+            self.assertEqual(search_index.search(['zanzib']), ([], 0))
+
+            search_index._loaded_at -= search_index.ttl + 1
+            self.assertEqual(search_index.search(['zanzib']), ([question_id], 1))
+            Question.query.filter_by(id=question_id).delete()
+            db.session.commit()
+            search_index.reset()
+
     def test_get_categories_invalid(self):
         res = self.client().get('/categories/7/questions')
         data = json.loads(res.data)
@@ -97,6 +250,75 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 400)
         self.assertEqual(data['message'], 'bad request')
 
+    def test_get_quiz_questions(self):
+        previous_questions = [question.id for question in Question.query.filter_by(category='1')][1:]
+        res = self.client().post('/quizzes', json={
+            'previous_questions': previous_questions,
+            'quiz_category': {'type': 'Science', 'id': '1'}
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question']['category'], '1')
+        self.assertNotIn(data['question']['id'], previous_questions)
+
+    def test_quiz_session_plays_each_question_once(self):
+        res = self.client().post('/quizzes/sessions', json={'quiz_category': {'type': 'Science', 'id': '1'}})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['total_questions'], Question.query.filter_by(category='1').count())
+
+        played = []
+        for _ in range(data['total_questions'] + 1):
+            question = json.loads(self.client().post(f"/quizzes/sessions/{data['session_id']}/next").data)['question']
+            if question is None:
+                break
+            self.assertEqual(question['category'], '1')
+            played.append(question['id'])
+
+        self.assertEqual(sorted(played), sorted(question.id for question in Question.query.filter_by(category='1')))
+
+    def test_quiz_session_survives_pool_reloads(self):
+        data = json.loads(self.client().post('/quizzes/sessions', json={'quiz_category': {'id': '2'}}).data)
+        next_url = f"/quizzes/sessions/{data['session_id']}/next"
+        played = [json.loads(self.client().post(next_url).data)['question']['id'] for _ in range(2)]
+
+        # a question of the category deleted and the pool arrays reloaded
+        # between two steps
+        remaining = [question.id for question in Question.query.filter_by(category='2') if question.id not in played]
+        deleted = Question.query.get(remaining.pop())
+        values = (deleted.question, deleted.answer, deleted.category, deleted.difficulty)
+        deleted.delete()
+        question_pool.reset()
+        while True:
+            state = quiz_sessions.get(data['session_id'])
+            self.assertFalse([value for value in state.values() if isinstance(value, list)])
+            question = json.loads(self.client().post(next_url).data)['question']
+            if question is None:
+                break
+            played.append(question['id'])
+
+        self.assertEqual(len(played), len(set(played)))
+        self.assertEqual(sorted(played[2:]), sorted(remaining))
+        Question(*values).insert()
+        question_pool.reset()
+
+    def test_quiz_session_order_is_seeded(self):
+        orders = []
+        for _ in range(2):
+            data = json.loads(self.client().post('/quizzes/sessions', json={'quiz_category': {'id': 0}, 'seed': 7}).data)
+            orders.append([json.loads(self.client().post(f"/quizzes/sessions/{data['session_id']}/next").data)
+                           ['question']['id'] for _ in range(3)])
+        self.assertEqual(orders[0], orders[1])
+
+    def test_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_get_quiz_questions_invalid(self):
         res = self.client().post('/quizzes', json={
             'previous_questions': []
@@ -106,6 +328,97 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
 
 
+class QuestionPoolTestCase(unittest.TestCase):
+    """This class represents the quiz question pool test case"""
+
+    def setUp(self):
+        self.pool = QuestionPool(ttl=3600)
+        # loaded arrays are used as they are, without a database
+        self.pool._categories = {None: array('q', range(1, 101)), '1': array('q', range(1, 11))}
+        self.pool._loaded_at = time.monotonic()
+
+    def test_pick_skips_previous_questions(self):
+        generator = random.Random(7)
+        picked = [self.pool.pick('1', range(1, 10), generator) for _ in range(20)]
+        self.assertEqual(set(picked), {10})
+        self.assertIsNone(self.pool.pick('1', range(1, 11), generator))
+
+    def test_pick_follows_inserts_and_deletes(self):
+        self.pool.add(101, '1')
+        for question_id in range(1, 11):
+            self.pool.remove(question_id)
+
+        self.assertEqual(self.pool.pick('1'), 101)
+        self.assertNotIn(self.pool.pick(None, generator=random.Random(3)), range(1, 11))
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    """This class represents the in-process search index test case"""
+
+    def setUp(self):
+        self.index = self.create_index()
+
+    @staticmethod
+    def create_index(dense_postings=4096):
+        index = SearchIndex(dense_postings)
+        # a loaded index is used as it is, without a database
+        index.question_words, index.answer_words = {}, {}
+        index.counts, index.words, index.deleted, index.deleted_bits = {}, [], set(), 0
+        index.loaded = True
+        index._loaded_at = time.monotonic()
+        index.add(1, 'Who painted the Mona Lisa?', 'Leonardo da Vinci')
+        index.add(2, 'Which painter cut off his ear?', 'Vincent van Gogh')
+        index.add(3, 'Who discovered penicillin?', 'Alexander Fleming')
+        index.add(4, 'Name the painter of Guernica', 'Picasso, a Spanish painter')
+        index.add(5, 'Which Spanish city has the Prado?', 'Madrid')
+        return index
+
+    def test_question_words_rank_before_answer_words(self):
+        self.assertEqual(self.index.search(['spanish']), ([5, 4], 2))
+        self.assertEqual(self.index.search(['spanish', 'painter']), ([4], 1))
+        self.assertEqual(self.index.search(['vinc']), ([1, 2], 2))
+
+    def test_prefix_search_pages(self):
+        self.assertEqual(self.index.search(['who', 'p']), ([1, 3], 2))
+        self.assertEqual(self.index.search(['pa'], page=2, per_page=2), ([4], 3))
+
+    def test_search_follows_deletes(self):
+        self.index.remove(4)
+        self.assertEqual(self.index.search(['painter']), ([2], 1))
+        self.assertEqual(self.index.search(['spanish']), ([5], 1))
+
+    def test_bitmaps_rank_like_arrays(self):
+        dense = self.create_index(dense_postings=0)
+        dense._make_dense()
+        dense.remove(3)
+        self.index.remove(3)
+        for words in (['spanish'], ['spanish', 'painter'], ['vinc'], ['who', 'p'], ['which', 'the'], ['a']):
+            for page in (1, 2):
+                self.assertEqual(dense.search(words, page, 1), self.index.search(words, page, 1))
+
+
+class QuizSessionStoreTestCase(unittest.TestCase):
+    """This class represents the quiz session store test case"""
+
+    def test_memory_store_expires_entries(self):
+        store = MemoryStore(ttl=0)
+        store.set('game', '{}')
+        self.assertIsNone(store.get('game'))
+
+    def test_memory_store_is_bounded(self):
+        store = MemoryStore(max_entries=2)
+        for key in ('a', 'b', 'c'):
+            store.set(key, key)
+        self.assertEqual((store.get('a'), store.get('c'), len(store)), (None, 'c', 2))
+
+    def test_redis_store(self):
+        store = RedisStore(LocalRedis(), ttl=60)
+        store.set('game', '{"step":1}')
+        self.assertEqual(store.get('game'), '{"step":1}')
+        store.delete('game')
+        self.assertIsNone(store.get('game'))
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
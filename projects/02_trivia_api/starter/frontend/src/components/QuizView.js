@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        sessionId: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -36,7 +37,29 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type, id=0}) => {
-    this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+    // the server keeps the question order of the game, the next questions
+    // are requested with the session id only
+    $.ajax({
+      url: '/quizzes/sessions',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        quiz_category: {type, id}
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({quizCategory: {type, id}, sessionId: result.session_id}, this.getNextQuestion)
+        return;
+      },
+      error: (error) => {
+        alert('Unable to start the quiz. Please try your request again')
+        return;
+      }
+    })
   }
 
   handleChange = (event) => {
@@ -48,14 +71,9 @@ class QuizView extends Component {
     if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
 
     $.ajax({
-      url: '/quizzes', //TODO: update request URL
+      url: `/quizzes/sessions/${this.state.sessionId}/next`,
       type: "POST",
       dataType: 'json',
-      contentType: 'application/json',
-      data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
-      }),
       xhrFields: {
         withCredentials: true
       },
@@ -88,8 +106,12 @@ class QuizView extends Component {
   }
 
   restartGame = () => {
+    if(this.state.sessionId) {
+      $.ajax({url: `/quizzes/sessions/${this.state.sessionId}`, type: "DELETE"})
+    }
     this.setState({
       quizCategory: null,
+      sessionId: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,